@@ -2,6 +2,7 @@ import discord
 from discord import app_commands 
 from discord.ext import commands
 from database import database as db
+import logging
 from .shop_views import ShopView 
 
 class AdminCommands(commands.Cog):
@@ -34,8 +35,8 @@ class AdminCommands(commands.Cog):
         if not channel:
             return await interaction.followup.send(f"⚠️ Không tìm thấy kênh với ID `{channel_id}`.", ephemeral=True)
         
-        embed_color = discord.Color(int(str(guild_config.get('EMBED_COLOR', '#ff00af')).lstrip('#'), 16))
-        messages = guild_config.get('MESSAGES', {})
+        embed_color = guild_config.embed_color
+        messages = guild_config.messages
 
         embed = discord.Embed(
             title=messages.get('SHOP_EMBED_TITLE', "Shop Role"),
@@ -46,7 +47,7 @@ class AdminCommands(commands.Cog):
         if guild_config.get('SHOP_EMBED_THUMBNAIL_URL'):
             embed.set_thumbnail(url=guild_config.get('SHOP_EMBED_THUMBNAIL_URL'))
 
-        footer_text = guild_config.get('FOOTER_MESSAGES', {}).get('SHOP_PANEL', 'Mọi vấn đề xin hãy ping Rin')
+        footer_text = guild_config.footer_messages.get('SHOP_PANEL', 'Mọi vấn đề xin hãy ping Rin')
         embed.set_footer(
             text=f"────────────────────\n{footer_text}", 
             icon_url=self.bot.user.avatar.url
@@ -73,17 +74,24 @@ class AdminCommands(commands.Cog):
                 pass 
 
             leaderboard_thread = await panel_message.create_thread(name="🏆 Bảng Xếp Hạng Coin 🏆")
-            await leaderboard_thread.send("Bảng xếp hạng sẽ được cập nhật tại đây...")
+            placeholder = await leaderboard_thread.send("Bảng xếp hạng sẽ được cập nhật tại đây...")
             
-            # luu id vao db
-            db.update_guild_config(guild_id, updates={'leaderboard_thread_id': leaderboard_thread.id})
+            # luu id vao db, tin nhan tam se duoc edit thanh BXH
+            await db.update_guild_config(guild_id, updates={
+                'leaderboard_thread_id': leaderboard_thread.id,
+                'leaderboard_message_id': placeholder.id
+            })
             # reload config
             await self.bot.reload_guild_config(guild_id)
             
-            # restart task
+            # dang BXH ngay, khong doi toi slot cua guild trong vong update_leaderboard
             task_cog = self.bot.get_cog('CurrencyHandler')
-            if task_cog:
-                task_cog.update_leaderboard.restart()
+            guild_config = self.bot.guild_configs.get(str(guild_id))
+            if task_cog and guild_config:
+                try:
+                    await task_cog.publish_leaderboard(guild_id, guild_config)
+                except Exception as e:
+                    logging.error(f"Dang BXH lan dau cho guild {guild_id} that bai: {e}")
 
             await interaction.followup.send(f"✅ Đã gửi bảng điều khiển shop tới {channel.mention} và tạo thread BXH.", ephemeral=True)
         except discord.Forbidden:
@@ -101,6 +109,34 @@ class AdminCommands(commands.Cog):
         else:
             await interaction.followup.send("⚠️ Không thể tải lại cấu hình. Vui lòng kiểm tra lại database.", ephemeral=True)
 
+    @shop.command(name="db_stats", description="Xem số liệu cache và pool kết nối database của bot.")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def db_stats(self, interaction: discord.Interaction):
+        lines = []
+        stats = db.get_user_cache_stats()
+        if stats:
+            lines += [
+                f"**User cache:** `{stats['size']:,}/{stats['maxsize']:,}` row (TTL `{stats['ttl']}s`)",
+                f"> Hit: `{stats['hits']:,}` | Miss: `{stats['misses']:,}` | Tỷ lệ hit: `{stats['hit_rate']:.1%}`",
+                f"> Eviction: `{stats['evictions']:,}` | Hết hạn: `{stats['expirations']:,}`"
+            ]
+        pool_stats = db.get_pool_stats()
+        if pool_stats:
+            lines += [
+                f"**Pool kết nối:** `{pool_stats['in_use']}/{pool_stats['maxconn']}` đang dùng | Rảnh: `{pool_stats['idle']}` | Đang chờ: `{pool_stats['waiters']}`",
+                f"> Lượt lấy: `{pool_stats['checkouts']:,}` | Chờ TB: `{pool_stats['avg_wait_ms']:.1f}ms` | Chờ lâu nhất: `{pool_stats['max_wait_ms']:.0f}ms`",
+                f"> Timeout: `{pool_stats['timeouts']:,}` | Kết nối hỏng đã bỏ: `{pool_stats['discarded']:,}`"
+            ]
+        if not lines:
+            lines.append("ℹ️ Database backend hiện tại không có cache hay pool kết nối.")
+        catalog_stats = db.get_shop_catalog_stats()
+        lines.append(
+            f"**Catalog shop:** Hit: `{catalog_stats['hits']:,}` | Miss: `{catalog_stats['misses']:,}` | Làm mới: `{catalog_stats['invalidations']:,}`"
+        )
+        list_stats = self.bot.shop_list_cache.stats
+        lines.append(f"> Danh sách dựng sẵn: Hit: `{list_stats['hits']:,}` | Dựng mới: `{list_stats['builds']:,}`")
+        await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
     @shop.command(name="addrole", description="Thêm một role vào shop.")
     @app_commands.describe(role="Role cần thêm", price="Giá của role") 
     @app_commands.checks.has_permissions(administrator=True)
@@ -108,14 +144,14 @@ class AdminCommands(commands.Cog):
         if price < 0:
             return await interaction.response.send_message("⚠️ Giá tiền không thể là số âm.", ephemeral=True)
 
-        db.add_role_to_shop(role.id, interaction.guild.id, price)
+        await db.add_role_to_shop(role.id, interaction.guild.id, price)
         await interaction.response.send_message(f"✅ Đã thêm role {role.mention} vào shop với giá `{price}` coin.", ephemeral=True)
         
     @shop.command(name="removerole", description="Xóa một role khỏi shop.")
     @app_commands.describe(role="Role cần xóa")
     @app_commands.checks.has_permissions(administrator=True)
     async def remove_role(self, interaction: discord.Interaction, role: discord.Role):
-        db.remove_role_from_shop(role.id, interaction.guild.id)
+        await db.remove_role_from_shop(role.id, interaction.guild.id)
         await interaction.response.send_message(f"✅ Đã xóa role {role.mention} khỏi shop.", ephemeral=True)
 
     @coin.command(name="give", description="Tặng coin cho một thành viên.")
@@ -125,19 +161,13 @@ class AdminCommands(commands.Cog):
         if amount <= 0:
             return await interaction.response.send_message("⚠️ Lượng coin phải là số dương.", ephemeral=True)
         
-        user_data = db.get_or_create_user(member.id, interaction.guild.id)
-        new_balance = user_data['balance'] + amount
-        db.update_user_data(member.id, interaction.guild.id, balance=new_balance)
-        
-        # log gd
-        db.log_transaction(
-            guild_id=interaction.guild.id,
-            user_id=member.id,
+        new_balance = await db.credit(
+            member.id, interaction.guild.id, amount,
             transaction_type='admin_give',
-            item_name=f'Admin grant by {interaction.user.name}',
-            amount_changed=amount,
-            new_balance=new_balance
+            item_name=f'Admin grant by {interaction.user.name}'
         )
+        if new_balance is None:
+            return await interaction.response.send_message("⚠️ Không thể cập nhật số dư. Vui lòng thử lại.", ephemeral=True)
         
         await interaction.response.send_message(f"✅ Đã tặng `{amount}` coin cho {member.mention}. Số dư mới: `{new_balance}` coin.", ephemeral=True)
 
@@ -148,21 +178,13 @@ class AdminCommands(commands.Cog):
         if amount < 0:
             return await interaction.response.send_message("⚠️ Lượng coin không thể là số âm.", ephemeral=True)
 
-        user_data = db.get_or_create_user(member.id, interaction.guild.id)
-        old_balance = user_data['balance']
-        amount_changed = amount - old_balance
-        
-        db.update_user_data(member.id, interaction.guild.id, balance=amount)
-        
-        # log gd
-        db.log_transaction(
-            guild_id=interaction.guild.id,
-            user_id=member.id,
+        new_balance = await db.set_balance(
+            member.id, interaction.guild.id, amount,
             transaction_type='admin_set',
-            item_name=f'Admin set by {interaction.user.name}',
-            amount_changed=amount_changed,
-            new_balance=amount
+            item_name=f'Admin set by {interaction.user.name}'
         )
+        if new_balance is None:
+            return await interaction.response.send_message("⚠️ Không thể cập nhật số dư. Vui lòng thử lại.", ephemeral=True)
         
         await interaction.response.send_message(f"✅ Đã đặt số dư của {member.mention} thành `{amount}` coin.", ephemeral=True)
 
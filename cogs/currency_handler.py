@@ -1,73 +1,77 @@
 import discord
 from discord.ext import commands, tasks
 from database import database as db
+from database.activity_buffer import ActivityBuffer
+from guild_config import GuildConfig
+import asyncio
+import hashlib
+import json
 import logging
+import time
 from collections import Counter
 
+# tick cua vong BXH, moi guild chi duoc dung/edit 1 lan moi LEADERBOARD_INTERVAL_SECONDS
+LEADERBOARD_TICK_SECONDS = 5
+
 class CurrencyHandler(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.leaderboard_messages = {}
+        self.leaderboard_fingerprints = {} # message_id -> hash noi dung BXH da gui
+
+        # buffer ghi tre cho message/reaction, flush toi da moi ACTIVITY_FLUSH_SECONDS
+        # ACTIVITY_FLUSH_SECONDS <= 0 -> tat buffer, moi luot ghi ngay 1 statement
+        flush_seconds = self.bot.global_config.get('ACTIVITY_FLUSH_SECONDS', 10)
+        self.activity_buffer = None
+        if flush_seconds > 0:
+            self.activity_buffer = ActivityBuffer(
+                max_pending_users=self.bot.global_config.get('ACTIVITY_BUFFER_MAX_USERS', 5000)
+            )
+            self.flush_activity.change_interval(seconds=flush_seconds)
+
+        # boost duoc cap nhat ngay tu event member update/remove,
+        # quet ca guild chi con la luoi an toan moi BOOST_RECONCILE_MINUTES (bo sot event khi bot offline...)
+        self.sync_real_boosts.change_interval(minutes=self.bot.global_config.get('BOOST_RECONCILE_MINUTES', 360))
+
         self.update_leaderboard.start()
         self.check_custom_roles.start()
         self.sync_real_boosts.start()
+        if self.activity_buffer:
+            self.flush_activity.start()
 
-    def cog_unload(self):
+    async def cog_load(self):
+        # nap BXH moi guild 1 lan, sau do cap nhat theo tung lan ghi so du
+        for guild_id_str in self.bot.guild_configs.keys():
+            await db.load_leaderboard(int(guild_id_str))
+
+    async def cog_unload(self):
         self.update_leaderboard.cancel()
         self.check_custom_roles.cancel()
         self.sync_real_boosts.cancel()
+        # dung nhe nhang de lan flush dang chay ket thuc, roi flush not phan con lai
+        if self.activity_buffer:
+            self.flush_activity.stop()
+            await self.activity_buffer.flush()
 
-    def _get_boost_multiplier(self, member: discord.Member, guild_config: dict, user_data: dict) -> float:
-        """tinh toan he so nhan coin cho booster."""
-        booster_config = guild_config.get('BOOSTER_MULTIPLIER_CONFIG', {})
-        
-        # kiem tra xem tinh nang co bat khong
-        if not booster_config.get('ENABLED', False):
-            return 1.0
-
+    def _get_boost_multiplier(self, member: discord.Member, guild_config: GuildConfig, user_data: dict) -> float:
+        """he so nhan coin cho booster, tra tu bang tinh san trong GuildConfig."""
         # uu tien fake_boosts
         fake_boosts = user_data.get('fake_boosts', 0)
         real_boosts = user_data.get('real_boosts', 0)
         effective_boost_count = fake_boosts if fake_boosts > 0 else real_boosts
+        return guild_config.boost_multiplier(effective_boost_count)
 
-        if effective_boost_count <= 0:
-            return 1.0
-
-        base_multiplier = booster_config.get('BASE_MULTIPLIER', 1.0)
-        per_boost_addition = booster_config.get('PER_BOOST_ADDITION', 0.0)
-
-        # tinh toan he so
-        # boost dau tien se nhan base_multiplier
-        # moi boost them se cong them per_boost_addition
-        final_multiplier = base_multiplier + ((effective_boost_count - 1) * per_boost_addition)
-        
-        return max(1.0, final_multiplier) # dam bao khong bao gio < 1.0
-
-    def _get_activity_rate(self, channel: discord.TextChannel, guild_config: dict, activity_type: str) -> int:
+    def _get_activity_rate(self, channel: discord.TextChannel, guild_config: GuildConfig, activity_type: str) -> int:
         """
         Lay ty le kiem coin chinh xac cho mot hoat dong (tin nhan/reaction).
-        Uu tien: Channel > Category > Default.
+        Uu tien: Channel > Category > Default, bang da dich san theo id kenh.
         """
-        rates_config = guild_config.get('CURRENCY_RATES', {})
-        rate_key = 'MESSAGES_PER_COIN' if activity_type == 'message' else 'REACTIONS_PER_COIN'
-
-        # 1. Kiem tra channel-specific rate
-        channel_rates = rates_config.get('channels', {}).get(str(channel.id))
-        if channel_rates and channel_rates.get(rate_key):
-            return channel_rates[rate_key]
-
-        # 2. Kiem tra category-specific rate
-        if channel.category_id:
-            category_rates = rates_config.get('categories', {}).get(str(channel.category_id))
-            if category_rates and category_rates.get(rate_key):
-                return category_rates[rate_key]
-
-        # 3. Lay default rate
-        return rates_config.get('default', {}).get(rate_key)
+        return guild_config.activity_rate(channel.id, channel.category_id, activity_type)
 
     async def _process_activity(self, member: discord.Member, channel: discord.TextChannel, activity_type: str):
         """
         Xu ly logic tang coin tap trung cho tin nhan va reaction.
+        Nguong, he so booster va log gd duoc tinh phia server trong 1 statement,
+        ghi ngay hoac gom vao buffer tuy ACTIVITY_FLUSH_SECONDS.
         """
         guild_id = member.guild.id
         guild_config = self.bot.guild_configs.get(str(guild_id))
@@ -78,35 +82,13 @@ class CurrencyHandler(commands.Cog):
         if not rate or rate <= 0:
             return
 
-        user_data = db.get_or_create_user(member.id, guild_id)
-        
-        counter_key = 'message_count' if activity_type == 'message' else 'reaction_count'
-        new_count = user_data.get(counter_key, 0) + 1
+        booster_config = guild_config.booster_config
+        item_name = f'Earned from {channel.name}'
 
-        if new_count >= rate:
-            multiplier = self._get_boost_multiplier(member, guild_config, user_data)
-            coins_to_add = int(1 * multiplier) # co the mo rong sau
-            
-            new_balance = user_data['balance'] + coins_to_add
-            
-            db.update_user_data(
-                member.id, 
-                guild_id, 
-                balance=new_balance, 
-                **{counter_key: 0} # reset counter
-            )
-
-            # log gd
-            db.log_transaction(
-                guild_id=guild_id,
-                user_id=member.id,
-                transaction_type=f'earn_{activity_type}',
-                item_name=f'Earned from {channel.name}',
-                amount_changed=coins_to_add,
-                new_balance=new_balance
-            )
+        if self.activity_buffer:
+            self.activity_buffer.add(guild_id, member.id, activity_type, rate, item_name, booster_config)
         else:
-            db.update_user_data(member.id, guild_id, **{counter_key: new_count})
+            await db.earn_activity(member.id, guild_id, activity_type, rate, item_name, booster_config)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -138,11 +120,83 @@ class CurrencyHandler(commands.Cog):
         # xu ly
         await self._process_activity(payload.member, channel, 'reaction')
 
-    @tasks.loop(minutes=5)
+    async def _set_real_boosts(self, member: discord.Member, boost_count: int):
+        if member.bot or str(member.guild.id) not in self.bot.guild_configs:
+            return
+        if boost_count > 0:
+            await db.get_or_create_user(member.id, member.guild.id) # dam bao user ton tai
+        # user chua co trong db ma het boost -> UPDATE khong cham row nao
+        await db.update_user_data(member.id, member.guild.id, real_boosts=boost_count)
+        logging.info(f"Cap nhat boost cho {member.id} tai guild {member.guild.id}: {boost_count}")
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        # chi xu ly khi trang thai boost doi (bat dau / ngung boost)
+        if (before.premium_since is None) == (after.premium_since is None):
+            return
+        # discord chi cho biet co dang boost hay khong -> 1 boost, giong cach dem trong sync_real_boosts
+        await self._set_real_boosts(after, 1 if after.premium_since else 0)
+        if not after.premium_since and str(after.guild.id) in self.bot.guild_configs:
+            await self._check_custom_role(after)
+
+    def _refresh_shop_list_for(self, member: discord.Member):
+        # creator cua role trong shop vao/roi server -> dong "Nguoi tao" trong danh sach dung san doi
+        catalog = db.peek_shop_catalog(member.guild.id)
+        if catalog and member.id in catalog.creator_ids:
+            self.bot.shop_list_cache.invalidate(member.guild.id)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        self._refresh_shop_list_for(member)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        self._refresh_shop_list_for(member)
+        # roi server thi mat boost
+        if member.premium_since:
+            await self._set_real_boosts(member, 0)
+        if not self._min_custom_role_boosts(member.guild.id) or not member.guild.me.guild_permissions.manage_roles:
+            return
+        custom_role_data = await db.get_custom_role(member.id, member.guild.id)
+        if custom_role_data:
+            await self._revoke_custom_role(member.guild, member.id, custom_role_data['role_id'])
+
+    async def _prune_shop_roles(self, guild: discord.Guild):
+        # role da bi xoa tren discord (ke ca luc bot offline) thi go khoi shop
+        catalog = await db.get_shop_catalog(guild.id)
+        if not catalog:
+            return
+        for role_id in catalog.missing_roles(role.id for role in guild.roles):
+            await db.remove_role_from_shop(role_id, guild.id)
+            logging.info(f"Go role {role_id} khoi shop guild {guild.id} vi role khong con tren discord")
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        if str(role.guild.id) not in self.bot.guild_configs:
+            return
+        catalog = await db.get_shop_catalog(role.guild.id)
+        if catalog and role.id in catalog:
+            await db.remove_role_from_shop(role.id, role.guild.id)
+            logging.info(f"Go role {role.id} khoi shop guild {role.guild.id} vi role da bi xoa")
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        # chi ten/mau/icon anh huong toi phan hien thi shop; doi vi tri (rat thuong xuyen) thi bo qua
+        if (before.name, before.color, before.icon, before.unicode_emoji) == (after.name, after.color, after.icon, after.unicode_emoji):
+            return
+        catalog = db.peek_shop_catalog(after.guild.id)
+        if catalog and after.id in catalog:
+            db.invalidate_shop_catalog(after.guild.id)
+
+    @tasks.loop(seconds=10)
+    async def flush_activity(self):
+        await self.activity_buffer.flush()
+
+    @tasks.loop(minutes=360)
     async def sync_real_boosts(self):
         """
-        Dong bo so luong boost thuc te cua moi thanh vien vao database.
-        Logic duoc toi uu de xu ly va dam bao tinh toan chinh xac.
+        Doi chieu toan bo so luong boost thuc te cua moi thanh vien voi database.
+        Boost da duoc cap nhat tu event, vong nay chi sua nhung thay doi bi lo.
         """
         logging.info("Bat dau dong bo so luong boost thuc te...")
         for guild_id_str in self.bot.guild_configs.keys():
@@ -166,29 +220,12 @@ class CurrencyHandler(commands.Cog):
                 # B1: Lay so luong boost hien tai tu Discord API
                 current_api_boosts = Counter(member.id for member in guild.premium_subscribers)
 
-                # B2: Lay trang thai boost hien tai tu database
-                users_in_db_with_boosts = db.execute_query(
-                    "SELECT user_id, real_boosts FROM users WHERE guild_id = %s AND real_boosts > 0",
-                    (guild_id,),
-                    fetch='all'
-                )
-                current_db_boosts = {user['user_id']: user['real_boosts'] for user in users_in_db_with_boosts} if users_in_db_with_boosts else {}
-
-                updated_count = 0
-
-                # B3: Cap nhat nguoi dung dang boost
-                # (nguoi moi, hoac nguoi co thay doi so luong boost)
-                for user_id, api_count in current_api_boosts.items():
-                    db.get_or_create_user(user_id, guild_id) # dam bao user ton tai
-                    if current_db_boosts.get(user_id) != api_count:
-                        db.update_user_data(user_id, guild_id, real_boosts=api_count)
-                        updated_count += 1
-
-                # B4: Reset so boost cho nguoi dung da ngung boost
-                stopped_boosting_users = set(current_db_boosts.keys()) - set(current_api_boosts.keys())
-                for user_id in stopped_boosting_users:
-                    db.update_user_data(user_id, guild_id, real_boosts=0)
-                    updated_count += 1
+                # B2: Ghi ca guild 1 lan: upsert nguoi dang boost (moi / doi so luong)
+                # va reset nguoi da ngung boost, db tra ve nhung user thuc su thay doi
+                changed_user_ids = await db.sync_real_boosts(guild_id, dict(current_api_boosts))
+                if changed_user_ids is None:
+                    continue
+                updated_count = len(changed_user_ids)
                 
                 if updated_count > 0:
                     logging.info(f"Dong bo boost cho guild {guild.name} thanh cong. Da cap nhat {updated_count} thanh vien.")
@@ -202,77 +239,102 @@ class CurrencyHandler(commands.Cog):
     async def before_sync_real_boosts(self):
         await self.bot.wait_until_ready()
 
-    @tasks.loop(minutes=5)
+    def _min_custom_role_boosts(self, guild_id: int):
+        guild_config = self.bot.guild_configs.get(str(guild_id))
+        if not guild_config:
+            return None
+        return guild_config.min_custom_role_boosts
+
+    async def _revoke_custom_role(self, guild: discord.Guild, user_id: int, role_id: int, member: discord.Member = None):
+        """
+        Xoa role tuy chinh + du lieu trong db. member=None la nguoi dung da roi server (khong DM).
+        Xoa role that bai thi giu du lieu de lan check sau thu lai.
+        """
+        role_to_delete = guild.get_role(role_id)
+        if role_to_delete:
+            if member:
+                # thong bao qua hang doi DM, khong cho gui xong
+                dm_message = (
+                    f"Chào bạn, role tùy chỉnh **{role_to_delete.name}** của bạn tại server **{guild.name}** "
+                    f"đã được tự động gỡ bỏ vì bạn không còn đáp ứng đủ điều kiện boost server nữa.\n\n"
+                    f"Cảm ơn bạn đã từng ủng hộ server!"
+                )
+                await self.bot.dm_outbox.send(member, guild.id, content=dm_message)
+            try:
+                await self.bot.actions.delete_role(role_to_delete, reason="Khong con du dieu kien boost" if member else "Thanh vien roi server")
+            except discord.HTTPException as e:
+                logging.error(f"Khong the xoa role tuy chinh {role_id} cua user {user_id} tai guild {guild.id}: {e}")
+                return
+
+        await db.delete_custom_role_data(user_id, guild.id)
+        reason = "khong du boost" if member else "roi server"
+        logging.info(f"Da xoa role tuy chinh cua user {user_id} ({reason}) khoi guild {guild.id}")
+
+    async def _check_custom_role(self, member: discord.Member):
+        # goi ngay sau khi boost cua member doi, thay cho viec doi vong check_custom_roles
+        min_boosts = self._min_custom_role_boosts(member.guild.id)
+        if not min_boosts or not member.guild.me.guild_permissions.manage_roles:
+            return
+        custom_role_data = await db.get_custom_role(member.id, member.guild.id)
+        if not custom_role_data:
+            return
+        user_db_data = await db.get_or_create_user(member.id, member.guild.id)
+        fake_boosts = user_db_data.get('fake_boosts', 0)
+        effective_boost_count = fake_boosts if fake_boosts > 0 else user_db_data.get('real_boosts', 0)
+        if effective_boost_count < min_boosts:
+            await self._revoke_custom_role(member.guild, member.id, custom_role_data['role_id'], member)
+
+    @tasks.loop(minutes=30)
     async def check_custom_roles(self):
+        """
+        Kiem tra dinh ky: 1 query tra ve cac role tuy chinh ma chu so huu khong du boost / da roi server.
+        Phan lon da duoc xu ly tu event, vong nay chi bat nhung truong hop bi lo + sap xep lai role
+        + go khoi shop cac role khong con tren discord.
+        """
         for guild_id_str, guild_config in self.bot.guild_configs.items():
             try:
                 guild_id = int(guild_id_str)
-                custom_role_config = guild_config.get('CUSTOM_ROLE_CONFIG', {})
-                min_boosts = custom_role_config.get('MIN_BOOST_COUNT')
+                guild = self.bot.get_guild(guild_id)
+                if guild:
+                    await self._prune_shop_roles(guild)
+
+                min_boosts = self._min_custom_role_boosts(guild_id)
 
                 if not min_boosts:
                     continue
 
-                guild = self.bot.get_guild(guild_id)
                 if not guild or not guild.me.guild_permissions.manage_roles:
                     continue
-                
-                all_custom_roles = db.get_all_custom_roles_for_guild(guild_id)
-                if not all_custom_roles:
+
+                # cache thanh vien chua du thi khong biet ai da roi server -> bo qua luot nay
+                if not guild.chunked:
                     continue
-                
-                valid_booster_roles_to_position = []
 
-                for custom_role_data in all_custom_roles:
-                    user_id = custom_role_data['user_id']
-                    role_id = custom_role_data['role_id']
-                    
-                    member = guild.get_member(user_id)
-                    
-                    # TH: nguoi dung roi server
-                    if not member:
-                        role_to_delete = guild.get_role(role_id)
-                        if role_to_delete:
-                            await role_to_delete.delete(reason="Thanh vien roi server")
-                        db.delete_custom_role_data(user_id, guild_id)
-                        logging.info(f"Da xoa role tuy chinh cua user {user_id} (roi server) khoi guild {guild_id}")
-                        continue
-                    
-                    # TH: con o server, check dieu kien
-                    user_db_data = db.get_or_create_user(user_id, guild_id)
-                    
-                    # Uu tien so boost that da duoc dong bo
-                    real_boosts = user_db_data.get('real_boosts', 0)
-                    fake_boosts = user_db_data.get('fake_boosts', 0)
-                    
-                    effective_boost_count = fake_boosts if fake_boosts > 0 else real_boosts
+                ineligible = await db.get_ineligible_custom_roles(guild_id, min_boosts, [member.id for member in guild.members])
+                if ineligible is None:
+                    continue
 
-                    if effective_boost_count < min_boosts:
-                        role_to_delete = guild.get_role(role_id)
-                        
-                        if role_to_delete:
-                            try:
-                                dm_message = (
-                                    f"Chào bạn, role tùy chỉnh **{role_to_delete.name}** của bạn tại server **{guild.name}** "
-                                    f"đã được tự động gỡ bỏ vì bạn không còn đáp ứng đủ điều kiện boost server nữa.\n\n"
-                                    f"Cảm ơn bạn đã từng ủng hộ server!"
-                                )
-                                await member.send(dm_message)
-                            except discord.Forbidden:
-                                logging.warning(f"Khong the DM cho {member.name} ({member.id}) ve viec xoa role.")
-                            except Exception as e:
-                                logging.error(f"Loi DM cho {member.name} khi xoa role: {e}")
-                            
-                            await role_to_delete.delete(reason="Khong con du dieu kien boost")
-                        
-                        db.delete_custom_role_data(user_id, guild_id)
-                        logging.info(f"Da xoa role tuy chinh cua {member.name} (khong du boost) khoi guild {guild_id}")
-                        continue
-                    
-                    # Neu member van hop le, them role vao danh sach de sap xep
-                    role_obj = guild.get_role(role_id)
-                    if role_obj:
-                        valid_booster_roles_to_position.append(role_obj)
+                # xoa song song, scheduler gioi han so request cung luc cua guild
+                # 1 role loi khong duoc lam dung ca luot cua guild (con phai sap xep role ben duoi)
+                results = await asyncio.gather(*(
+                    self._revoke_custom_role(
+                        guild, row['user_id'], row['role_id'],
+                        None if row['left_guild'] else guild.get_member(row['user_id'])
+                    )
+                    for row in ineligible
+                ), return_exceptions=True)
+                for row, result in zip(ineligible, results):
+                    if isinstance(result, Exception):
+                        logging.error(f"Loi khi thu hoi role tuy chinh {row['role_id']} cua user {row['user_id']} tai guild {guild_id}: {result}")
+
+                all_custom_roles = await db.get_all_custom_roles_for_guild(guild_id)
+                if not all_custom_roles:
+                    continue
+
+                # role con lai deu hop le, them vao danh sach de sap xep
+                valid_booster_roles_to_position = [
+                    role_obj for role_obj in (guild.get_role(row['role_id']) for row in all_custom_roles) if role_obj
+                ]
 
                 # Sap xep lai toan bo role booster hop le trong 1 lan
                 if not valid_booster_roles_to_position:
@@ -297,7 +359,8 @@ class CurrencyHandler(commands.Cog):
 
                     # Chi goi API neu co thay doi can thiet
                     if has_changes:
-                        await guild.edit_role_positions(positions=positions_payload, reason="Dinh ky sap xep toan bo role booster")
+                        # cho ket qua de bat loi quyen / discord o duoi
+                        await self.bot.actions.edit_role_positions(guild, positions_payload, reason="Dinh ky sap xep toan bo role booster")
                         logging.info(f"Da sap xep lai {len(positions_payload)} role booster cho guild {guild.name}")
 
                 except discord.Forbidden:
@@ -313,88 +376,107 @@ class CurrencyHandler(commands.Cog):
     async def before_check_custom_roles(self):
         await self.bot.wait_until_ready()
 
-    @tasks.loop(minutes=1)
-    async def update_leaderboard(self):
-        if not self.bot.guild_configs:
-            return
-
-        for guild_id_str, guild_config in self.bot.guild_configs.items():
-            thread_id = guild_config.get('leaderboard_thread_id')
-            if not thread_id:
-                continue
+    def _render_leaderboard(self, guild: discord.Guild, guild_config: GuildConfig, top_users: list) -> discord.Embed:
+        embed = discord.Embed(
+            title="Bảng Xếp Hạng Đại Gia <:b_34:1343877618340204627>",
+            description="Top 20 thành viên có số dư coin cao nhất server.",
+            color=guild_config.embed_color
+        )
+
+        leaderboard_lines = []
+        for i, user_data in enumerate(top_users):
+            member = guild.get_member(user_data['user_id'])
+            display_name = member.mention if member else f"User đã rời server"
+            
+            emoji = "🔹"
+            if i == 0: emoji = "🥇"
+            elif i == 1: emoji = "🥈"
+            elif i == 2: emoji = "🥉"
+            
+            balance_formatted = f"{user_data['balance']:,}"
+            line = f"{emoji} **Hạng {i+1}:** {display_name}\n> **Số dư:** `{balance_formatted}` <a:coin:1406137409384480850>"
+            leaderboard_lines.append(line)
+        
+        embed.description = "\n\n".join(leaderboard_lines) if leaderboard_lines else "Chưa có ai trên bảng xếp hạng."
 
-            try:
-                guild_id = int(guild_id_str)
-                guild = self.bot.get_guild(guild_id)
-                thread = self.bot.get_channel(thread_id)
-                
-                if not guild or not thread:
-                    logging.warning(f"Thread BXH hoac guild {guild_id} khong tim thay.")
-                    continue
+        if guild.icon:
+            embed.set_thumbnail(url=guild.icon.url)
+        
+        if guild_config.get('EARNING_RATES_IMAGE_URL'):
+            embed.set_image(url=guild_config.get('EARNING_RATES_IMAGE_URL'))
 
-                top_users = db.get_top_users(guild.id, limit=20)
-                
-                if top_users is None:
-                    logging.error(f"Lay top users tu db that bai cho guild {guild.id}")
-                    continue
+        seconds = self._leaderboard_slots() * LEADERBOARD_TICK_SECONDS
+        every = f"{seconds // 60} phút" if seconds % 60 == 0 else f"{seconds} giây"
+        embed.set_footer(text=f"Cập nhật mỗi {every}", icon_url=self.bot.user.avatar.url)
+        return embed
 
-                embed_color = discord.Color(int(str(guild_config.get('EMBED_COLOR', '#ff00af')).lstrip('#'), 16))
-                embed = discord.Embed(
-                    title="Bảng Xếp Hạng Đại Gia <:b_34:1343877618340204627>",
-                    description="Top 20 thành viên có số dư coin cao nhất server.",
-                    color=embed_color,
-                    timestamp=discord.utils.utcnow()
-                )
+    async def _save_leaderboard_message(self, guild_id: int, message_id: int):
+        # luu id tin nhan BXH de restart khong phai do lai lich su thread
+        version = await db.update_guild_config(guild_id, updates={'leaderboard_message_id': message_id})
+        guild_config = self.bot.guild_configs.get(str(guild_id))
+        if guild_config is not None:
+            self.bot.guild_configs[str(guild_id)] = guild_config.updated({'leaderboard_message_id': message_id})
+            # ghi ngay sau version dang giu -> ban trong bo nho da moi nhat, notify cua chinh lan ghi nay khong can reload
+            if version is not None and version == self.bot.guild_config_versions.get(guild_id, 0) + 1:
+                self.bot.guild_config_versions[guild_id] = version
 
-                leaderboard_lines = []
-                for i, user_data in enumerate(top_users):
-                    member = guild.get_member(user_data['user_id'])
-                    display_name = member.mention if member else f"User đã rời server"
-                    
-                    emoji = "🔹"
-                    if i == 0: emoji = "🥇"
-                    elif i == 1: emoji = "🥈"
-                    elif i == 2: emoji = "🥉"
-                    
-                    balance_formatted = f"{user_data['balance']:,}"
-                    line = f"{emoji} **Hạng {i+1}:** {display_name}\n> **Số dư:** `{balance_formatted}` <a:coin:1406137409384480850>"
-                    leaderboard_lines.append(line)
-                
-                embed.description = "\n\n".join(leaderboard_lines) if leaderboard_lines else "Chưa có ai trên bảng xếp hạng."
+    async def publish_leaderboard(self, guild_id: int, guild_config: GuildConfig):
+        """
+        Dung embed BXH va chi edit khi noi dung (tru timestamp) khac lan gui truoc.
+        Tin nhan BXH lay theo leaderboard_message_id trong config, mat thi gui tin moi.
+        """
+        thread_id = guild_config.get('leaderboard_thread_id')
+        guild = self.bot.get_guild(guild_id)
+        thread = self.bot.get_channel(thread_id)
+        
+        if not guild or not thread:
+            logging.warning(f"Thread BXH hoac guild {guild_id} khong tim thay.")
+            return
 
-                if guild.icon:
-                    embed.set_thumbnail(url=guild.icon.url)
-                
-                if guild_config.get('EARNING_RATES_IMAGE_URL'):
-                    embed.set_image(url=guild_config.get('EARNING_RATES_IMAGE_URL'))
+        top_users = await db.get_top_users(guild.id, limit=20)
+        
+        if top_users is None:
+            logging.error(f"Lay top users tu db that bai cho guild {guild.id}")
+            return
 
-                embed.set_footer(text="Cập nhật mỗi 1 phút", icon_url=self.bot.user.avatar.url)
-                
-                message = self.leaderboard_messages.get(thread_id)
-                if message:
-                    await message.edit(content=None, embed=embed)
-                else:
-                    found = False
-                    async for msg in thread.history(limit=5):
-                        if msg.author.id == self.bot.user.id:
-                            self.leaderboard_messages[thread_id] = msg
-                            await msg.edit(content=None, embed=embed)
-                            found = True
-                            break
-                    if not found:
-                        self.leaderboard_messages[thread_id] = await thread.send(embed=embed)
+        embed = self._render_leaderboard(guild, guild_config, top_users)
+        fingerprint = hashlib.sha1(json.dumps(embed.to_dict(), sort_keys=True).encode()).hexdigest()
+        embed.timestamp = discord.utils.utcnow()
 
+        message_id = guild_config.get('leaderboard_message_id')
+        if message_id:
+            if self.leaderboard_fingerprints.get(message_id) == fingerprint:
+                return
+            try:
+                await thread.get_partial_message(message_id).edit(content=None, embed=embed)
+                self.leaderboard_fingerprints[message_id] = fingerprint
+                return
             except discord.NotFound:
-                try:
-                    # Neu khong tim thay tin nhan, tao tin moi
-                    thread = self.bot.get_channel(thread_id)
-                    if thread:
-                         self.leaderboard_messages[thread_id] = await thread.send(embed=embed)
-                except Exception as e:
-                    logging.error(f"Gui tin nhan BXH moi that bai: {e}")
+                # tin nhan bi xoa -> gui tin moi ben duoi
+                self.leaderboard_fingerprints.pop(message_id, None)
+
+        message = await thread.send(embed=embed)
+        self.leaderboard_fingerprints[message.id] = fingerprint
+        await self._save_leaderboard_message(guild_id, message.id)
+
+    def _leaderboard_slots(self) -> int:
+        # chu ky that cua 1 guild = so slot * tick (LEADERBOARD_INTERVAL_SECONDS lam tron xuong theo tick)
+        interval = self.bot.global_config.get('LEADERBOARD_INTERVAL_SECONDS', 60)
+        return max(1, interval // LEADERBOARD_TICK_SECONDS)
+
+    @tasks.loop(seconds=LEADERBOARD_TICK_SECONDS)
+    async def update_leaderboard(self):
+        # rai cac guild deu tren LEADERBOARD_INTERVAL_SECONDS: moi tick chi xu ly guild co slot trung tick hien tai
+        slots = self._leaderboard_slots()
+        current_slot = int(time.time() // LEADERBOARD_TICK_SECONDS) % slots
+
+        for guild_id_str, guild_config in list(self.bot.guild_configs.items()):
+            if not guild_config.get('leaderboard_thread_id') or int(guild_id_str) % slots != current_slot:
+                continue
+            try:
+                await self.publish_leaderboard(int(guild_id_str), guild_config)
             except Exception as e:
                 logging.error(f"Loi cap nhat BXH cho guild {guild_id_str}: {e}")
-                self.leaderboard_messages.pop(thread_id, None)
 
     @update_leaderboard.before_loop
     async def before_update_leaderboard(self):
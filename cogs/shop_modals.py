@@ -195,7 +195,7 @@ class RoleCreationProcessView(View):
         self.creation_price = creation_price
         self.is_booster = is_booster
         self.role_to_edit = role_to_edit
-        self.embed_color = discord.Color(int(str(guild_config.get('EMBED_COLOR', '#ff00af')).lstrip('#'), 16))
+        self.embed_color = guild_config.embed_color
         self.add_item(IconActionSelect())
 
     async def _finalize_role_creation(self, interaction: discord.Interaction, icon=None, icon_id=None, thread: discord.Thread = None):
@@ -236,6 +236,34 @@ class RoleCreationProcessView(View):
 
         new_color = discord.Color(self.color_int)
 
+        # tru tien truoc (atomic) de khong the tieu 2 lan, loi Discord thi hoan lai o except
+        if self.role_to_edit:
+            charge = self.guild_config.get('CUSTOM_ROLE_CONFIG', {}).get('EDIT_PRICE', 0)
+            charge_type = 'edit_custom_role'
+        else:
+            charge = self.creation_price
+            charge_type = 'create_custom_role'
+
+        if charge > 0:
+            try:
+                new_balance = await db.try_debit(interaction.user.id, guild.id, charge, charge_type, self.role_name)
+                msg_content = f"❌ Bạn không đủ coin! Cần **{charge:,} coin** để thực hiện thao tác này."
+            except db.DatabaseError:
+                new_balance = None
+                msg_content = "⚠️ Không thể kết nối database, chưa trừ coin của bạn. Vui lòng thử lại sau."
+            if new_balance is None:
+                if thread:
+                    await thread.send(msg_content)
+                    await thread.edit(archived=True, locked=True)
+                else: await interaction.edit_original_response(content=msg_content, view=None)
+                return
+        else:
+            user_data = await db.get_or_create_user(interaction.user.id, guild.id)
+            new_balance = user_data['balance'] if user_data else 0
+
+        # chi cac buoc tao/sua/gan role + ghi db moi hoan tac khi loi;
+        # loi gui thong bao sau do (thread, interaction het han...) khong duoc xoa role / hoan tien
+        fee_message = ""
         try:
             # TH sua role
             if self.role_to_edit:
@@ -249,43 +277,48 @@ class RoleCreationProcessView(View):
                     except Exception as e:
                         logging.warning(f"Failed to move role position on edit: {e}")
                 
-                edit_price = self.guild_config.get('CUSTOM_ROLE_CONFIG', {}).get('EDIT_PRICE', 0)
-                fee_message = ""
-                if edit_price > 0:
-                    user_data = db.get_or_create_user(interaction.user.id, guild.id)
-                    new_balance = user_data['balance'] - edit_price
-                    db.update_user_data(interaction.user.id, guild.id, balance=new_balance)
-                    db.log_transaction(guild.id, interaction.user.id, 'edit_custom_role', self.role_name, -edit_price, new_balance)
-                    fee_message = f" Phí chỉnh sửa **{edit_price:,} coin** đã được trừ."
-   
-
-                db.add_or_update_custom_role(interaction.user.id, guild.id, self.role_to_edit.id, self.role_name, f"#{self.color_int:06x}", self.style, self.color1_str, self.color2_str)
-                await self.notify_admin(interaction, "sửa")
-                
-                msg_content = f"✅ Đã gửi yêu cầu chỉnh sửa role **{self.role_name}** đến admin. Vui lòng chờ.{fee_message}"
-                if thread:
-                    await thread.send(msg_content)
-                    await thread.edit(archived=True, locked=True)
-                else: await interaction.edit_original_response(content=msg_content, view=None)
-                return
-            
-            # TH tao role moi
-            new_role = await guild.create_role(
-                name=self.role_name, color=new_color, display_icon=final_icon_data, reason=f"Custom role for {interaction.user.name}"
-            )
-            await interaction.user.add_roles(new_role)
+                fee_message = f" Phí chỉnh sửa **{charge:,} coin** đã được trừ." if charge > 0 else ""
 
-            if self.is_booster:
-                try:
+                await db.add_or_update_custom_role(interaction.user.id, guild.id, self.role_to_edit.id, self.role_name, f"#{self.color_int:06x}", self.style, self.color1_str, self.color2_str)
+            else:
+                # TH tao role moi
+                new_role = await guild.create_role(
+                    name=self.role_name, color=new_color, display_icon=final_icon_data, reason=f"Custom role for {interaction.user.name}"
+                )
+                await self.bot.actions.add_roles(interaction.user, new_role)
+
+                if self.is_booster:
+                    # khong can cho, gop chung voi cac lan sap xep role khac cua guild
                     target_position = max(1, guild.me.top_role.position - 1)
-                    await new_role.edit(position=target_position)
-                except Exception as e: 
-                    logging.warning(f"Failed to move new role position: {e}")
+                    self.bot.actions.edit_role_positions(guild, {new_role: target_position})
+                    await db.add_or_update_custom_role(interaction.user.id, guild.id, new_role.id, self.role_name, f"#{self.color_int:06x}", self.style, self.color1_str, self.color2_str)
+                else:
+                    regular_config = self.guild_config.get('REGULAR_USER_ROLE_CREATION', {})
+                    multiplier = regular_config.get('SHOP_PRICE_MULTIPLIER', 1.2)
+                    shop_price = int(self.creation_price * multiplier)
+                    await db.add_role_to_shop(new_role.id, guild.id, shop_price, creator_id=interaction.user.id, creation_price=self.creation_price)
+
+        except discord.HTTPException as e:
+            await self._rollback(new_role, interaction.user.id, guild.id, charge, charge_type)
             
-            user_data = db.get_or_create_user(interaction.user.id, guild.id)
-            new_balance = user_data['balance'] - self.creation_price
-            db.update_user_data(interaction.user.id, guild.id, balance=new_balance)
-            db.log_transaction(guild.id, interaction.user.id, 'create_custom_role', self.role_name, -self.creation_price, new_balance)
+            error_msg = "❌ Lỗi quyền! Tôi không thể tạo/sửa/gán role. Giao dịch đã được hủy bỏ và không trừ tiền."
+            if not isinstance(e, discord.Forbidden):
+                logging.error(f"Loi HTTP khi tao role: {e.status} - {e.text}")
+                error_msg = f"❌ Đã xảy ra lỗi từ Discord. Giao dịch đã được hủy bỏ. (Chi tiết: {e.text})"
+            await self._reply(interaction, thread, error_msg)
+            return
+        except Exception as e:
+            await self._rollback(new_role, interaction.user.id, guild.id, charge, charge_type)
+            logging.error(f"Loi khong mong muon: {e}")
+            await self._reply(interaction, thread, "Lỗi không mong muốn, vui lòng liên hệ admin. Giao dịch đã hủy.")
+            return
+
+        # giao dich da xong, tu day chi con thong bao
+        try:
+            if self.role_to_edit:
+                await self.notify_admin(interaction, "sửa")
+                await self._reply(interaction, thread, f"✅ Đã gửi yêu cầu chỉnh sửa role **{self.role_name}** đến admin. Vui lòng chờ.{fee_message}")
+                return
 
             receipt_embed = discord.Embed(
                 title="Biên Lai Giao Dịch Tạo Role",
@@ -297,17 +330,11 @@ class RoleCreationProcessView(View):
             if guild.icon:
                 receipt_embed.set_thumbnail(url=guild.icon.url)
             
-            msg_content = ""
             if self.is_booster:
-                db.add_or_update_custom_role(interaction.user.id, guild.id, new_role.id, self.role_name, f"#{self.color_int:06x}", self.style, self.color1_str, self.color2_str)
                 await self.notify_admin(interaction, "tạo mới")
                 msg_content = "✅ Yêu cầu của bạn đã được gửi đến admin để thiết lập style. Role cơ bản đã được tạo và gán."
                 receipt_embed.add_field(name="Loại Giao Dịch", value="```Tạo Role Booster```", inline=False)
             else:
-                regular_config = self.guild_config.get('REGULAR_USER_ROLE_CREATION', {})
-                multiplier = regular_config.get('SHOP_PRICE_MULTIPLIER', 1.2)
-                shop_price = int(self.creation_price * multiplier)
-                db.add_role_to_shop(new_role.id, guild.id, shop_price, creator_id=interaction.user.id, creation_price=self.creation_price)
                 msg_content = f"✅ Bạn đã tạo thành công role **{self.role_name}**! Role này giờ cũng có sẵn trong shop."
                 receipt_embed.add_field(name="Loại Giao Dịch", value="```Tạo Role Thường```", inline=False)
 
@@ -319,45 +346,44 @@ class RoleCreationProcessView(View):
                 receipt_embed.set_image(url=self.guild_config.get('SHOP_EMBED_IMAGE_URL'))
             receipt_embed.set_footer(text=f"Cảm ơn bạn đã giao dịch tại {guild.name}", icon_url=self.bot.user.avatar.url)
 
-            try:
-                await interaction.user.send(embed=receipt_embed)
-                final_msg = msg_content + "\nBiên lai đã được gửi vào tin nhắn riêng của bạn."
-                if thread:
-                    await thread.send(final_msg)
-                    await thread.edit(archived=True, locked=True)
-                else: 
-                    await interaction.edit_original_response(content=final_msg, view=None)
-            except discord.Forbidden:
-                final_msg = msg_content + "\n(Tôi không thể gửi biên lai vào DM của bạn.)"
-                if thread:
-                    await thread.send(final_msg, embed=receipt_embed)
-                    await thread.edit(archived=True, locked=True)
-                else:
-                    await interaction.edit_original_response(content=final_msg, view=None, embed=receipt_embed)
-
-        except (discord.Forbidden, discord.HTTPException) as e:
-            if new_role:
-                await new_role.delete(reason="Giao dich that bai, hoan tac")
-            
-            error_msg = "❌ Lỗi quyền! Tôi không thể tạo/sửa/gán role. Giao dịch đã được hủy bỏ và không trừ tiền."
-            if isinstance(e, discord.HTTPException):
-                logging.error(f"Loi HTTP khi tao role: {e.status} - {e.text}")
-                error_msg = f"❌ Đã xảy ra lỗi từ Discord. Giao dịch đã được hủy bỏ. (Chi tiết: {e.text})"
+            async def show_receipt():
+                await interaction.followup.send("Tôi không thể gửi biên lai vào DM của bạn. Đây là biên lai:", embed=receipt_embed, ephemeral=True)
 
-            if thread: 
-                await thread.send(error_msg)
-                await thread.edit(archived=True, locked=True)
-            else: await interaction.edit_original_response(content=error_msg, view=None)
+            # user chan DM lan dau chi bi phat hien luc worker gui -> fallback gui ephemeral qua interaction
+            if await self.bot.dm_outbox.send(interaction.user, guild.id, embed=receipt_embed, fallback=show_receipt):
+                await self._reply(interaction, thread, msg_content + "\nBiên lai sẽ được gửi vào tin nhắn riêng của bạn.")
+            else:
+                await self._reply(interaction, thread, msg_content + "\n(Tôi không thể gửi biên lai vào DM của bạn.)", embed=receipt_embed)
         except Exception as e:
-            if new_role:
-                await new_role.delete(reason="Giao dich that bai, hoan tac")
-            logging.error(f"Loi khong mong muon: {e}")
-            msg_content = f"Lỗi không mong muốn, vui lòng liên hệ admin. Giao dịch đã hủy."
+            logging.error(f"Giao dich role cua user {interaction.user.id} da xong nhung gui thong bao that bai: {e}")
+
+    async def _reply(self, interaction: discord.Interaction, thread: discord.Thread, content: str, embed: discord.Embed = None):
+        # bao ket qua vao thread (roi khoa thread) hoac sua tin nhan ephemeral ban dau
+        extra = {'embed': embed} if embed else {}
+        try:
             if thread:
-                await thread.send(msg_content)
+                await thread.send(content, **extra)
                 await thread.edit(archived=True, locked=True)
-            else: await interaction.edit_original_response(content=msg_content, view=None)
+            else:
+                await interaction.edit_original_response(content=content, view=None, **extra)
+        except discord.HTTPException as e:
+            logging.warning(f"Khong the gui ket qua giao dich cho user {interaction.user.id}: {e}")
+
+    async def _rollback(self, new_role, user_id: int, guild_id: int, charge: int, charge_type: str):
+        # hoan tien truoc, xoa role loi sau: xoa that bai (thieu quyen, role da mat) cung khong mat tien
+        await self._refund(user_id, guild_id, charge, charge_type)
+        if new_role:
+            try:
+                await new_role.delete(reason="Giao dich that bai, hoan tac")
+            except discord.HTTPException as e:
+                logging.error(f"Khong the xoa role {new_role.id} khi hoan tac: {e}")
 
+    async def _refund(self, user_id: int, guild_id: int, charge: int, charge_type: str):
+        # hoan lai tien da tru khi giao dich that bai
+        if charge <= 0:
+            return
+        if await db.credit(user_id, guild_id, charge, f'refund_{charge_type}', self.role_name) is None:
+            logging.error(f"Hoan {charge} coin cho user {user_id} that bai.")
 
     async def notify_admin(self, interaction: discord.Interaction, action_type: str):
         admin_channel_id = self.guild_config.get('ADMIN_LOG_CHANNEL_ID')
@@ -404,7 +430,7 @@ class SellModal(Modal, title="Bán Lại Role"):
         if not guild_config:
             return await interaction.followup.send("Lỗi: Không tìm thấy config cho server ini.", ephemeral=True)
 
-        embed_color = discord.Color(int(str(guild_config.get('EMBED_COLOR', '#ff00af')).lstrip('#'), 16))
+        embed_color = guild_config.embed_color
 
         try:
             role_number_input = int(self.children[0].value)
@@ -413,11 +439,11 @@ class SellModal(Modal, title="Bán Lại Role"):
         except (ValueError, TypeError):
             return await interaction.followup.send("<a:c_947079524435247135:1274398161200484446> Vui lòng nhập một số thứ tự hợp lệ.", ephemeral=True)
 
-        shop_roles = db.get_shop_roles(interaction.guild.id)
-        if not shop_roles or role_number_input > len(shop_roles):
+        shop_catalog = await db.get_shop_catalog(interaction.guild.id)
+        selected_role_data = shop_catalog.at(role_number_input) if shop_catalog else None
+        if not selected_role_data:
             return await interaction.followup.send("<a:c_947079524435247135:1274398161200484446> Số thứ tự này không tồn tại trong shop.", ephemeral=True)
 
-        selected_role_data = shop_roles[role_number_input - 1]
         role_id = selected_role_data['role_id']
         price = selected_role_data['price']
 
@@ -428,23 +454,24 @@ class SellModal(Modal, title="Bán Lại Role"):
         if role_obj not in interaction.user.roles:
             return await interaction.followup.send(f"Bạn không sở hữu role {role_obj.mention} để bán.", ephemeral=True)
 
-        user_data = db.get_or_create_user(interaction.user.id, interaction.guild.id)
-
         refund_percentage = guild_config.get('SELL_REFUND_PERCENTAGE', 0.65)
         refund_amount = int(price * refund_percentage)
-        new_balance = user_data['balance'] + refund_amount
 
         try:
-            await interaction.user.remove_roles(role_obj, reason="Bán lại cho shop")
-            db.update_user_data(interaction.user.id, interaction.guild.id, balance=new_balance)
-
-            db.log_transaction(
-                guild_id=interaction.guild.id, user_id=interaction.user.id,
-                transaction_type='sell_role', item_name=role_obj.name,
-                amount_changed=refund_amount, new_balance=new_balance
-            )
+            await self.bot.actions.remove_roles(interaction.user, role_obj, reason="Bán lại cho shop")
         except discord.Forbidden:
             return await interaction.followup.send("❌ Đã xảy ra lỗi! Tôi không có quyền để xóa role này khỏi bạn. Giao dịch đã bị hủy.", ephemeral=True)
+        except discord.HTTPException as e:
+            logging.error(f"Go role {role_obj.id} cua user {interaction.user.id} khi ban that bai: {e}")
+            return await interaction.followup.send("❌ Đã xảy ra lỗi từ Discord khi gỡ role. Giao dịch đã bị hủy, vui lòng thử lại sau.", ephemeral=True)
+
+        new_balance = await db.credit(
+            interaction.user.id, interaction.guild.id, refund_amount,
+            transaction_type='sell_role', item_name=role_obj.name
+        )
+        if new_balance is None:
+            logging.error(f"Cong tien ban role {role_obj.id} cho user {interaction.user.id} that bai.")
+            return await interaction.followup.send("❌ Đã gỡ role nhưng không thể cộng tiền. Vui lòng liên hệ Admin.", ephemeral=True)
 
         receipt_embed = discord.Embed(
             title="Biên Lai Giao Dịch Bán Hàng",
@@ -466,16 +493,19 @@ class SellModal(Modal, title="Bán Lại Role"):
 
         receipt_embed.set_footer(text=f"Cảm ơn bạn đã giao dịch tại {interaction.guild.name}", icon_url=self.bot.user.avatar.url)
 
-        try:
-            await interaction.user.send(embed=receipt_embed)
-            await interaction.followup.send("✅ Giao dịch thành công! Vui lòng kiểm tra tin nhắn riêng để xem biên lai.", ephemeral=True)
-        except discord.Forbidden:
+        async def show_receipt():
             await interaction.followup.send(
                 "<a:c_947079524435247135:1274398161200484446> Tôi không thể gửi biên lai vào tin nhắn riêng của bạn. Giao dịch vẫn thành công. Đây là biên lai của bạn:",
                 embed=receipt_embed,
                 ephemeral=True
             )
 
+        # bien lai vao hang doi DM, khong cho gui xong; user chan DM (ke ca lan dau, phat hien luc gui) thi hien tai day
+        if await self.bot.dm_outbox.send(interaction.user, interaction.guild.id, embed=receipt_embed, fallback=show_receipt):
+            await interaction.followup.send("✅ Giao dịch thành công! Biên lai sẽ được gửi vào tin nhắn riêng của bạn.", ephemeral=True)
+        else:
+            await show_receipt()
+
 class CustomRoleModal(Modal):
     def __init__(self, bot, guild_id: int, guild_config, style: str, is_booster: bool, min_creation_price=None, role_to_edit: discord.Role = None):
         super().__init__(title=f"Tạo / Sửa Role: {style if is_booster else 'Thường'}")
@@ -538,7 +568,7 @@ class CustomRoleModal(Modal):
 
         color_int = int(role_color_str.lstrip('#'), 16)
         
-        user_data = db.get_or_create_user(interaction.user.id, self.guild_id)
+        user_data = await db.get_or_create_user(interaction.user.id, self.guild_id)
 
         creation_price = 0
         if self.is_booster:
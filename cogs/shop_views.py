@@ -25,14 +25,11 @@ class ConfirmDeleteView(View):
     async def confirm_callback(self, interaction: discord.Interaction, button: Button):
         await interaction.response.defer()
         try:
-            shop_roles = db.get_shop_roles(self.guild_id)
-            role_data = next((r for r in shop_roles if r['role_id'] == self.role_to_delete.id), None)
-            
             if self.role_to_delete:
-                await self.role_to_delete.delete(reason=f"Nguoi dung {interaction.user} tu xoa")
+                await self.bot.actions.delete_role(self.role_to_delete, reason=f"Nguoi dung {interaction.user} tu xoa")
             
-            db.delete_custom_role_data(interaction.user.id, self.guild_id)
-            db.remove_role_from_shop(self.role_to_delete.id, self.guild_id)
+            await db.delete_custom_role_data(interaction.user.id, self.guild_id)
+            await db.remove_role_from_shop(self.role_to_delete.id, self.guild_id)
             
             for item in self.children:
                 item.disabled = True
@@ -52,46 +49,77 @@ class ConfirmDeleteView(View):
         await interaction.edit_original_response(content="Đã hủy thao tác.", view=self, embed=None)
         self.stop()
 
+# 2 ham duoi chi chay khi bot.shop_list_cache chua co ban dung san cho catalog/config hien tai
+def _render_role_page(bot, guild: discord.Guild, guild_config, catalog, page: int, total_pages: int) -> discord.Embed:
+    messages = guild_config.messages
+    embed = discord.Embed(
+        title=messages.get('SHOP_ROLES_TITLE', "Danh sách role"),
+        color=guild_config.embed_color
+    )
+    start_index = page * ROLES_PER_PAGE
+    end_index = start_index + ROLES_PER_PAGE
+    roles_on_page = catalog.roles[start_index:end_index]
+
+    if not roles_on_page:
+        embed.description = messages.get('SHOP_ROLES_EMPTY', "Shop trống.")
+    else:
+        role_list_str = ""
+        for i, role_data in enumerate(roles_on_page):
+            role = guild.get_role(role_data['role_id'])
+            if role:
+                role_list_str += f"### {start_index + i + 1}. {role.mention}\n> **Giá:** `{role_data['price']}` 🪙\n"
+                if creator_id := role_data.get('creator_id'):
+                    creator = guild.get_member(creator_id)
+                    creator_mention = creator.mention if creator else f"ID: {creator_id}"
+                    role_list_str += f"> **Người tạo:** {creator_mention}\n"
+        
+        base_desc = messages.get('SHOP_ROLES_DESC', '')
+        embed.description = (base_desc + "\n\n" + role_list_str) if base_desc else role_list_str
+    
+    footer_text = f"Trang {page + 1}/{total_pages}"
+    embed.set_footer(text=footer_text, icon_url=bot.user.avatar.url)
+    return embed
+
+def _render_role_options(guild: discord.Guild, catalog) -> tuple:
+    options = []
+    for i, role_data in enumerate(catalog.roles):
+        role = guild.get_role(role_data['role_id'])
+        if role:
+            # logic xd icon
+            final_emoji = "<:g_chamhoi:1326543673957027961>"
+            if isinstance(role.icon, discord.Emoji):
+                final_emoji = role.icon
+            elif role.icon is not None: 
+                final_emoji = "🖼️"
+            
+            options.append(discord.SelectOption(
+                label=f"{i+1}. {role.name}",
+                description=f"Giá: {role_data['price']:,} coin",
+                value=str(role.id),
+                emoji=final_emoji
+            ))
+            # select cua discord toi da 25 option
+            if len(options) == 25:
+                break
+    return tuple(options)
+
 class PaginatedRoleListView(View):
-    def __init__(self, bot, interaction: discord.Interaction, guild_config: dict, roles: list):
+    def __init__(self, bot, interaction: discord.Interaction, guild_config: dict, catalog):
         super().__init__(timeout=180)
         self.bot = bot
         self.interaction = interaction
         self.guild_config = guild_config
-        self.roles = roles
+        self.catalog = catalog
         self.current_page = 0
-        self.total_pages = math.ceil(len(self.roles) / ROLES_PER_PAGE)
-        self.messages = self.guild_config.get('MESSAGES', {})
-        self.embed_color = discord.Color(int(str(self.guild_config.get('EMBED_COLOR', '#ff00af')).lstrip('#'), 16))
+        self.total_pages = math.ceil(len(self.catalog) / ROLES_PER_PAGE)
 
     async def get_page_embed(self) -> discord.Embed:
-        embed = discord.Embed(
-            title=self.messages.get('SHOP_ROLES_TITLE', "Danh sách role"),
-            color=self.embed_color
+        # embed moi trang dung 1 lan cho moi user, toi khi catalog / config / creator doi
+        page = self.current_page
+        return self.bot.shop_list_cache.get_or_build(
+            self.catalog, self.guild_config, ('page', page),
+            lambda: _render_role_page(self.bot, self.interaction.guild, self.guild_config, self.catalog, page, self.total_pages)
         )
-        start_index = self.current_page * ROLES_PER_PAGE
-        end_index = start_index + ROLES_PER_PAGE
-        roles_on_page = self.roles[start_index:end_index]
-
-        if not roles_on_page:
-            embed.description = self.messages.get('SHOP_ROLES_EMPTY', "Shop trống.")
-        else:
-            role_list_str = ""
-            for i, role_data in enumerate(roles_on_page):
-                role = self.interaction.guild.get_role(role_data['role_id'])
-                if role:
-                    role_list_str += f"### {start_index + i + 1}. {role.mention}\n> **Giá:** `{role_data['price']}` 🪙\n"
-                    if creator_id := role_data.get('creator_id'):
-                        creator = self.interaction.guild.get_member(creator_id)
-                        creator_mention = creator.mention if creator else f"ID: {creator_id}"
-                        role_list_str += f"> **Người tạo:** {creator_mention}\n"
-            
-            base_desc = self.messages.get('SHOP_ROLES_DESC', '')
-            embed.description = (base_desc + "\n\n" + role_list_str) if base_desc else role_list_str
-        
-        footer_text = f"Trang {self.current_page + 1}/{self.total_pages}"
-        embed.set_footer(text=footer_text, icon_url=self.bot.user.avatar.url)
-        return embed
 
     async def update_view(self):
         self.prev_page.disabled = self.current_page == 0
@@ -120,14 +148,22 @@ class RoleDetailView(View):
         self.guild_config = guild_config
         self.role_obj = role_obj
         self.role_data = role_data
-        self.embed_color = discord.Color(int(str(self.guild_config.get('EMBED_COLOR', '#ff00af')).lstrip('#'), 16))
+        self.embed_color = self.guild_config.embed_color
+
+    async def _refund(self, interaction: discord.Interaction, price: int):
+        # gan role that bai sau khi da tru tien -> hoan lai
+        new_balance = await db.credit(
+            interaction.user.id, interaction.guild.id, price,
+            transaction_type='refund_buy_role', item_name=self.role_obj.name
+        )
+        if new_balance is None:
+            logging.error(f"Hoan {price} coin mua role {self.role_obj.id} cho user {interaction.user.id} that bai.")
 
     @discord.ui.button(label="Mua Ngay", style=discord.ButtonStyle.secondary, emoji="<:MenheraNya3:1406458270641819840>")
     async def buy_callback(self, interaction: discord.Interaction, button: Button):
         await interaction.response.defer(ephemeral=True)
         
         price = self.role_data['price']
-        user_data = db.get_or_create_user(interaction.user.id, interaction.guild.id)
 
         if self.role_obj in interaction.user.roles:
             button.disabled = True
@@ -135,20 +171,32 @@ class RoleDetailView(View):
             await interaction.edit_original_response(view=self)
             return await interaction.followup.send(f"Bạn đã sở hữu role {self.role_obj.mention} rồi!", ephemeral=True)
 
-        if user_data['balance'] < price:
-            return await interaction.followup.send(f"Bạn không đủ coin! Cần **{price} coin** nhưng bạn chỉ có **{user_data['balance']}**.", ephemeral=True)
-
-        new_balance = user_data['balance'] - price
+        # tru tien truoc (atomic), gan role that bai thi hoan lai
         try:
-            await interaction.user.add_roles(self.role_obj, reason="Mua từ shop")
-            db.update_user_data(interaction.user.id, interaction.guild.id, balance=new_balance)
-            db.log_transaction(
-                guild_id=interaction.guild.id, user_id=interaction.user.id,
-                transaction_type='buy_role', item_name=self.role_obj.name,
-                amount_changed=-price, new_balance=new_balance
+            new_balance = await db.try_debit(
+                interaction.user.id, interaction.guild.id, price,
+                transaction_type='buy_role', item_name=self.role_obj.name
             )
+        except db.DatabaseError:
+            return await interaction.followup.send("⚠️ Không thể kết nối database, chưa trừ coin của bạn. Vui lòng thử lại sau.", ephemeral=True)
+        if new_balance is None:
+            user_data = await db.get_or_create_user(interaction.user.id, interaction.guild.id)
+            current_balance = user_data['balance'] if user_data else 0
+            return await interaction.followup.send(f"Bạn không đủ coin! Cần **{price} coin** nhưng bạn chỉ có **{current_balance}**.", ephemeral=True)
+
+        try:
+            await self.bot.actions.add_roles(interaction.user, self.role_obj, reason="Mua từ shop")
         except discord.Forbidden:
+            await self._refund(interaction, price)
             return await interaction.followup.send("❌ Lỗi! Tôi không có quyền để gán role này. Giao dịch đã bị hủy.", ephemeral=True)
+        except discord.HTTPException as e:
+            logging.error(f"Gan role {self.role_obj.id} cho user {interaction.user.id} that bai: {e}")
+            await self._refund(interaction, price)
+            return await interaction.followup.send("❌ Đã xảy ra lỗi từ Discord khi gán role. Giao dịch đã bị hủy và hoàn lại coin.", ephemeral=True)
+        except Exception as e:
+            logging.error(f"Loi khong mong muon khi gan role {self.role_obj.id} cho user {interaction.user.id}: {e}")
+            await self._refund(interaction, price)
+            return await interaction.followup.send("Lỗi không mong muốn, vui lòng liên hệ admin. Giao dịch đã hủy và hoàn lại coin.", ephemeral=True)
 
         button.disabled = True
         button.label = "Mua thành công"
@@ -173,59 +221,47 @@ class RoleDetailView(View):
             receipt_embed.set_image(url=self.guild_config.get('SHOP_EMBED_IMAGE_URL'))
         receipt_embed.set_footer(text=f"Cảm ơn bạn đã giao dịch tại {interaction.guild.name}", icon_url=self.bot.user.avatar.url)
         
-        try:
-            await interaction.user.send(embed=receipt_embed)
-            await interaction.followup.send("✅ Giao dịch thành công! Vui lòng kiểm tra tin nhắn riêng để xem biên lai.", ephemeral=True)
-        except discord.Forbidden:
+        async def show_receipt():
             await interaction.followup.send(
                 "<a:c_947079524435247135:1274398161200484446> Tôi không thể gửi biên lai vào tin nhắn riêng của bạn. Giao dịch vẫn thành công. Đây là biên lai của bạn:",
                 embed=receipt_embed,
                 ephemeral=True
             )
 
+        # bien lai vao hang doi DM, khong cho gui xong; user chan DM (ke ca lan dau, phat hien luc gui) thi hien tai day
+        if await self.bot.dm_outbox.send(interaction.user, interaction.guild.id, embed=receipt_embed, fallback=show_receipt):
+            await interaction.followup.send("✅ Giao dịch thành công! Biên lai sẽ được gửi vào tin nhắn riêng của bạn.", ephemeral=True)
+        else:
+            await show_receipt()
+
 
 class RoleListSelect(Select):
-    def __init__(self, bot, guild_config: dict, roles: list):
+    def __init__(self, bot, guild_config: dict, catalog):
         self.bot = bot
         self.guild_config = guild_config
-        self.roles_data = {str(r['role_id']): r for r in roles}
-        self.embed_color = discord.Color(int(str(self.guild_config.get('EMBED_COLOR', '#ff00af')).lstrip('#'), 16))
+        self.catalog = catalog
+        self.embed_color = self.guild_config.embed_color
         
-        options = []
-        if roles:
-            guild_id = roles[0]['guild_id']
-            guild = bot.get_guild(guild_id)
-            if guild:
-                for i, role_data in enumerate(roles):
-                    role = guild.get_role(role_data['role_id'])
-                    if role:
-                        # logic xd icon
-                        final_emoji = "<:g_chamhoi:1326543673957027961>"
-                        if isinstance(role.icon, discord.Emoji):
-                            final_emoji = role.icon
-                        elif role.icon is not None: 
-                            final_emoji = "🖼️"
-                        
-                        options.append(discord.SelectOption(
-                            label=f"{i+1}. {role.name}",
-                            description=f"Giá: {role_data['price']:,} coin",
-                            value=str(role.id),
-                            emoji=final_emoji
-                        ))
+        options = ()
+        guild = bot.get_guild(catalog.guild_id)
+        if guild:
+            options = bot.shop_list_cache.get_or_build(
+                catalog, guild_config, ('options',), lambda: _render_role_options(guild, catalog)
+            )
 
         super().__init__(
             placeholder="Chọn một role để xem chi tiết & mua...", 
             min_values=1, 
             max_values=1, 
-            options=options[:25]
+            options=list(options)
         )
     
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         
-        role_id_str = self.values[0]
-        role_data = self.roles_data.get(role_id_str)
-        role = interaction.guild.get_role(int(role_id_str))
+        role_id = int(self.values[0])
+        role_data = self.catalog.get(role_id)
+        role = interaction.guild.get_role(role_id)
 
         if not role_data or not role:
             return await interaction.followup.send("Role này không còn tồn tại.", ephemeral=True)
@@ -270,9 +306,9 @@ class RoleListSelect(Select):
         await interaction.followup.send(embed=embed, view=view, ephemeral=True)
 
 class RoleListView(View):
-    def __init__(self, bot, guild_config: dict, roles: list):
+    def __init__(self, bot, guild_config: dict, catalog):
         super().__init__(timeout=180)
-        self.add_item(RoleListSelect(bot, guild_config, roles))
+        self.add_item(RoleListSelect(bot, guild_config, catalog))
 
 
 class QnASelect(Select):
@@ -281,7 +317,7 @@ class QnASelect(Select):
         self.guild_config = guild_config
         self.guild_id = guild_id 
         self.qna_data = self.guild_config.get("QNA_DATA", [])
-        self.embed_color = discord.Color(int(str(self.guild_config.get('EMBED_COLOR', '#ff00af')).lstrip('#'), 16))
+        self.embed_color = self.guild_config.embed_color
 
         options = [
             discord.SelectOption(
@@ -362,7 +398,7 @@ class ManageCustomRoleActionSelect(Select):
             # Ktra so du truoc khi phan hoi
             edit_price = self.guild_config.get('CUSTOM_ROLE_CONFIG', {}).get('EDIT_PRICE', 0)
             if edit_price > 0:
-                user_data = db.get_or_create_user(interaction.user.id, guild.id)
+                user_data = await db.get_or_create_user(interaction.user.id, guild.id)
                 if user_data['balance'] < edit_price:
                     await interaction.response.send_message(
                         f"Bạn không đủ coin để chỉnh sửa! Cần **{edit_price:,} coin** nhưng bạn chỉ có **{user_data['balance']:,}**.",
@@ -405,8 +441,8 @@ class AccountActionSelect(Select):
         self.bot = bot
         self.guild_config = guild_config
         self.guild_id = guild_id
-        self.messages = self.guild_config.get('MESSAGES', {})
-        self.embed_color = discord.Color(int(str(self.guild_config.get('EMBED_COLOR', '#ff00af')).lstrip('#'), 16))
+        self.messages = self.guild_config.messages
+        self.embed_color = self.guild_config.embed_color
 
         options = [
             discord.SelectOption(
@@ -493,7 +529,7 @@ class AccountActionSelect(Select):
 
             if self.guild_config.get('EARNING_RATES_IMAGE_URL'): embed.set_image(url=self.guild_config.get('EARNING_RATES_IMAGE_URL'))
             
-            footer_text = self.guild_config.get('FOOTER_MESSAGES', {}).get('EARNING_RATES', '')
+            footer_text = self.guild_config.footer_messages.get('EARNING_RATES', '')
             embed.set_footer(text=f"────────────────────\n{footer_text}", icon_url=self.bot.user.avatar.url)
             await interaction.followup.send(embed=embed, ephemeral=True)
         
@@ -502,13 +538,13 @@ class AccountActionSelect(Select):
             if not guild:
                 return await interaction.followup.send("Lỗi: Không thể tìm thấy server tương ứng.", ephemeral=True)
 
-            custom_role_data = db.get_custom_role(interaction.user.id, self.guild_id)
+            custom_role_data = await db.get_custom_role(interaction.user.id, self.guild_id)
             if not custom_role_data:
                 return await interaction.followup.send(self.messages.get('CUSTOM_ROLE_NOT_OWNED', "Bạn chưa tạo role tùy chỉnh nào cả."), ephemeral=True)
 
             role_obj = guild.get_role(custom_role_data['role_id'])
             if not role_obj:
-                db.delete_custom_role_data(interaction.user.id, self.guild_id)
+                await db.delete_custom_role_data(interaction.user.id, self.guild_id)
                 return await interaction.followup.send("<a:c_947079524435247135:1274398161200484446> Role tùy chỉnh của bạn không còn tồn tại. Dữ liệu đã được xóa.", ephemeral=True)
 
             embed = discord.Embed(
@@ -609,14 +645,14 @@ class ShopActionSelect(Select):
         if not guild_config:
             return await interaction.response.send_message("Lỗi: Không tìm thấy config cho server.", ephemeral=True, delete_after=10)
         
-        messages = guild_config.get('MESSAGES', {})
+        messages = guild_config.messages
         action = self.values[0]
 
         if action == "list_roles":
             await interaction.response.defer(ephemeral=True)
-            shop_roles = db.get_shop_roles(interaction.guild.id)
+            shop_catalog = await db.get_shop_catalog(interaction.guild.id)
             
-            if not shop_roles:
+            if not shop_catalog:
                 embed = discord.Embed(
                     title=messages.get('SHOP_ROLES_TITLE', "Danh sách role"),
                     description=messages.get('SHOP_ROLES_EMPTY', "Shop hiện đang trống."),
@@ -628,13 +664,13 @@ class ShopActionSelect(Select):
             display_style = guild_config.get('SHOP_DISPLAY_STYLE', 'select_menu')
 
             if display_style == 'pagination':
-                paginated_view = PaginatedRoleListView(self.bot, interaction, guild_config, shop_roles)
+                paginated_view = PaginatedRoleListView(self.bot, interaction, guild_config, shop_catalog)
                 initial_embed = await paginated_view.get_page_embed()
                 paginated_view.prev_page.disabled = True
                 paginated_view.next_page.disabled = paginated_view.total_pages <= 1
                 await interaction.followup.send(embed=initial_embed, view=paginated_view, ephemeral=True)
             else: 
-                view = RoleListView(self.bot, guild_config, shop_roles)
+                view = RoleListView(self.bot, guild_config, shop_catalog)
                 await interaction.followup.send(
                     content="<:MenheraFlower:1406458230317645906> Vui lòng chọn một role từ menu bên dưới để xem thông tin chi tiết.",
                     view=view,
@@ -647,11 +683,11 @@ class ShopActionSelect(Select):
         elif action == "custom_role_booster":
             await interaction.response.defer(ephemeral=True)
             
-            if db.get_custom_role(interaction.user.id, interaction.guild.id):
+            if await db.get_custom_role(interaction.user.id, interaction.guild.id):
                 msg = messages.get('CUSTOM_ROLE_ALREADY_OWNED', "Bạn đã có một role tùy chỉnh rồi. Hãy dùng nút 'Tài khoản của tôi' để quản lý.")
                 return await interaction.followup.send(msg, ephemeral=True)
             
-            user_data = db.get_or_create_user(interaction.user.id, interaction.guild.id)
+            user_data = await db.get_or_create_user(interaction.user.id, interaction.guild.id)
             booster_config = guild_config.get('CUSTOM_ROLE_CONFIG', {})
             min_boosts = booster_config.get('MIN_BOOST_COUNT', 99)
             
@@ -677,7 +713,7 @@ class ShopActionSelect(Select):
             if not regular_config.get('ENABLED', False):
                 return await interaction.response.send_message("Tính năng tạo role cho thành viên thường đang tắt.", ephemeral=True)
 
-            user_data = db.get_or_create_user(interaction.user.id, interaction.guild.id)
+            user_data = await db.get_or_create_user(interaction.user.id, interaction.guild.id)
             min_creation_price = int(regular_config.get('CREATION_PRICE', 2000))
 
             if user_data['balance'] < min_creation_price:
@@ -703,10 +739,10 @@ class ShopView(View):
             if not guild_config:
                 return await interaction.followup.send("Lỗi: Không tìm thấy config cho server.", ephemeral=True)
             
-            messages = guild_config.get('MESSAGES', {})
-            embed_color = discord.Color(int(str(guild_config.get('EMBED_COLOR', '#ff00af')).lstrip('#'), 16))
+            messages = guild_config.messages
+            embed_color = guild_config.embed_color
             
-            user_data = db.get_or_create_user(interaction.user.id, interaction.guild.id)
+            user_data = await db.get_or_create_user(interaction.user.id, interaction.guild.id)
 
             embed = discord.Embed(
                 title=messages.get('ACCOUNT_INFO_TITLE', "Tài khoản"),
@@ -720,11 +756,28 @@ class ShopView(View):
 
             balance_str = messages.get('BALANCE_FIELD_VALUE', "{balance} coin").format(balance=f"{user_data['balance']:,}")
             embed.add_field(name=f"```{messages.get('BALANCE_FIELD_NAME', 'Số dư')}```", value=balance_str, inline=False)
+
+            rank_info = await db.get_user_rank(interaction.user.id, interaction.guild.id)
+            if rank_info:
+                rank_lines = []
+                for entry in rank_info['neighbours']:
+                    member = interaction.guild.get_member(entry['user_id'])
+                    name = member.display_name if member else "User đã rời server"
+                    line = f"#{entry['rank']} {name} - {entry['balance']:,} coin"
+                    # to dam dong cua chinh user
+                    rank_lines.append(f"**{line}**" if entry['user_id'] == interaction.user.id else line)
+                rank_header = messages.get('RANK_FIELD_VALUE', "Hạng **#{rank}** / {total} thành viên").format(
+                    rank=rank_info['rank'], total=rank_info['total']
+                )
+                embed.add_field(
+                    name=f"```{messages.get('RANK_FIELD_NAME', 'Xếp hạng của bạn')}```",
+                    value=rank_header + "\n" + "\n".join(rank_lines),
+                    inline=False
+                )
             
-            shop_roles_db = db.get_shop_roles(interaction.guild.id)
-            if shop_roles_db:
-                shop_role_ids = {r['role_id'] for r in shop_roles_db}
-                owned_roles = [f"`{role.name}`" for role in interaction.user.roles if role.id in shop_role_ids]
+            shop_catalog = await db.get_shop_catalog(interaction.guild.id)
+            if shop_catalog:
+                owned_roles = [f"`{role.name}`" for role in interaction.user.roles if role.id in shop_catalog]
                 
                 owned_roles_str = "\n".join(owned_roles) if owned_roles else "Chưa sở hữu role nào."
                 embed.add_field(name="<:MenheraFlower:1406458230317645906> Role Shop đã sở hữu", value=owned_roles_str, inline=False)
@@ -748,10 +801,10 @@ class ShopView(View):
             if guild_config.get('SHOP_EMBED_IMAGE_URL'):
                 embed.set_image(url=guild_config['SHOP_EMBED_IMAGE_URL'])
 
-            footer_text = guild_config.get('FOOTER_MESSAGES', {}).get('ACCOUNT_INFO', '')
+            footer_text = guild_config.footer_messages.get('ACCOUNT_INFO', '')
             embed.set_footer(text=f"────────────────────\n{footer_text}", icon_url=self.bot.user.avatar.url)
             
-            custom_role = db.get_custom_role(interaction.user.id, interaction.guild.id)
+            custom_role = await db.get_custom_role(interaction.user.id, interaction.guild.id)
             view = AccountView(bot=self.bot, guild_config=guild_config, guild_id=interaction.guild.id, custom_role=custom_role)
             
             try:
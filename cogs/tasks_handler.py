@@ -7,6 +7,32 @@ from collections import Counter
 class TasksHandler(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.maintain_transactions.start()
+
+    def cog_unload(self):
+        self.maintain_transactions.cancel()
+
+    @tasks.loop(hours=6)
+    async def maintain_transactions(self):
+        """
+        Tao truoc partition thang moi cho bang transactions, gop va xoa gd het han.
+        Thoi gian giu: TRANSACTION_RETENTION_MONTHS trong config guild, mac dinh lay tu config.json.
+        Guild dat gia tri sai thi khong xoa gd nao cua guild do.
+        """
+        default_months = self.bot.global_config.get('TRANSACTION_RETENTION_MONTHS', 12)
+        retention_months = {}
+        for guild_id_str, guild_config in self.bot.guild_configs.items():
+            if guild_config.retention_invalid:
+                logging.warning(f"Bo qua xoa gd het han cua guild {guild_id_str}: TRANSACTION_RETENTION_MONTHS khong hop le.")
+                retention_months[int(guild_id_str)] = None
+            elif guild_config.retention_months is not None:
+                retention_months[int(guild_id_str)] = guild_config.retention_months
+
+        result = await db.maintain_transaction_partitions(retention_months, default_months)
+        if result is None:
+            return
+        if result['dropped'] or result['pruned_rows']:
+            logging.info(f"Bao tri transactions: drop {result['dropped']} partition, gop {result['pruned_rows']} gd het han.")
 
 async def setup(bot: commands.Bot):
-    await bot.add_cog(TasksHandler(bot))
\ No newline at end of file
+    await bot.add_cog(TasksHandler(bot))
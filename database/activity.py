@@ -0,0 +1,53 @@
+import math
+
+def booster_params(booster_config: dict):
+    # (enabled, base, per_boost) cho cau lenh ghi hoat dong
+    return (
+        bool(booster_config.get('ENABLED', False)),
+        float(booster_config.get('BASE_MULTIPLIER', 1.0)),
+        float(booster_config.get('PER_BOOST_ADDITION', 0.0))
+    )
+
+def activity_row(user_id, guild_id, activity_type, rate, item_name, booster_config: dict):
+    # 1 luot message/reaction -> row theo dinh dang cua apply_activity_batch
+    if activity_type == 'message':
+        hits = (1, rate, item_name, 0, 1, None)
+    else:
+        hits = (0, 1, None, 1, rate, item_name)
+    return (user_id, guild_id, *hits, *booster_params(booster_config))
+
+def compute_activity(user: dict, row) -> dict:
+    """
+    Ban Python cua ACTIVITY_BATCH_QUERY cho backend khong phai postgres.
+    user: row users hien tai, row: (user_id, guild_id, msg_hits, msg_rate, msg_item,
+    react_hits, react_rate, react_item, boost_enabled, base_multiplier, per_boost_addition).
+    Tra ve counter moi + so coin nhan duoc, chua cong vao balance.
+    """
+    (_, _, msg_hits, msg_rate, msg_item, react_hits, react_rate, react_item,
+     boost_enabled, base_multiplier, per_boost_addition) = row
+
+    boost_count = user.get('fake_boosts') or user.get('real_boosts') or 0
+    msg_total = (user.get('message_count') or 0) + msg_hits
+    react_total = (user.get('reaction_count') or 0) + react_hits
+    msg_awards = msg_total // msg_rate if msg_hits > 0 else 0
+    react_awards = react_total // react_rate if react_hits > 0 else 0
+    coins_per_award = 1
+    if boost_enabled and boost_count > 0:
+        coins_per_award = max(1, math.floor(base_multiplier + (boost_count - 1) * per_boost_addition))
+
+    msg_coins = msg_awards * coins_per_award
+    react_coins = react_awards * coins_per_award
+    return {
+        'message_count': msg_total % msg_rate if msg_awards > 0 else msg_total,
+        'reaction_count': react_total % react_rate if react_awards > 0 else react_total,
+        'coins_earned': msg_coins + react_coins,
+        'msg_coins': msg_coins, 'msg_item': msg_item,
+        'react_coins': react_coins, 'react_item': react_item
+    }
+
+def earn_ledger_entries(result: dict):
+    # (transaction_type, item_name, amount) can ghi log cho 1 ket qua ghi hoat dong
+    if result['msg_coins'] > 0:
+        yield 'earn_message', result['msg_item'], result['msg_coins']
+    if result['react_coins'] > 0:
+        yield 'earn_reaction', result['react_item'], result['react_coins']
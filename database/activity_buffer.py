@@ -0,0 +1,81 @@
+import asyncio
+import logging
+from database import database as db
+
+class ActivityBuffer:
+    """
+    Gom luot message/reaction theo (guild, user) trong bo nho va ghi xuong db theo lo,
+    so lan ghi ti le voi so user hoat dong moi chu ky thay vi so tin nhan.
+    """
+    def __init__(self, max_pending_users: int = 5000):
+        self.max_pending_users = max_pending_users
+        self._pending = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    @staticmethod
+    def _new_entry():
+        return {
+            'message_hits': 0, 'message_rate': 1, 'message_item': None,
+            'reaction_hits': 0, 'reaction_rate': 1, 'reaction_item': None,
+            'booster': (False, 1.0, 0.0)
+        }
+
+    def add(self, guild_id: int, user_id: int, activity_type: str, rate: int, item_name: str, booster_config: dict):
+        key = (guild_id, user_id)
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = self._pending[key] = self._new_entry()
+
+        # nguong va ten kenh lay theo hoat dong moi nhat
+        entry[f'{activity_type}_hits'] += 1
+        entry[f'{activity_type}_rate'] = rate
+        entry[f'{activity_type}_item'] = item_name
+        entry['booster'] = db.booster_params(booster_config)
+
+        if len(self._pending) >= self.max_pending_users:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        # flush som khi buffer day, chi 1 task cung luc
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self.flush())
+
+    def _merge_back(self, pending: dict):
+        # ghi that bai -> tra lai buffer, giu nguong/ten kenh moi hon neu da co
+        for key, old_entry in pending.items():
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = old_entry
+                continue
+            for activity_type in ('message', 'reaction'):
+                hits_key = f'{activity_type}_hits'
+                if entry[hits_key] == 0:
+                    entry[f'{activity_type}_rate'] = old_entry[f'{activity_type}_rate']
+                    entry[f'{activity_type}_item'] = old_entry[f'{activity_type}_item']
+                entry[hits_key] += old_entry[hits_key]
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+
+            rows = [
+                (
+                    user_id, guild_id,
+                    entry['message_hits'], entry['message_rate'], entry['message_item'],
+                    entry['reaction_hits'], entry['reaction_rate'], entry['reaction_item'],
+                    *entry['booster']
+                )
+                for (guild_id, user_id), entry in pending.items()
+            ]
+
+            if await db.apply_activity_batch(rows):
+                logging.debug(f"Da ghi hoat dong cua {len(rows)} user xuong database.")
+            else:
+                self._merge_back(pending)
+                logging.warning(f"Ghi hoat dong that bai, giu lai {len(pending)} user cho lan flush sau.")
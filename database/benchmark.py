@@ -0,0 +1,97 @@
+"""
+So sanh cau lenh thuong va prepared statement tren database postgres that (config.json).
+Chay: python -m database.benchmark [so_lan]
+Mo 1 ket noi psycopg2 rieng, khong qua init_db nen khong chay migration / tao partition:
+database phai da duoc bot migrate len schema hien tai.
+Moi lan goi deu ROLLBACK, ke ca cau lenh ghi (credit, apply_activity) nen khong de lai du lieu.
+Cau lenh ghi van giu khoa row cua user mau trong luc chay va lam nhay sequence transaction_id,
+nen chay luc it tai.
+"""
+import json
+import re
+import sys
+import time
+import logging
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from database import postgres as db
+from database.activity import activity_row
+
+def _plain_sql(name):
+    # $1, $2... -> %(p1)s, %(p2)s... de chay qua duong thuong cua psycopg2
+    return re.sub(r'\$(\d+)', r'%(p\1)s', db.PREPARED_STATEMENTS[name][1])
+
+def _plain_params(params):
+    return {f'p{i}': value for i, value in enumerate(params, start=1)}
+
+def _run(conn, query, params=()):
+    # chay roi rollback: doc hay ghi deu khong de lai gi
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            return cur.fetchall() if cur.description else None
+    finally:
+        conn.rollback()
+
+def _prepare(conn, name):
+    # PREPARE khong thuoc transaction, rollback khong xoa
+    param_types, sql = db.PREPARED_STATEMENTS[name]
+    with conn.cursor() as cur:
+        cur.execute(f"PREPARE {name} ({', '.join(param_types)}) AS {sql}")
+    conn.commit()
+
+def _time_calls(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+def _planning_ms(conn, query, params):
+    plan = _run(conn, f"EXPLAIN (ANALYZE, FORMAT JSON) {query}", params)
+    return plan[0]['QUERY PLAN'][0]['Planning Time'] if plan else float('nan')
+
+def run(conn, iterations: int):
+    sample = _run(conn, "SELECT user_id, guild_id FROM users LIMIT 1")
+    if not sample:
+        print("Bang users trong, khong co du lieu de benchmark.")
+        return
+    user_id, guild_id = sample[0]['user_id'], sample[0]['guild_id']
+    activity = activity_row(user_id, guild_id, 'message', 1, 'benchmark', {})
+    cases = {
+        'get_user': (user_id, guild_id),
+        'get_shop_roles': (guild_id,),
+        # cap nhat so du + ghi log gd
+        'credit': (user_id, guild_id, 1, 'benchmark', None),
+        # cap nhat counter + cong coin + ghi log gd (lo 1 user)
+        'apply_activity': tuple([value] for value in activity),
+    }
+
+    print(f"{'statement':<16}{'thuong (us)':>14}{'prepared (us)':>16}{'tiet kiem':>12}{'plan thuong':>14}{'plan prepared':>16}")
+    for name, params in cases.items():
+        plain_sql, plain_params = _plain_sql(name), _plain_params(params)
+        placeholders = ', '.join(['%s'] * len(params))
+        prepared_sql = f"EXECUTE {name} ({placeholders})"
+        _prepare(conn, name)
+        # lam nong: de postgres chon generic plan cho prepared statement (sau 5 lan)
+        for _ in range(10):
+            _run(conn, plain_sql, plain_params)
+            _run(conn, prepared_sql, params)
+
+        plain_us = _time_calls(lambda: _run(conn, plain_sql, plain_params), iterations)
+        prepared_us = _time_calls(lambda: _run(conn, prepared_sql, params), iterations)
+        plain_plan = _planning_ms(conn, plain_sql, plain_params)
+        prepared_plan = _planning_ms(conn, prepared_sql, params)
+        print(
+            f"{name:<16}{plain_us:>14.1f}{prepared_us:>16.1f}{plain_us - prepared_us:>12.1f}"
+            f"{plain_plan:>12.3f}ms{prepared_plan:>14.3f}ms"
+        )
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    with open('config.json', 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    conn = psycopg2.connect(config['DATABASE_URL'], cursor_factory=RealDictCursor)
+    try:
+        run(conn, int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
+    finally:
+        conn.close()
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    Cache LRU co TTL, thread-safe vi duoc goi tu ca event loop lan cac db thread.
+    Value la dict, luon tra ve ban copy de caller khong sua truc tiep vao cache.
+    Lan nap cache (write_token -> doc db -> set_if_unchanged) chi bi bo khi chinh key do bi ghi xen giua.
+    """
+    def __init__(self, maxsize: int = 10000, ttl: float = 30.0, write_window: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # tang moi lan ghi; _writes: key -> (seq, luc ghi) cua lan ghi cuoi, giu write_window giay
+        # (lau hon moi lan doc db) de bo lan nap cu cua dung key do
+        self._write_seq = 0
+        self.write_window = write_window
+        self._writes = OrderedDict()
+        # lan nap bat dau truoc cac moc nay khong kiem tra duoc -> bo
+        self._bulk_seq = 0 # invalidate_where / clear
+        self._pruned_seq = 0 # lan ghi da xoa khoi _writes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return dict(value)
+
+    def write_token(self):
+        # lay truoc khi doc db, dua lai cho set_if_unchanged sau khi doc xong
+        with self._lock:
+            return self._write_seq
+
+    def set_if_unchanged(self, key, value: dict, token: int):
+        with self._lock:
+            self._prune_writes()
+            last_write = self._writes.get(key)
+            if token < self._bulk_seq or token < self._pruned_seq or (last_write is not None and last_write[0] > token):
+                return False
+            self._store(key, value)
+            return True
+
+    def set(self, key, value: dict):
+        with self._lock:
+            self._record_write(key)
+            self._store(key, value)
+
+    def _record_write(self, key):
+        self._write_seq += 1
+        self._writes[key] = (self._write_seq, time.monotonic())
+        self._writes.move_to_end(key)
+        self._prune_writes()
+
+    def _prune_writes(self):
+        cutoff = time.monotonic() - self.write_window
+        while self._writes:
+            key, (seq, written_at) = next(iter(self._writes.items()))
+            if written_at >= cutoff:
+                break
+            del self._writes[key]
+            self._pruned_seq = max(self._pruned_seq, seq)
+
+    def _store(self, key, value: dict):
+        self._data[key] = (dict(value), time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def update(self, key, **fields):
+        # cap nhat field neu key dang co trong cache, khong thi bo qua
+        with self._lock:
+            self._record_write(key)
+            item = self._data.get(key)
+            if item is not None:
+                item[0].update(fields)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._record_write(key)
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        with self._lock:
+            self._write_seq += 1
+            self._bulk_seq = self._write_seq
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._write_seq += 1
+            self._bulk_seq = self._write_seq
+            self._writes.clear()
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0
+            }
@@ -0,0 +1,31 @@
+"""
+Bao cho bot biet config guild vua doi: (guild_id, version) -> on_change tren event loop cua bot.
+Postgres: trigger tren guild_configs goi pg_notify, PgConfigListener (pg_notify.py) LISTEN bang 1 ket noi rieng.
+sqlite / memory: update_guild_config goi LocalConfigNotifier.notify truc tiep.
+"""
+import asyncio
+
+CONFIG_CHANNEL = 'guild_config_changed'
+
+def parse_payload(payload: str):
+    # "<guild_id>:<version>"
+    guild_id, _, version = payload.partition(':')
+    return int(guild_id), int(version or 0)
+
+class LocalConfigNotifier:
+    def __init__(self):
+        self._loop = None
+        self._on_change = None
+
+    def start(self, on_change, on_reconnect=None):
+        self._loop = asyncio.get_running_loop()
+        self._on_change = on_change
+
+    def notify(self, guild_id: int, version: int):
+        # goi duoc tu db thread
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._on_change, guild_id, version)
+
+    async def stop(self):
+        self._loop = None
+        self._on_change = None
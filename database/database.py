@@ -1,293 +1,140 @@
-import psycopg2
-from psycopg2 import pool
-from psycopg2.extras import Json, RealDictCursor
+"""
+Lop truy cap du lieu cua bot. Cogs chi goi cac ham trong STORAGE_API qua module nay,
+backend that (postgres / memory / sqlite) chon bang DATABASE_BACKEND trong config.json.
+"""
+import importlib
 import logging
-import json
-from contextlib import contextmanager
-
-db_pool = None
-
-@contextmanager
-def get_db_connection():
-    # lay ket noi tu pool
-    if db_pool is None:
-        raise Exception("Database pool khong duoc khoi tao.")
-    conn = None
+from database.activity import booster_params
+from database.errors import DatabaseError
+from database.leaderboard import leaderboards
+from database.shop_catalog import shop_catalogs
+
+BACKENDS = {
+    'postgres': 'database.postgres',
+    'memory': 'database.memory',
+    'sqlite': 'database.sqlite',
+}
+
+# ham moi backend phai co, tat ca la coroutine tru init/close/start_ledger_writer/start_config_listener/*_stats
+STORAGE_API = (
+    # vong doi
+    'close_db', 'start_ledger_writer', 'close_ledger_writer', 'get_user_cache_stats', 'get_pool_stats',
+    # users
+    'get_or_create_user', 'update_user_data', 'earn_activity', 'apply_activity_batch',
+    'get_boosted_users', 'sync_real_boosts', 'get_top_users', 'get_user_rank', 'get_guild_users', 'get_user_profile',
+    'try_debit', 'credit', 'set_balance',
+    # shop role / custom role
+    'add_role_to_shop', 'remove_role_from_shop', 'get_shop_roles',
+    'get_custom_role', 'get_all_custom_roles_for_guild', 'get_ineligible_custom_roles', 'add_or_update_custom_role', 'delete_custom_role_data',
+    # guild config
+    'get_all_guild_configs', 'get_guild_config', 'update_guild_config', 'set_guild_config_path', 'update_guild_configs',
+    'get_versioned_guild_config', 'get_guild_config_versions', 'start_config_listener', 'stop_config_listener',
+    # hang doi DM
+    'enqueue_dm', 'claim_due_dms', 'delete_dm', 'reschedule_dm', 'get_dm_closed_users', 'set_dm_closed',
+    # ledger
+    'log_transaction', 'get_guild_transactions', 'get_user_transactions',
+    'get_guild_transactions_page', 'get_user_transactions_page', 'count_guild_transactions',
+    'maintain_transaction_partitions', 'wipe_guild_data',
+)
+
+backend = None
+
+def init_db(database_url: str = None, backend_name: str = 'postgres', **options):
+    # options la tham so rieng cua backend (vd: cache, pool cua postgres)
+    global backend
+    if backend_name not in BACKENDS:
+        raise ValueError(f"DATABASE_BACKEND khong hop le: {backend_name} (chon 1 trong {', '.join(BACKENDS)})")
+    module = importlib.import_module(BACKENDS[backend_name])
+    missing = [name for name in STORAGE_API if not hasattr(module, name)]
+    if missing:
+        raise NotImplementedError(f"Backend {backend_name} thieu ham: {', '.join(missing)}")
+    module.init_db(database_url, **options)
+    backend = module
+    logging.info(f"Dung database backend: {backend_name}")
+
+# Leaderboard Functions
+async def load_leaderboard(guild_id):
+    # nap BXH 1 guild vao bo nho, sau do moi ham ghi so du cua backend tu cap nhat
+    leaderboards.begin_load(guild_id)
+    rows = await backend.get_guild_users(guild_id)
+    if rows is None:
+        # doc db loi -> bo BXH do dang, get_top_users tiep tuc doc db
+        leaderboards.discard(guild_id)
+        logging.error(f"Nap BXH guild {guild_id} vao bo nho that bai.")
+        return False
+    leaderboards.load(guild_id, rows)
+    logging.info(f"Da nap BXH guild {guild_id} ({len(rows)} user) vao bo nho.")
+    return True
+
+async def get_top_users(guild_id, limit=20):
+    # doc tu BXH trong bo nho, guild chua nap thi xuong db
+    top = leaderboards.top(guild_id, limit)
+    if top is not None:
+        return top
+    return await backend.get_top_users(guild_id, limit)
+
+async def get_user_rank(user_id, guild_id, radius=2):
+    # hang cua user + radius nguoi tren/duoi; BXH trong bo nho truoc, chua nap thi xuong db
+    # (ban db dem so user dung truoc, ton O(hang) - xem USER_RANK_QUERY)
+    result = leaderboards.around(guild_id, user_id, radius)
+    if result is not None:
+        return result
+    return await backend.get_user_rank(user_id, guild_id, radius)
+
+# Shop Catalog Functions
+async def get_shop_catalog(guild_id):
+    # catalog shop trong bo nho, nap tu db lan dau hoac sau khi bi invalidate. None neu doc db loi
+    catalog = shop_catalogs.get(guild_id)
+    if catalog is not None:
+        return catalog
+    # shop doi trong luc doc db -> ban doc khong duoc luu, doc lai 1 lan
+    for _ in range(2):
+        generation = shop_catalogs.begin_load(guild_id)
+        rows = await backend.get_shop_roles(guild_id)
+        if rows is None:
+            return None
+        catalog = shop_catalogs.store(guild_id, rows, generation)
+        if catalog.version:
+            break
+    return catalog
+
+async def get_shop_roles(guild_id):
+    # danh sach role theo thu tu hien thi, doc tu catalog
+    catalog = await get_shop_catalog(guild_id)
+    return list(catalog.roles) if catalog is not None else None
+
+def peek_shop_catalog(guild_id):
+    # catalog da nap hoac None, khong doc db
+    return shop_catalogs.peek(guild_id)
+
+def invalidate_shop_catalog(guild_id):
+    shop_catalogs.invalidate(guild_id)
+
+def get_shop_catalog_stats():
+    return dict(shop_catalogs.stats)
+
+async def add_role_to_shop(role_id, guild_id, price, creator_id=None, creation_price=None):
     try:
-        conn = db_pool.getconn()
-        yield conn
+        return await backend.add_role_to_shop(role_id, guild_id, price, creator_id=creator_id, creation_price=creation_price)
     finally:
-        if conn:
-            db_pool.putconn(conn) # tra ket noi ve pool
-
-def init_db(database_url: str):
-    global db_pool
-    try:
-        db_pool = psycopg2.pool.SimpleConnectionPool(1, 20, dsn=database_url)
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                # tao bang neu chua co
-                cur.execute('''
-                    CREATE TABLE IF NOT EXISTS users (
-                        user_id BIGINT NOT NULL,
-                        guild_id BIGINT NOT NULL,
-                        balance BIGINT DEFAULT 0,
-                        message_count INTEGER DEFAULT 0,
-                        reaction_count INTEGER DEFAULT 0,
-                        fake_boosts INTEGER DEFAULT 0,
-                        PRIMARY KEY (user_id, guild_id)
-                    )
-                ''')
-                cur.execute('''
-                    CREATE TABLE IF NOT EXISTS shop_roles (
-                        role_id BIGINT PRIMARY KEY,
-                        guild_id BIGINT NOT NULL,
-                        price INTEGER NOT NULL,
-                        creator_id BIGINT,
-                        creation_price INTEGER
-                    )
-                ''')
-                cur.execute('''
-                    CREATE TABLE IF NOT EXISTS custom_roles (
-                        user_id BIGINT NOT NULL,
-                        guild_id BIGINT NOT NULL,
-                        role_id BIGINT NOT NULL,
-                        role_name TEXT,
-                        role_color TEXT,
-                        PRIMARY KEY (user_id, guild_id)
-                    )
-                ''')
-                cur.execute('''
-                    CREATE TABLE IF NOT EXISTS guild_configs (
-                        guild_id BIGINT PRIMARY KEY,
-                        config_data JSONB
-                    )
-                ''')
-                cur.execute('''
-                    CREATE TABLE IF NOT EXISTS transactions (
-                        transaction_id SERIAL PRIMARY KEY,
-                        guild_id BIGINT NOT NULL,
-                        user_id BIGINT NOT NULL,
-                        transaction_type TEXT NOT NULL,
-                        item_name TEXT,
-                        amount_changed BIGINT NOT NULL,
-                        new_balance BIGINT NOT NULL,
-                        timestamp TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
-                # kiem tra & them cot moi vao bang custom_roles
-                cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'custom_roles'")
-                existing_custom_cols = [row[0] for row in cur.fetchall()]
-                
-                custom_cols_to_add = {
-                    'role_style': 'TEXT', 'gradient_color_1': 'TEXT', 'gradient_color_2': 'TEXT'
-                }
-                for col, col_type in custom_cols_to_add.items():
-                    if col not in existing_custom_cols:
-                        cur.execute(f"ALTER TABLE custom_roles ADD COLUMN {col} {col_type}")
-
-                # kiem tra & them cot moi vao bang shop_roles
-                cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'shop_roles'")
-                existing_shop_cols = [row[0] for row in cur.fetchall()]
-                shop_cols_to_add = {
-                    'creator_id': 'BIGINT', 'creation_price': 'INTEGER'
-                }
-                for col, col_type in shop_cols_to_add.items():
-                    if col not in existing_shop_cols:
-                        cur.execute(f"ALTER TABLE shop_roles ADD COLUMN {col} {col_type}")
-
-                # kiem tra & them cot real_boosts vao bang users
-                cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'users'")
-                existing_user_cols = [row[0] for row in cur.fetchall()]
-                if 'real_boosts' not in existing_user_cols:
-                    cur.execute("ALTER TABLE users ADD COLUMN real_boosts INTEGER DEFAULT 0")
-
-
-                conn.commit()
-        logging.info("Database PostgreSQL khoi tao thanh cong.")
-    except Exception as e:
-        logging.error(f"Loi khoi tao database: {e}")
+        shop_catalogs.invalidate(guild_id)
 
-def execute_query(query, params=(), fetch=None):
+async def remove_role_from_shop(role_id, guild_id):
     try:
-        with get_db_connection() as conn:
-            # dung RealDictCursor de tu dong tra ve dict
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(query, params)
-                
-                if fetch == 'one':
-                    return cur.fetchone()
-                elif fetch == 'all':
-                    return cur.fetchall()
-                else:
-                    conn.commit()
-                    return None
-    except Exception as e:
-        logging.error(f"Query that bai: {e}")
-        return None
+        return await backend.remove_role_from_shop(role_id, guild_id)
+    finally:
+        shop_catalogs.invalidate(guild_id)
 
-def wipe_guild_data(guild_id):
-    # ham xoa toan bo du lieu cua 1 guild
-    role_ids_to_delete = set()
+async def wipe_guild_data(guild_id):
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                # lay va xoa custom roles
-                cur.execute("DELETE FROM custom_roles WHERE guild_id = %s RETURNING role_id", (guild_id,))
-                deleted_custom_roles = cur.fetchall()
-                for role in deleted_custom_roles:
-                    role_ids_to_delete.add(role[0])
-                
-                # lay va xoa shop roles
-                cur.execute("DELETE FROM shop_roles WHERE guild_id = %s RETURNING role_id", (guild_id,))
-                deleted_shop_roles = cur.fetchall()
-                for role in deleted_shop_roles:
-                    role_ids_to_delete.add(role[0])
-
-                # xoa users va transactions
-                cur.execute("DELETE FROM users WHERE guild_id = %s", (guild_id,))
-                cur.execute("DELETE FROM transactions WHERE guild_id = %s", (guild_id,))
-                
-                conn.commit()
-        
-        logging.info(f"Da xoa toan bo du lieu database cho guild {guild_id}.")
-        return list(role_ids_to_delete)
-    except Exception as e:
-        logging.error(f"Loi khi xoa du lieu guild {guild_id}: {e}")
-        return []
-
-
-# User Functions
-def get_or_create_user(user_id, guild_id):
-    user = execute_query("SELECT * FROM users WHERE user_id = %s AND guild_id = %s", (user_id, guild_id), fetch='one')
-    if not user:
-        execute_query("INSERT INTO users (user_id, guild_id) VALUES (%s, %s) ON CONFLICT(user_id, guild_id) DO NOTHING", (user_id, guild_id))
-        user = execute_query("SELECT * FROM users WHERE user_id = %s AND guild_id = %s", (user_id, guild_id), fetch='one')
-    return user
-
-def update_user_data(user_id, guild_id, **kwargs):
-    fields = ', '.join([f'{key} = %s' for key in kwargs])
-    values = list(kwargs.values())
-    values.extend([user_id, guild_id])
-    query = f"UPDATE users SET {fields} WHERE user_id = %s AND guild_id = %s"
-    execute_query(query, tuple(values))
-
-def get_top_users(guild_id, limit=20):
-    query = "SELECT user_id, balance FROM users WHERE guild_id = %s ORDER BY balance DESC LIMIT %s"
-    return execute_query(query, (guild_id, limit), fetch='all')
-
-def get_guild_users(guild_id):
-    # lay all user trong guild tu db
-    query = "SELECT user_id, balance FROM users WHERE guild_id = %s ORDER BY user_id"
-    return execute_query(query, (guild_id,), fetch='all')
-
-def get_user_profile(user_id, guild_id):
-    # lay profile chi tiet
-    query = """
-    SELECT u.*, cr.role_id, cr.role_name, cr.role_color, cr.role_style, cr.gradient_color_1, cr.gradient_color_2
-    FROM users u
-    LEFT JOIN custom_roles cr ON u.user_id = cr.user_id AND u.guild_id = cr.guild_id
-    WHERE u.user_id = %s AND u.guild_id = %s;
-    """
-    return execute_query(query, (user_id, guild_id), fetch='one')
-
-
-# Shop Role Functions
-def add_role_to_shop(role_id, guild_id, price, creator_id=None, creation_price=None):
-    query = """
-    INSERT INTO shop_roles (role_id, guild_id, price, creator_id, creation_price) VALUES (%s, %s, %s, %s, %s)
-    ON CONFLICT (role_id) DO UPDATE SET
-        guild_id = EXCLUDED.guild_id,
-        price = EXCLUDED.price,
-        creator_id = EXCLUDED.creator_id,
-        creation_price = EXCLUDED.creation_price;
-    """
-    execute_query(query, (role_id, guild_id, price, creator_id, creation_price))
-
-def remove_role_from_shop(role_id, guild_id):
-    execute_query("DELETE FROM shop_roles WHERE role_id = %s AND guild_id = %s", (role_id, guild_id))
-
-def get_shop_roles(guild_id):
-    return execute_query("SELECT * FROM shop_roles WHERE guild_id = %s ORDER BY price ASC", (guild_id,), fetch='all')
-
-# Custom Role Functions
-def get_custom_role(user_id, guild_id):
-    return execute_query("SELECT * FROM custom_roles WHERE user_id = %s AND guild_id = %s", (user_id, guild_id), fetch='one')
-
-def get_all_custom_roles_for_guild(guild_id):
-    return execute_query("SELECT user_id, role_id FROM custom_roles WHERE guild_id = %s", (guild_id,), fetch='all')
-
-def add_or_update_custom_role(user_id, guild_id, role_id, role_name, role_color, role_style=None, color1=None, color2=None):
-    query = """
-    INSERT INTO custom_roles (user_id, guild_id, role_id, role_name, role_color, role_style, gradient_color_1, gradient_color_2) 
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    ON CONFLICT (user_id, guild_id) DO UPDATE SET
-        role_id = EXCLUDED.role_id,
-        role_name = EXCLUDED.role_name,
-        role_color = EXCLUDED.role_color,
-        role_style = EXCLUDED.role_style,
-        gradient_color_1 = EXCLUDED.gradient_color_1,
-        gradient_color_2 = EXCLUDED.gradient_color_2;
-    """
-    execute_query(query, (user_id, guild_id, role_id, role_name, role_color, role_style, color1, color2))
-
-def delete_custom_role_data(user_id, guild_id):
-    execute_query("DELETE FROM custom_roles WHERE user_id = %s AND guild_id = %s", (user_id, guild_id))
-
-# Guild Config Functions
-def get_all_guild_configs():
-    configs_list = execute_query("SELECT guild_id, config_data FROM guild_configs", fetch='all')
-    config_map = {}
-    if configs_list:
-        for config_row in configs_list:
-            guild_id_str = str(config_row['guild_id'])
-            config_map[guild_id_str] = config_row.get('config_data', {})
-    return config_map
-
-def get_guild_config(guild_id: int):
-    # Lay config cho 1 guild
-    row = execute_query("SELECT config_data FROM guild_configs WHERE guild_id = %s", (guild_id,), fetch='one')
-    return row.get('config_data', {}) if row else None
-
-def update_guild_config(guild_id: int, updates: dict):
-    # ham cap nhat an toan
-    if not updates:
-        return
-        
-    current_config = get_guild_config(guild_id)
-    if current_config is None:
-        current_config = {}
-    
-    # merge
-    current_config.update(updates)
-
-    # update lai vao db
-    query = """
-        INSERT INTO guild_configs (guild_id, config_data)
-        VALUES (%s, %s)
-        ON CONFLICT (guild_id)
-        DO UPDATE SET config_data = EXCLUDED.config_data;
-    """
-    execute_query(query, (guild_id, Json(current_config)))
-
-
-# Transaction Log Functions
-def log_transaction(guild_id, user_id, transaction_type, item_name, amount_changed, new_balance):
-    query = """
-    INSERT INTO transactions (guild_id, user_id, transaction_type, item_name, amount_changed, new_balance)
-    VALUES (%s, %s, %s, %s, %s, %s)
-    """
-    execute_query(query, (guild_id, user_id, transaction_type, item_name, amount_changed, new_balance))
-
-def get_guild_transactions(guild_id, limit=50, offset=0):
-    query = "SELECT * FROM transactions WHERE guild_id = %s ORDER BY timestamp DESC LIMIT %s OFFSET %s"
-    return execute_query(query, (guild_id, limit, offset), fetch='all')
-
-def get_user_transactions(guild_id, user_id, limit=50, offset=0):
-    query = "SELECT * FROM transactions WHERE guild_id = %s AND user_id = %s ORDER BY timestamp DESC LIMIT %s OFFSET %s"
-    return execute_query(query, (guild_id, user_id, limit, offset), fetch='all')
-
-def count_guild_transactions(guild_id):
-    result = execute_query("SELECT COUNT(*) as total FROM transactions WHERE guild_id = %s", (guild_id,), fetch='one')
-    return result['total'] if result else 0
\ No newline at end of file
+        return await backend.wipe_guild_data(guild_id)
+    finally:
+        shop_catalogs.invalidate(guild_id)
+
+def __getattr__(name):
+    # db.get_shop_roles(...) -> backend.get_shop_roles(...)
+    if name in STORAGE_API:
+        if backend is None:
+            raise Exception("Database chua duoc khoi tao (goi init_db truoc).")
+        return getattr(backend, name)
+    raise AttributeError(f"module 'database.database' has no attribute '{name}'")
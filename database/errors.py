@@ -0,0 +1,3 @@
+class DatabaseError(Exception):
+    # loi db (mat ket noi, query that bai...), de caller phan biet voi ket qua rong (None)
+    pass
@@ -0,0 +1,231 @@
+import math
+import random
+import threading
+
+class _Max:
+    # sentinel lon hon moi key, dung cho node cuoi cua skip list
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+_MAX = _Max()
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level
+
+class RankedSkipList:
+    """
+    Skip list co dem do rong moi link: insert/remove/rank/lay theo vi tri deu O(log n).
+    Key phai la duy nhat va so sanh duoc voi nhau.
+    """
+    def __init__(self, max_levels: int = 24):
+        self.max_levels = max_levels
+        self._tail = _Node(_MAX, 0)
+        self._head = _Node(None, max_levels)
+        self._head.next = [self._tail] * max_levels
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _random_level(self):
+        return min(self.max_levels, 1 - int(math.log(1.0 - random.random(), 2.0)))
+
+    def insert(self, key):
+        chain = [None] * self.max_levels
+        steps_at_level = [0] * self.max_levels
+        node = self._head
+        for level in reversed(range(self.max_levels)):
+            while node.next[level].key < key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        height = self._random_level()
+        new_node = _Node(key, height)
+        steps = 0
+        for level in range(height):
+            prev = chain[level]
+            new_node.next[level] = prev.next[level]
+            prev.next[level] = new_node
+            new_node.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(height, self.max_levels):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain = [None] * self.max_levels
+        node = self._head
+        for level in reversed(range(self.max_levels)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target is self._tail or target.key != key:
+            raise KeyError(key)
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), self.max_levels):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def rank(self, key) -> int:
+        # so key nho hon key (vi tri 0-based neu key co trong list)
+        position = 0
+        node = self._head
+        for level in reversed(range(self.max_levels)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def slice(self, start: int, count: int):
+        # count key lien tiep bat dau tu vi tri start
+        if start < 0 or start >= self.size or count <= 0:
+            return []
+        node = self._head
+        remaining = start + 1
+        for level in reversed(range(self.max_levels)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        keys = []
+        while node is not self._tail and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+class GuildLeaderboard:
+    # key = (-balance, user_id) nen thu tu tang dan cua skip list la thu tu BXH
+    def __init__(self):
+        self.ranking = RankedSkipList()
+        self.balances = {}
+        self.versions = {}
+        self.loaded = False
+
+    def set(self, user_id, balance, version=None):
+        # version: balance_version cua row, cap nhat cu hon ban dang giu thi bo qua
+        if version is not None:
+            current = self.versions.get(user_id)
+            if current is not None and version <= current:
+                return
+            self.versions[user_id] = version
+        old = self.balances.get(user_id)
+        if old == balance:
+            return
+        if old is not None:
+            self.ranking.remove((-old, user_id))
+        self.ranking.insert((-balance, user_id))
+        self.balances[user_id] = balance
+
+class Leaderboards:
+    """
+    BXH trong bo nho cho tung guild, nap 1 lan tu db roi cap nhat tu moi ham ghi so du.
+    Guild chua nap xong thi top()/around() tra ve None de caller doc db.
+    BXH chi nhat quan dan (eventually consistent): cap nhat den sau commit, tu nhieu db thread.
+    Backend truyen version (balance_version) thi cap nhat den tre hon ban da ghi bi bo qua.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._boards = {}
+
+    def begin_load(self, guild_id):
+        # ghi so du trong luc dang doc db van duoc ghi nhan, load() khong de len
+        with self._lock:
+            self._boards[guild_id] = GuildLeaderboard()
+
+    def load(self, guild_id, rows):
+        with self._lock:
+            board = self._boards.setdefault(guild_id, GuildLeaderboard())
+            for row in rows:
+                if row['user_id'] not in board.balances:
+                    board.set(row['user_id'], row['balance'] or 0, row.get('balance_version'))
+            board.loaded = True
+
+    def discard(self, guild_id):
+        with self._lock:
+            self._boards.pop(guild_id, None)
+
+    def is_loaded(self, guild_id) -> bool:
+        board = self._boards.get(guild_id)
+        return board is not None and board.loaded
+
+    def update(self, guild_id, user_id, balance, version=None):
+        with self._lock:
+            board = self._boards.get(guild_id)
+            if board is not None:
+                board.set(user_id, balance or 0, version)
+
+    def add_if_missing(self, guild_id, user_id, balance, version=None):
+        # user moi tao: chi them neu chua co, khong de len so du moi hon
+        with self._lock:
+            board = self._boards.get(guild_id)
+            if board is not None and user_id not in board.balances:
+                board.set(user_id, balance or 0, version)
+
+    def clear_guild(self, guild_id):
+        with self._lock:
+            board = self._boards.get(guild_id)
+            if board is not None:
+                loaded = board.loaded
+                board = self._boards[guild_id] = GuildLeaderboard()
+                board.loaded = loaded
+
+    def around(self, guild_id, user_id, radius: int = 2):
+        """
+        Hang cua user + radius nguoi tren/duoi. Tra ve dict (rank, total, neighbours)
+        hoac None neu guild chua nap / user chua co trong BXH.
+        """
+        with self._lock:
+            board = self._boards.get(guild_id)
+            if board is None or not board.loaded or user_id not in board.balances:
+                return None
+            position = board.ranking.rank((-board.balances[user_id], user_id))
+            start = max(0, position - radius)
+            keys = board.ranking.slice(start, position - start + radius + 1)
+            return {
+                'rank': position + 1,
+                'total': len(board.ranking),
+                'neighbours': [
+                    {'rank': start + i + 1, 'user_id': uid, 'balance': -neg} for i, (neg, uid) in enumerate(keys)
+                ]
+            }
+
+    def top(self, guild_id, limit: int = 20):
+        with self._lock:
+            board = self._boards.get(guild_id)
+            if board is None or not board.loaded:
+                return None
+            return [{'user_id': user_id, 'balance': -neg} for neg, user_id in board.ranking.slice(0, limit)]
+
+def rank_window(rows, user_id):
+    """
+    Chuyen ket qua query BXH quanh 1 user thanh dict giong Leaderboards.around().
+    rows: user tren/duoi + chinh user, sap xep theo BXH, moi row co them position
+    (so user dung truoc) va total.
+    """
+    index = next((i for i, row in enumerate(rows) if row['user_id'] == user_id), None)
+    if index is None:
+        return None
+    rank = rows[index]['position'] + 1
+    return {
+        'rank': rank,
+        'total': rows[index]['total'],
+        'neighbours': [
+            {'rank': rank - index + i, 'user_id': row['user_id'], 'balance': row['balance']} for i, row in enumerate(rows)
+        ]
+    }
+
+leaderboards = Leaderboards()
@@ -0,0 +1,149 @@
+import asyncio
+import csv
+import logging
+from datetime import datetime
+
+class LedgerWriter:
+    """
+    Hang doi ghi log gd: gom row va ghi 1 lan (COPY) khi du max_batch hoac sau flush_interval giay.
+    Hang doi day thi put() phai cho (back-pressure), close() ghi het phan con lai.
+    Lo ghi that bai max_attempts lan duoc ghi them vao file dead_letter_path (csv) thay vi bo.
+    Task ghi dung bat thuong thi row con lai va row put() sau do cung vao dead_letter_path, khong treo caller.
+    """
+    def __init__(self, write_batch, max_batch: int = 1000, flush_interval: float = 5.0, max_queue: int = 50000, max_attempts: int = 3,
+                 dead_letter_path: str = None):
+        # write_batch: coroutine nhan list row, tra ve True neu ghi thanh cong
+        self._write_batch = write_batch
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.dead_letter_path = dead_letter_path
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+        self._inflight = [] # lo dang gom / dang ghi, de khong mat khi task chet giua chung
+        self.closed = False
+        self.rows_written = 0
+        self.rows_dead_lettered = 0
+        self.rows_dropped = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            self._task.add_done_callback(self._on_task_done)
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def _on_task_done(self, task):
+        if self.closed:
+            return
+        error = task.exception() if not task.cancelled() else 'bi huy'
+        logging.error(f"Ledger writer dung bat thuong: {error}. Log gd con lai se ghi vao {self.dead_letter_path}.")
+        self._spill(self._inflight + self._drain())
+        self._inflight = []
+
+    @property
+    def queued(self):
+        return self._queue.qsize()
+
+    async def put(self, row: tuple):
+        if self._task is not None and not self.running:
+            await asyncio.to_thread(self._spill, [row])
+            return
+        await self._queue.put(row)
+
+    def _drain(self) -> list:
+        rows = []
+        while not self._queue.empty():
+            row = self._queue.get_nowait()
+            if row is not None:
+                rows.append(row)
+        return rows
+
+    def _spill(self, rows: list):
+        # ghi thang ra file khi khong con task ghi db
+        if not rows:
+            return
+        if self.dead_letter_path and self._dead_letter(rows):
+            self.rows_dead_lettered += len(rows)
+        else:
+            self.rows_dropped += len(rows)
+            logging.error(f"Bo {len(rows)} log gd do ledger writer da dung.")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            row = await self._queue.get()
+            if row is None:
+                break
+            batch = self._inflight = [row]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            await self._write(batch)
+            self._inflight = []
+
+        # ghi not phan con lai sau tin hieu dung
+        remaining = self._inflight = self._drain()
+        while remaining:
+            await self._write(remaining[:self.max_batch])
+            del remaining[:self.max_batch]
+
+    async def _write(self, batch: list):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                written = await self._write_batch(batch)
+            except Exception as e:
+                # vd: db executor da tat -> tinh la 1 lan that bai, van thu lai / dead letter
+                logging.error(f"Ghi {len(batch)} log gd loi: {e}")
+                written = False
+            if written:
+                self.rows_written += len(batch)
+                return
+            logging.warning(f"Ghi {len(batch)} log gd that bai (lan {attempt}/{self.max_attempts}).")
+            if attempt < self.max_attempts:
+                await asyncio.sleep(2 ** attempt)
+        if self.dead_letter_path and await asyncio.to_thread(self._dead_letter, batch):
+            self.rows_dead_lettered += len(batch)
+            logging.error(f"Ghi {len(batch)} log gd vao {self.dead_letter_path} sau {self.max_attempts} lan ghi db that bai.")
+            return
+        self.rows_dropped += len(batch)
+        logging.error(f"Bo {len(batch)} log gd sau {self.max_attempts} lan ghi that bai.")
+
+    def _dead_letter(self, batch: list) -> bool:
+        try:
+            with open(self.dead_letter_path, 'a', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                for row in batch:
+                    writer.writerow([value.isoformat() if isinstance(value, datetime) else value for value in row])
+            return True
+        except OSError as e:
+            logging.error(f"Khong the ghi log gd vao {self.dead_letter_path}: {e}")
+            return False
+
+    async def close(self):
+        if self._task is None or self.closed:
+            return
+        self.closed = True
+        try:
+            if self.running:
+                await self._queue.put(None)
+                await self._task
+        except Exception as e:
+            logging.error(f"Ledger writer loi khi dung: {e}")
+        finally:
+            self._spill(self._inflight + self._drain())
+            self._inflight = []
+            self._task = None
@@ -0,0 +1,430 @@
+"""
+Backend luu toan bo du lieu trong RAM, khong can database. Dung cho test, CI va load test
+cac luong cua cogs; du lieu mat khi tat bot.
+"""
+import copy
+import threading
+import itertools
+from datetime import datetime, timedelta, timezone
+from database.activity import activity_row, compute_activity, earn_ledger_entries
+from database.partitions import current_month, retention_cutoff
+from database.leaderboard import leaderboards, rank_window
+from database.config_notify import LocalConfigNotifier
+
+USER_DEFAULTS = {'balance': 0, 'message_count': 0, 'reaction_count': 0, 'fake_boosts': 0, 'real_boosts': 0}
+CUSTOM_ROLE_FIELDS = ('role_id', 'role_name', 'role_color', 'role_style', 'gradient_color_1', 'gradient_color_2')
+
+# 1 lock cho moi bang: moi ham la 1 "transaction" nguyen tu nhu ban postgres
+_lock = threading.Lock()
+users = {} # (guild_id, user_id) -> row
+shop_roles = {} # role_id -> row
+custom_roles = {} # (guild_id, user_id) -> row
+guild_configs = {} # guild_id -> dict
+guild_config_versions = {} # guild_id -> version, tang moi lan update_guild_config
+config_notifier = LocalConfigNotifier()
+transactions = [] # row theo thu tu ghi
+transaction_daily_summary = {} # (guild_id, user_id, day, transaction_type) -> row
+dm_outbox = {} # id -> row
+dm_closed_users = {} # user_id -> closed_at
+_transaction_ids = itertools.count(1)
+_dm_ids = itertools.count(1)
+
+def init_db(database_url: str = None, **options):
+    # database_url va tham so cache/pool cua postgres bi bo qua
+    with _lock:
+        for table in (users, shop_roles, custom_roles, guild_configs, guild_config_versions, transaction_daily_summary, dm_outbox, dm_closed_users):
+            table.clear()
+        transactions.clear()
+
+def close_db():
+    pass
+
+def start_ledger_writer(**options):
+    # log gd ghi thang vao list, khong can hang doi
+    pass
+
+async def close_ledger_writer():
+    pass
+
+def get_user_cache_stats():
+    return None
+
+def get_pool_stats():
+    return None
+
+def _copy(row):
+    return copy.deepcopy(row) if row is not None else None
+
+def _user(user_id, guild_id):
+    # tao row neu chua co, phai giu _lock
+    key = (guild_id, user_id)
+    row = users.get(key)
+    if row is None:
+        row = users[key] = {'user_id': user_id, 'guild_id': guild_id, **USER_DEFAULTS}
+        leaderboards.add_if_missing(guild_id, user_id, row['balance'])
+    return row
+
+def _insert_transaction(guild_id, user_id, transaction_type, item_name, amount_changed, new_balance, timestamp=None):
+    transactions.append({
+        'transaction_id': next(_transaction_ids),
+        'guild_id': guild_id, 'user_id': user_id,
+        'transaction_type': transaction_type, 'item_name': item_name,
+        'amount_changed': amount_changed, 'new_balance': new_balance,
+        'timestamp': timestamp or datetime.now(timezone.utc)
+    })
+
+# User Functions
+async def get_or_create_user(user_id, guild_id):
+    with _lock:
+        return _copy(_user(user_id, guild_id))
+
+async def update_user_data(user_id, guild_id, **kwargs):
+    with _lock:
+        row = users.get((guild_id, user_id))
+        if row is not None:
+            row.update(kwargs)
+            if 'balance' in kwargs:
+                leaderboards.update(guild_id, user_id, row['balance'])
+
+def _apply_activity(rows):
+    results = []
+    with _lock:
+        for row in rows:
+            user = _user(row[0], row[1])
+            earned = compute_activity(user, row)
+            user['balance'] += earned['coins_earned']
+            user['message_count'] = earned['message_count']
+            user['reaction_count'] = earned['reaction_count']
+            leaderboards.update(user['guild_id'], user['user_id'], user['balance'])
+            result = {'user_id': user['user_id'], 'guild_id': user['guild_id'], 'balance': user['balance'], **earned}
+            for transaction_type, item_name, amount in earn_ledger_entries(result):
+                _insert_transaction(user['guild_id'], user['user_id'], transaction_type, item_name, amount, user['balance'])
+            results.append(result)
+    return results
+
+async def earn_activity(user_id, guild_id, activity_type, rate, item_name, booster_config: dict):
+    return _apply_activity([activity_row(user_id, guild_id, activity_type, rate, item_name, booster_config)])[0]
+
+async def apply_activity_batch(rows):
+    _apply_activity(rows)
+    return True
+
+async def get_boosted_users(guild_id):
+    with _lock:
+        return [
+            {'user_id': row['user_id'], 'real_boosts': row['real_boosts']}
+            for row in users.values() if row['guild_id'] == guild_id and (row['real_boosts'] or 0) > 0
+        ]
+
+async def sync_real_boosts(guild_id, boosts: dict):
+    changed = []
+    with _lock:
+        for user_id, count in boosts.items():
+            user = _user(user_id, guild_id)
+            if user['real_boosts'] != count:
+                user['real_boosts'] = count
+                changed.append(user_id)
+        for row in users.values():
+            if row['guild_id'] == guild_id and (row['real_boosts'] or 0) > 0 and row['user_id'] not in boosts:
+                row['real_boosts'] = 0
+                changed.append(row['user_id'])
+    return changed
+
+async def get_top_users(guild_id, limit=20):
+    with _lock:
+        rows = [row for row in users.values() if row['guild_id'] == guild_id]
+    rows.sort(key=lambda row: (-row['balance'], row['user_id']))
+    return [{'user_id': row['user_id'], 'balance': row['balance']} for row in rows[:limit]]
+
+async def get_user_rank(user_id, guild_id, radius=2):
+    with _lock:
+        rows = [(-row['balance'], row['user_id']) for row in users.values() if row['guild_id'] == guild_id]
+    rows.sort()
+    position = next((i for i, (_, uid) in enumerate(rows) if uid == user_id), None)
+    if position is None:
+        return None
+    start = max(0, position - radius)
+    window = [
+        {'user_id': uid, 'balance': -neg, 'position': position, 'total': len(rows)}
+        for neg, uid in rows[start:position + radius + 1]
+    ]
+    return rank_window(window, user_id)
+
+async def get_guild_users(guild_id):
+    with _lock:
+        rows = [{'user_id': row['user_id'], 'balance': row['balance']} for row in users.values() if row['guild_id'] == guild_id]
+    return sorted(rows, key=lambda row: row['user_id'])
+
+async def get_user_profile(user_id, guild_id):
+    with _lock:
+        user = users.get((guild_id, user_id))
+        if user is None:
+            return None
+        custom_role = custom_roles.get((guild_id, user_id)) or {}
+        return _copy({**user, **{field: custom_role.get(field) for field in CUSTOM_ROLE_FIELDS}})
+
+async def try_debit(user_id, guild_id, amount, transaction_type, item_name):
+    with _lock:
+        user = users.get((guild_id, user_id))
+        if user is None or user['balance'] < amount:
+            return None
+        user['balance'] -= amount
+        leaderboards.update(guild_id, user_id, user['balance'])
+        _insert_transaction(guild_id, user_id, transaction_type, item_name, -amount, user['balance'])
+        return user['balance']
+
+async def credit(user_id, guild_id, amount, transaction_type, item_name):
+    with _lock:
+        user = _user(user_id, guild_id)
+        user['balance'] += amount
+        leaderboards.update(guild_id, user_id, user['balance'])
+        _insert_transaction(guild_id, user_id, transaction_type, item_name, amount, user['balance'])
+        return user['balance']
+
+async def set_balance(user_id, guild_id, amount, transaction_type, item_name):
+    with _lock:
+        user = _user(user_id, guild_id)
+        old_balance, user['balance'] = user['balance'], amount
+        leaderboards.update(guild_id, user_id, amount)
+        _insert_transaction(guild_id, user_id, transaction_type, item_name, amount - old_balance, amount)
+        return amount
+
+# Shop Role Functions
+async def add_role_to_shop(role_id, guild_id, price, creator_id=None, creation_price=None):
+    with _lock:
+        shop_roles[role_id] = {
+            'role_id': role_id, 'guild_id': guild_id, 'price': price,
+            'creator_id': creator_id, 'creation_price': creation_price
+        }
+
+async def remove_role_from_shop(role_id, guild_id):
+    with _lock:
+        row = shop_roles.get(role_id)
+        if row and row['guild_id'] == guild_id:
+            del shop_roles[role_id]
+
+async def get_shop_roles(guild_id):
+    with _lock:
+        rows = [dict(row) for row in shop_roles.values() if row['guild_id'] == guild_id]
+    return sorted(rows, key=lambda row: row['price'])
+
+# Custom Role Functions
+async def get_custom_role(user_id, guild_id):
+    with _lock:
+        return _copy(custom_roles.get((guild_id, user_id)))
+
+async def get_all_custom_roles_for_guild(guild_id):
+    with _lock:
+        return [{'user_id': row['user_id'], 'role_id': row['role_id']} for row in custom_roles.values() if row['guild_id'] == guild_id]
+
+async def get_ineligible_custom_roles(guild_id, min_boosts, member_ids):
+    member_ids = set(member_ids)
+    rows = []
+    with _lock:
+        for row in custom_roles.values():
+            if row['guild_id'] != guild_id:
+                continue
+            user = users.get((guild_id, row['user_id'])) or USER_DEFAULTS
+            boost_count = user['fake_boosts'] or user['real_boosts'] or 0
+            left_guild = row['user_id'] not in member_ids
+            if left_guild or boost_count < min_boosts:
+                rows.append({'user_id': row['user_id'], 'role_id': row['role_id'], 'left_guild': left_guild})
+    return rows
+
+async def add_or_update_custom_role(user_id, guild_id, role_id, role_name, role_color, role_style=None, color1=None, color2=None):
+    with _lock:
+        custom_roles[(guild_id, user_id)] = {
+            'user_id': user_id, 'guild_id': guild_id, 'role_id': role_id, 'role_name': role_name,
+            'role_color': role_color, 'role_style': role_style, 'gradient_color_1': color1, 'gradient_color_2': color2
+        }
+
+async def delete_custom_role_data(user_id, guild_id):
+    with _lock:
+        custom_roles.pop((guild_id, user_id), None)
+
+# Guild Config Functions
+async def get_all_guild_configs():
+    with _lock:
+        return {str(guild_id): _copy(config) for guild_id, config in guild_configs.items()}
+
+async def get_guild_config(guild_id: int):
+    with _lock:
+        return _copy(guild_configs.get(guild_id))
+
+def _write_guild_config(guild_id, merge, expected_version=None):
+    # phai giu _lock
+    if guild_id in guild_configs and expected_version is not None and guild_config_versions.get(guild_id, 0) != expected_version:
+        return None
+    merge(guild_configs.setdefault(guild_id, {}))
+    version = guild_config_versions[guild_id] = guild_config_versions.get(guild_id, 0) + 1
+    return version
+
+async def update_guild_config(guild_id: int, updates: dict, expected_version: int = None):
+    if not updates:
+        return None
+    with _lock:
+        version = _write_guild_config(guild_id, lambda config: config.update(copy.deepcopy(updates)), expected_version)
+    if version is not None:
+        config_notifier.notify(guild_id, version)
+    return version
+
+def _set_path(config: dict, path: list, value):
+    for key in path[:-1]:
+        child = config.get(key)
+        if not isinstance(child, dict):
+            child = config[key] = {}
+        config = child
+    config[path[-1]] = value
+
+async def set_guild_config_path(guild_id: int, path, value, expected_version: int = None):
+    path = [str(key) for key in path]
+    if not path:
+        return None
+    with _lock:
+        version = _write_guild_config(guild_id, lambda config: _set_path(config, path, copy.deepcopy(value)), expected_version)
+    if version is not None:
+        config_notifier.notify(guild_id, version)
+    return version
+
+async def update_guild_configs(updates_by_guild: dict):
+    versions = {}
+    with _lock:
+        for guild_id, updates in updates_by_guild.items():
+            if updates:
+                versions[guild_id] = _write_guild_config(guild_id, lambda config: config.update(copy.deepcopy(updates)))
+    for guild_id, version in versions.items():
+        config_notifier.notify(guild_id, version)
+    return versions
+
+async def get_versioned_guild_config(guild_id: int):
+    with _lock:
+        if guild_id not in guild_configs:
+            return None
+        return _copy(guild_configs[guild_id]), guild_config_versions.get(guild_id, 0)
+
+async def get_guild_config_versions():
+    with _lock:
+        return dict(guild_config_versions)
+
+def start_config_listener(on_change, on_reconnect=None):
+    config_notifier.start(on_change, on_reconnect)
+
+async def stop_config_listener():
+    await config_notifier.stop()
+
+# DM Outbox Functions
+async def enqueue_dm(user_id, guild_id, payload: dict):
+    with _lock:
+        dm_id = next(_dm_ids)
+        now = datetime.now(timezone.utc)
+        dm_outbox[dm_id] = {
+            'id': dm_id, 'user_id': user_id, 'guild_id': guild_id, 'payload': copy.deepcopy(payload),
+            'attempts': 0, 'next_attempt_at': now, 'last_error': None, 'created_at': now
+        }
+    return dm_id
+
+async def claim_due_dms(limit=50, lease_seconds=300):
+    now = datetime.now(timezone.utc)
+    with _lock:
+        due = sorted((row for row in dm_outbox.values() if row['next_attempt_at'] <= now), key=lambda row: (row['next_attempt_at'], row['id']))[:limit]
+        for row in due:
+            row['attempts'] += 1
+            row['next_attempt_at'] = now + timedelta(seconds=lease_seconds)
+        return [_copy({key: row[key] for key in ('id', 'user_id', 'guild_id', 'payload', 'attempts')}) for row in due]
+
+async def delete_dm(dm_id):
+    with _lock:
+        dm_outbox.pop(dm_id, None)
+
+async def reschedule_dm(dm_id, delay_seconds, error=None):
+    with _lock:
+        row = dm_outbox.get(dm_id)
+        if row is not None:
+            row['next_attempt_at'] = datetime.now(timezone.utc) + timedelta(seconds=delay_seconds)
+            row['last_error'] = error
+
+async def get_dm_closed_users(max_age_days=7):
+    since = datetime.now(timezone.utc) - timedelta(days=max_age_days)
+    with _lock:
+        return [user_id for user_id, closed_at in dm_closed_users.items() if closed_at > since]
+
+async def set_dm_closed(user_id, closed=True):
+    with _lock:
+        if closed:
+            dm_closed_users[user_id] = datetime.now(timezone.utc)
+        else:
+            dm_closed_users.pop(user_id, None)
+
+# Transaction Log Functions
+async def log_transaction(guild_id, user_id, transaction_type, item_name, amount_changed, new_balance):
+    with _lock:
+        _insert_transaction(guild_id, user_id, transaction_type, item_name, amount_changed, new_balance)
+
+def _sorted_transactions(guild_id, user_id=None, cursor=None):
+    with _lock:
+        rows = [
+            dict(row) for row in transactions
+            if row['guild_id'] == guild_id and (user_id is None or row['user_id'] == user_id)
+            and (cursor is None or (row['timestamp'], row['transaction_id']) < tuple(cursor))
+        ]
+    rows.sort(key=lambda row: (row['timestamp'], row['transaction_id']), reverse=True)
+    return rows
+
+def _page(rows, limit):
+    rows = rows[:limit]
+    next_cursor = (rows[-1]['timestamp'], rows[-1]['transaction_id']) if rows and len(rows) == limit else None
+    return rows, next_cursor
+
+async def get_guild_transactions(guild_id, limit=50, offset=0):
+    return _sorted_transactions(guild_id)[offset:offset + limit]
+
+async def get_user_transactions(guild_id, user_id, limit=50, offset=0):
+    return _sorted_transactions(guild_id, user_id)[offset:offset + limit]
+
+async def get_guild_transactions_page(guild_id, limit=50, cursor=None):
+    return _page(_sorted_transactions(guild_id, cursor=cursor), limit)
+
+async def get_user_transactions_page(guild_id, user_id, limit=50, cursor=None):
+    return _page(_sorted_transactions(guild_id, user_id, cursor), limit)
+
+async def count_guild_transactions(guild_id, exact=False):
+    with _lock:
+        return sum(1 for row in transactions if row['guild_id'] == guild_id)
+
+async def maintain_transaction_partitions(retention_months: dict, default_retention_months: int, months_ahead: int = 2):
+    # khong co partition: gop gd het han theo retention cua tung guild vao ban tong hop roi xoa
+    current = current_month()
+    default_cutoff = retention_cutoff(default_retention_months, current)
+    guild_cutoffs = {int(gid): retention_cutoff(months, current) for gid, months in retention_months.items()}
+
+    kept, pruned = [], 0
+    with _lock:
+        for row in transactions:
+            cutoff = guild_cutoffs.get(row['guild_id'], default_cutoff)
+            day = row['timestamp'].astimezone(timezone.utc).date()
+            if cutoff is None or day >= cutoff:
+                kept.append(row)
+                continue
+            key = (row['guild_id'], row['user_id'], day, row['transaction_type'])
+            summary = transaction_daily_summary.setdefault(key, {
+                'guild_id': row['guild_id'], 'user_id': row['user_id'], 'day': day,
+                'transaction_type': row['transaction_type'], 'tx_count': 0, 'amount_total': 0
+            })
+            summary['tx_count'] += 1
+            summary['amount_total'] += row['amount_changed']
+            pruned += 1
+        transactions[:] = kept
+    return {'dropped': 0, 'pruned_rows': pruned}
+
+async def wipe_guild_data(guild_id):
+    with _lock:
+        role_ids = {row['role_id'] for row in custom_roles.values() if row['guild_id'] == guild_id}
+        role_ids |= {row['role_id'] for row in shop_roles.values() if row['guild_id'] == guild_id}
+        for table in (users, custom_roles, transaction_daily_summary):
+            for key in [key for key in table if key[0] == guild_id]:
+                del table[key]
+        for role_id in [role_id for role_id, row in shop_roles.items() if row['guild_id'] == guild_id]:
+            del shop_roles[role_id]
+        transactions[:] = [row for row in transactions if row['guild_id'] != guild_id]
+        leaderboards.clear_guild(guild_id)
+    return list(role_ids)
@@ -0,0 +1,339 @@
+import logging
+from datetime import timezone
+from database.config_notify import CONFIG_CHANNEL
+from database.partitions import (
+    add_months, create_transaction_partition, current_month, ensure_transaction_partitions, month_start
+)
+
+# khoa advisory de 2 instance khoi dong cung luc khong chay migration 2 lan
+MIGRATION_LOCK_ID = 0x5348_4F50
+
+# Migration Steps
+# moi buoc chi chay 1 lan, theo thu tu version. cac buoc dau phai idempotent vi
+# database tao truoc khi co schema_version van co the da co 1 phan schema.
+# KHONG sua buoc da phat hanh, them buoc moi vao cuoi MIGRATIONS.
+
+def _create_base_tables(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT NOT NULL,
+            guild_id BIGINT NOT NULL,
+            balance BIGINT DEFAULT 0,
+            message_count INTEGER DEFAULT 0,
+            reaction_count INTEGER DEFAULT 0,
+            fake_boosts INTEGER DEFAULT 0,
+            real_boosts INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, guild_id)
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS shop_roles (
+            role_id BIGINT PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            price INTEGER NOT NULL,
+            creator_id BIGINT,
+            creation_price INTEGER
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS custom_roles (
+            user_id BIGINT NOT NULL,
+            guild_id BIGINT NOT NULL,
+            role_id BIGINT NOT NULL,
+            role_name TEXT,
+            role_color TEXT,
+            role_style TEXT,
+            gradient_color_1 TEXT,
+            gradient_color_2 TEXT,
+            PRIMARY KEY (user_id, guild_id)
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS guild_configs (
+            guild_id BIGINT PRIMARY KEY,
+            config_data JSONB
+        )
+    ''')
+    # database cu tao truoc khi cac cot nay ton tai
+    cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS real_boosts INTEGER DEFAULT 0")
+    cur.execute("ALTER TABLE shop_roles ADD COLUMN IF NOT EXISTS creator_id BIGINT")
+    cur.execute("ALTER TABLE shop_roles ADD COLUMN IF NOT EXISTS creation_price INTEGER")
+    cur.execute("ALTER TABLE custom_roles ADD COLUMN IF NOT EXISTS role_style TEXT")
+    cur.execute("ALTER TABLE custom_roles ADD COLUMN IF NOT EXISTS gradient_color_1 TEXT")
+    cur.execute("ALTER TABLE custom_roles ADD COLUMN IF NOT EXISTS gradient_color_2 TEXT")
+
+def _create_partitioned_transactions(cur):
+    # bang gd chia partition theo thang, ban cu (bang thuong) duoc chuyen doi tai cho
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            transaction_id BIGSERIAL,
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            transaction_type TEXT NOT NULL,
+            item_name TEXT,
+            amount_changed BIGINT NOT NULL,
+            new_balance BIGINT NOT NULL,
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (transaction_id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    ''')
+    _convert_legacy_transactions(cur)
+    ensure_transaction_partitions(cur)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS transaction_daily_summary (
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            day DATE NOT NULL,
+            transaction_type TEXT NOT NULL,
+            tx_count INTEGER NOT NULL,
+            amount_total BIGINT NOT NULL,
+            PRIMARY KEY (guild_id, user_id, day, transaction_type)
+        )
+    ''')
+
+def _convert_legacy_transactions(cur):
+    # bang transactions cu (relkind 'r') -> chuyen sang bang partition, giu nguyen id va sequence
+    cur.execute("SELECT relkind FROM pg_class WHERE relname = 'transactions' AND relnamespace = 'public'::regnamespace")
+    row = cur.fetchone()
+    if not row or row[0] != 'r':
+        return
+
+    logging.info("Chuyen bang transactions sang dang partition theo thang...")
+    cur.execute("DROP INDEX IF EXISTS idx_transactions_guild_time, idx_transactions_guild_user_time")
+    cur.execute("DROP TRIGGER IF EXISTS trg_transaction_counts_insert ON transactions")
+    cur.execute("DROP TRIGGER IF EXISTS trg_transaction_counts_delete ON transactions")
+    cur.execute("ALTER TABLE transactions RENAME TO transactions_legacy")
+    cur.execute("ALTER TABLE transactions_legacy RENAME CONSTRAINT transactions_pkey TO transactions_legacy_pkey")
+    cur.execute('''
+        CREATE TABLE transactions (
+            transaction_id BIGINT NOT NULL DEFAULT nextval('transactions_transaction_id_seq'),
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            transaction_type TEXT NOT NULL,
+            item_name TEXT,
+            amount_changed BIGINT NOT NULL,
+            new_balance BIGINT NOT NULL,
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (transaction_id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    ''')
+    # sequence cua SERIAL cu la integer, mo rong cho khop cot BIGINT
+    cur.execute("ALTER SEQUENCE transactions_transaction_id_seq AS BIGINT OWNED BY transactions.transaction_id")
+
+    cur.execute("SELECT MIN(timestamp) FROM transactions_legacy")
+    oldest = cur.fetchone()[0]
+    current = current_month()
+    month = month_start(oldest.astimezone(timezone.utc).date()) if oldest else current
+    while month < current:
+        create_transaction_partition(cur, month)
+        month = add_months(month, 1)
+    ensure_transaction_partitions(cur)
+
+    cur.execute('''
+        INSERT INTO transactions (transaction_id, guild_id, user_id, transaction_type, item_name, amount_changed, new_balance, timestamp)
+        SELECT transaction_id, guild_id, user_id, transaction_type, item_name, amount_changed, new_balance,
+            COALESCE(timestamp, CURRENT_TIMESTAMP)
+        FROM transactions_legacy
+    ''')
+    cur.execute("DROP TABLE transactions_legacy")
+    logging.info("Chuyen bang transactions sang partition thanh cong.")
+
+def _create_transaction_indexes(cur):
+    # index cho lich su gd (keyset theo timestamp, transaction_id)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_transactions_guild_time ON transactions (guild_id, timestamp DESC, transaction_id DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_transactions_guild_user_time ON transactions (guild_id, user_id, timestamp DESC, transaction_id DESC)")
+
+def _create_transaction_counts(cur):
+    # dem so gd moi guild bang trigger theo statement thay vi COUNT(*)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS transaction_counts (
+            guild_id BIGINT PRIMARY KEY,
+            total BIGINT NOT NULL DEFAULT 0
+        )
+    ''')
+    cur.execute('''
+        CREATE OR REPLACE FUNCTION transaction_counts_on_insert() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO transaction_counts (guild_id, total)
+            SELECT guild_id, COUNT(*) FROM new_rows GROUP BY guild_id
+            ON CONFLICT (guild_id) DO UPDATE SET total = transaction_counts.total + EXCLUDED.total;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cur.execute('''
+        CREATE OR REPLACE FUNCTION transaction_counts_on_delete() RETURNS trigger AS $$
+        BEGIN
+            UPDATE transaction_counts c SET total = GREATEST(0, c.total - d.removed)
+            FROM (SELECT guild_id, COUNT(*) AS removed FROM old_rows GROUP BY guild_id) d
+            WHERE c.guild_id = d.guild_id;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+
+    # khoa bang, dem lai tu dau roi moi gan trigger
+    cur.execute("LOCK TABLE transactions IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute('''
+        INSERT INTO transaction_counts (guild_id, total)
+        SELECT guild_id, COUNT(*) FROM transactions GROUP BY guild_id
+        ON CONFLICT (guild_id) DO UPDATE SET total = EXCLUDED.total
+    ''')
+    cur.execute("DROP TRIGGER IF EXISTS trg_transaction_counts_insert ON transactions")
+    cur.execute("DROP TRIGGER IF EXISTS trg_transaction_counts_delete ON transactions")
+    cur.execute('''
+        CREATE TRIGGER trg_transaction_counts_insert AFTER INSERT ON transactions
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+        EXECUTE PROCEDURE transaction_counts_on_insert()
+    ''')
+    cur.execute('''
+        CREATE TRIGGER trg_transaction_counts_delete AFTER DELETE ON transactions
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+        EXECUTE PROCEDURE transaction_counts_on_delete()
+    ''')
+
+def _create_user_balance_index(cur):
+    # BXH / tim hang theo so du (balance DESC, user_id) trong guild
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_guild_balance ON users (guild_id, balance DESC, user_id)")
+
+def _create_dm_outbox(cur):
+    # DM cho gui (bien lai, thong bao) + user da chan DM
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS dm_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            guild_id BIGINT,
+            payload JSONB NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_dm_outbox_due ON dm_outbox (next_attempt_at, id)")
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS dm_closed_users (
+            user_id BIGINT PRIMARY KEY,
+            closed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _create_guild_config_notify(cur):
+    # moi lan ghi config: tang version + pg_notify (chi gui khi commit) de bot reload
+    cur.execute("ALTER TABLE guild_configs ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0")
+    cur.execute('''
+        CREATE OR REPLACE FUNCTION guild_configs_bump_version() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' THEN
+                NEW.version := OLD.version + 1;
+            ELSE
+                NEW.version := 1;
+            END IF;
+            RETURN NEW;
+        END $$ LANGUAGE plpgsql
+    ''')
+    cur.execute(f'''
+        CREATE OR REPLACE FUNCTION guild_configs_notify() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{CONFIG_CHANNEL}', NEW.guild_id || ':' || NEW.version);
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql
+    ''')
+    cur.execute("DROP TRIGGER IF EXISTS trg_guild_configs_version ON guild_configs")
+    cur.execute("DROP TRIGGER IF EXISTS trg_guild_configs_notify ON guild_configs")
+    cur.execute('''
+        CREATE TRIGGER trg_guild_configs_version BEFORE INSERT OR UPDATE ON guild_configs
+        FOR EACH ROW EXECUTE PROCEDURE guild_configs_bump_version()
+    ''')
+    cur.execute('''
+        CREATE TRIGGER trg_guild_configs_notify AFTER INSERT OR UPDATE ON guild_configs
+        FOR EACH ROW EXECUTE PROCEDURE guild_configs_notify()
+    ''')
+
+def _create_user_balance_version(cur):
+    # moi lan so du doi thi tang balance_version, bot dung no de bo qua cap nhat BXH den tre
+    cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS balance_version BIGINT NOT NULL DEFAULT 0")
+    cur.execute('''
+        CREATE OR REPLACE FUNCTION users_bump_balance_version() RETURNS trigger AS $$
+        BEGIN
+            NEW.balance_version := OLD.balance_version + 1;
+            RETURN NEW;
+        END $$ LANGUAGE plpgsql
+    ''')
+    cur.execute("DROP TRIGGER IF EXISTS trg_users_balance_version ON users")
+    cur.execute('''
+        CREATE TRIGGER trg_users_balance_version BEFORE UPDATE OF balance ON users
+        FOR EACH ROW WHEN (OLD.balance IS DISTINCT FROM NEW.balance)
+        EXECUTE PROCEDURE users_bump_balance_version()
+    ''')
+
+MIGRATIONS = [
+    (1, "bang users, shop_roles, custom_roles, guild_configs", _create_base_tables),
+    (2, "transactions chia partition theo thang + transaction_daily_summary", _create_partitioned_transactions),
+    (3, "index lich su gd", _create_transaction_indexes),
+    (4, "bo dem gd theo guild (transaction_counts + trigger)", _create_transaction_counts),
+    (5, "index users theo so du trong guild", _create_user_balance_index),
+    (6, "hang doi DM (dm_outbox, dm_closed_users)", _create_dm_outbox),
+    (7, "version + NOTIFY khi config guild thay doi", _create_guild_config_notify),
+    (8, "version so du users (thu tu cap nhat BXH)", _create_user_balance_version),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Runner
+
+def _current_version(cur) -> int:
+    cur.execute("SELECT to_regclass('public.schema_version') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return 0
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cur.fetchone()[0]
+
+def migrate(conn) -> int:
+    """
+    Dua schema len LATEST_VERSION. Moi migration chay trong 1 transaction rieng
+    cung voi dong ghi vao schema_version, loi thi rollback va dung lai.
+    Tra ve version hien tai sau khi chay.
+    """
+    with conn.cursor() as cur:
+        version = _current_version(cur)
+        conn.commit()
+        if version >= LATEST_VERSION:
+            return version
+
+        # migration (vd: chuyen bang gd cu) co the lau hon statement_timeout cua pool
+        cur.execute("SET LOCAL statement_timeout = 0")
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.commit()
+            # instance khac co the da migrate trong luc cho khoa
+            version = _current_version(cur)
+            conn.commit()
+
+            for step_version, description, step in MIGRATIONS:
+                if step_version <= version:
+                    continue
+                logging.info(f"Ap dung migration {step_version}: {description}")
+                try:
+                    cur.execute("SET LOCAL statement_timeout = 0")
+                    step(cur)
+                    cur.execute(
+                        "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                        (step_version, description)
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                version = step_version
+        finally:
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+    return version
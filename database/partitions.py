@@ -0,0 +1,96 @@
+from datetime import date, datetime, timezone
+
+TRANSACTION_PARTITION_PREFIX = 'transactions_p'
+TRANSACTION_PARTITIONS_AHEAD = 2
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+def current_month() -> date:
+    return month_start(datetime.now(timezone.utc).date())
+
+def add_months(d: date, months: int) -> date:
+    index = d.year * 12 + (d.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def retention_cutoff(months, current: date = None):
+    # thang dau tien con giu gd chi tiet, None = giu mai (months <= 0 hoac khong dat)
+    if months is None or months <= 0:
+        return None
+    return add_months(current or current_month(), -months)
+
+def partition_name(month: date) -> str:
+    return f"{TRANSACTION_PARTITION_PREFIX}{month:%Y%m}"
+
+def _default_partition_exists(cur) -> bool:
+    cur.execute("SELECT to_regclass('transactions_default') IS NOT NULL")
+    return cur.fetchone()[0]
+
+def create_transaction_partition(cur, month: date):
+    """
+    Tao partition cho 1 thang. Default partition dang giu row trong khoang thang do thi postgres
+    khong cho tao -> tach default ra, tao partition, chuyen row sang roi gan default lai.
+    """
+    name = partition_name(month)
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+    if cur.fetchone()[0]:
+        return
+    # bien thang theo UTC de khong phu thuoc timezone cua session
+    start, end = f"{month} 00:00:00+00", f"{add_months(month, 1)} 00:00:00+00"
+    create_sql = f"CREATE TABLE {name} PARTITION OF transactions FOR VALUES FROM ('{start}') TO ('{end}')"
+
+    has_rows = False
+    if _default_partition_exists(cur):
+        cur.execute("SELECT EXISTS (SELECT 1 FROM transactions_default WHERE timestamp >= %s AND timestamp < %s)", (start, end))
+        has_rows = cur.fetchone()[0]
+    if not has_rows:
+        cur.execute(create_sql)
+        return
+
+    cur.execute("ALTER TABLE transactions DETACH PARTITION transactions_default")
+    cur.execute(create_sql)
+    # ghi/xoa thang vao partition: trigger dem gd (theo statement, tren bang cha) khong chay -> tong khong doi
+    cur.execute(f'''
+        WITH moved AS (
+            DELETE FROM transactions_default WHERE timestamp >= %s AND timestamp < %s RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    ''', (start, end))
+    cur.execute("ALTER TABLE transactions ATTACH PARTITION transactions_default DEFAULT")
+
+def default_partition_months(cur) -> list:
+    # cac thang (UTC) dang co row nam trong default partition
+    if not _default_partition_exists(cur):
+        return []
+    cur.execute("""
+        SELECT DISTINCT date_trunc('month', timestamp AT TIME ZONE 'UTC')::date FROM transactions_default
+    """)
+    return sorted(month_start(row[0]) for row in cur.fetchall())
+
+def ensure_transaction_partitions(cur, months_ahead: int = TRANSACTION_PARTITIONS_AHEAD):
+    """
+    Thang hien tai + vai thang toi, default partition hung row lech gio/ngoai khoang.
+    Row da roi vao default (vd: bao tri khong chay 1 thang) duoc chuyen ve partition cua thang do,
+    de default luon rong va vong giu/gop gd theo partition khong bo sot.
+    """
+    for month in default_partition_months(cur):
+        create_transaction_partition(cur, month)
+    current = current_month()
+    for i in range(months_ahead + 1):
+        create_transaction_partition(cur, add_months(current, i))
+    cur.execute("CREATE TABLE IF NOT EXISTS transactions_default PARTITION OF transactions DEFAULT")
+
+def list_transaction_partitions(cur):
+    # tra ve list (thang, ten partition) sap xep tang dan, bo qua default
+    cur.execute('''
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'transactions'
+    ''')
+    partitions = []
+    for (name,) in cur.fetchall():
+        suffix = name[len(TRANSACTION_PARTITION_PREFIX):]
+        if name.startswith(TRANSACTION_PARTITION_PREFIX) and len(suffix) == 6 and suffix.isdigit():
+            partitions.append((date(int(suffix[:4]), int(suffix[4:]), 1), name))
+    return sorted(partitions)
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import psycopg2
+from psycopg2 import extensions
+from database.config_notify import CONFIG_CHANNEL, parse_payload
+
+class PgConfigListener:
+    """
+    LISTEN tren 1 ket noi rieng (khong lay tu pool), doc notify bang loop.add_reader nen khong can thread.
+    Mat ket noi thi ket noi lai voi backoff va goi on_reconnect de bot tu doi chieu lai version
+    (notify trong luc mat ket noi bi mat).
+    """
+    def __init__(self, dsn: str, min_backoff: float = 1.0, max_backoff: float = 60.0, keepalive_seconds: float = 30.0):
+        self.dsn = dsn
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.keepalive_seconds = keepalive_seconds
+        self._on_change = None
+        self._on_reconnect = None
+        self._task = None
+        self._conn = None
+        self._lost = None
+
+    def start(self, on_change, on_reconnect=None):
+        self._on_change = on_change
+        self._on_reconnect = on_reconnect
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _connect(self):
+        # ket noi chet im lang (half-open) khong bao readable -> de kernel phat hien bang TCP keepalive
+        # thay vi ping tu event loop (ping tren ket noi treo se chan ca loop toi khi het timeout)
+        conn = psycopg2.connect(
+            self.dsn,
+            keepalives=1,
+            keepalives_idle=max(1, int(self.keepalive_seconds)),
+            keepalives_interval=max(1, int(self.keepalive_seconds) // 3),
+            keepalives_count=3,
+            tcp_user_timeout=int(self.keepalive_seconds * 2 * 1000)
+        )
+        conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {CONFIG_CHANNEL}")
+        return conn
+
+    def _on_readable(self):
+        try:
+            self._conn.poll()
+        except psycopg2.Error as e:
+            self._mark_lost(e)
+            return
+        while self._conn.notifies:
+            notify = self._conn.notifies.pop(0)
+            try:
+                guild_id, version = parse_payload(notify.payload)
+            except ValueError:
+                logging.warning(f"Bo qua notify config khong hop le: {notify.payload!r}")
+                continue
+            self._on_change(guild_id, version)
+
+    def _mark_lost(self, error):
+        if self._lost is not None and not self._lost.done():
+            self._lost.set_result(error)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        backoff = self.min_backoff
+        first = True
+        while True:
+            try:
+                self._conn = await loop.run_in_executor(None, self._connect)
+            except psycopg2.Error as e:
+                logging.error(f"Khong the LISTEN config tren postgres: {e}. Thu lai sau {backoff:.0f}s.")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            backoff = self.min_backoff
+            logging.info("Dang nghe thay doi config guild qua postgres NOTIFY.")
+            if not first and self._on_reconnect is not None:
+                self._on_reconnect()
+            first = False
+
+            self._lost = loop.create_future()
+            fd = self._conn.fileno()
+            loop.add_reader(fd, self._on_readable)
+            try:
+                # keepalive het han -> socket bao loi -> readable -> poll() raise -> _mark_lost
+                await self._lost
+                logging.warning(f"Mat ket noi LISTEN config: {self._lost.result()}. Dang ket noi lai...")
+            finally:
+                loop.remove_reader(fd)
+                try:
+                    self._conn.close()
+                except psycopg2.Error:
+                    pass
+                self._conn = None
@@ -0,0 +1,179 @@
+import threading
+import time
+import logging
+import psycopg2
+from psycopg2 import extensions
+
+class PoolTimeoutError(Exception):
+    pass
+
+class PooledConnection(extensions.connection):
+    # prepared statement song theo session -> nho ten da PREPARE tren tung ket noi
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+class ConnectionPool:
+    """
+    Pool ket noi thread-safe: cho co timeout khi het ket noi, dat statement_timeout cho moi
+    ket noi, tu thay ket noi hong va dem so lieu (dang dung, dang cho, thoi gian cho).
+    """
+    def __init__(self, dsn: str, minconn: int = 1, maxconn: int = 20, acquire_timeout: float = 10.0,
+                 statement_timeout_ms: int = 30000, health_check_after: float = 60.0):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.statement_timeout_ms = statement_timeout_ms
+        # ket noi nam idle lau hon muc nay, hoac da idle tu truoc lan gap ket noi hong gan nhat
+        # (server restart, mang rot -> cac ket noi con lai cung co the hong) se duoc ping truoc khi giao ra
+        self.health_check_after = health_check_after
+        self._last_failure = None
+
+        self._cond = threading.Condition()
+        self._idle = [] # list (conn, thoi diem tra ve)
+        self._in_use = set()
+        self._opening = 0
+        self._waiters = 0
+        self._closed = False
+
+        self.checkouts = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        options = f"-c statement_timeout={int(self.statement_timeout_ms)}" if self.statement_timeout_ms else None
+        return psycopg2.connect(self.dsn, options=options, connection_factory=PooledConnection)
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_alive(self, conn) -> bool:
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self, timeout: float = None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        conn = None
+        idle_since = None
+
+        with self._cond:
+            self._waiters += 1
+            try:
+                while True:
+                    if self._closed:
+                        raise Exception("Pool ket noi da dong.")
+                    if self._idle:
+                        # lay ket noi tra ve gan nhat (con nong, it kha nang bi server cat)
+                        conn, idle_since = self._idle.pop()
+                        break
+                    if len(self._in_use) + self._opening < self.maxconn:
+                        self._opening += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeoutError(f"Het ket noi trong pool sau {timeout}s ({self.maxconn} dang dung).")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters -= 1
+
+            waited = time.monotonic() - started
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            if conn is not None:
+                self._in_use.add(conn)
+
+        # ping / mo ket noi nam ngoai lock de khong chan thread khac
+        if conn is not None:
+            last_failure = self._last_failure
+            stale = (
+                conn.closed or time.monotonic() - idle_since > self.health_check_after
+                or (last_failure is not None and idle_since <= last_failure)
+            )
+            if not stale or self._is_alive(conn):
+                return conn
+            logging.warning("Ket noi database trong pool da hong, thay ket noi moi.")
+            self._discard(conn)
+            with self._cond:
+                self._in_use.discard(conn)
+                self._opening += 1
+                self.discarded += 1
+                self._last_failure = time.monotonic()
+
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._opening -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._opening -= 1
+            self._in_use.add(conn)
+        return conn
+
+    def putconn(self, conn):
+        # ket noi con transaction do dang thi rollback, hong thi bo di
+        broken = bool(conn.closed)
+        if not broken:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                broken = True
+
+        with self._cond:
+            self._in_use.discard(conn)
+            if broken or self._closed:
+                if broken:
+                    self.discarded += 1
+                    self._last_failure = time.monotonic()
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+            for conn in self._in_use:
+                self._discard(conn)
+            self._idle.clear()
+            self._in_use.clear()
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'maxconn': self.maxconn,
+                'waiters': self._waiters,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'discarded': self.discarded,
+                'avg_wait_ms': (self.total_wait / self.checkouts * 1000) if self.checkouts else 0.0,
+                'max_wait_ms': self.max_wait * 1000
+            }
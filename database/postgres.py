@@ -0,0 +1,959 @@
+from psycopg2.extras import Json, RealDictCursor
+import logging
+import json
+import asyncio
+import functools
+import csv
+import io
+from datetime import date, datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from database.cache import LRUCache
+from database.errors import DatabaseError
+from database.pool import ConnectionPool
+from database.ledger_writer import LedgerWriter
+from database.pg_notify import PgConfigListener
+from database.leaderboard import leaderboards, rank_window
+from database import migrations
+from database.activity import activity_row
+from database.partitions import (
+    TRANSACTION_PARTITIONS_AHEAD, add_months, current_month, ensure_transaction_partitions, list_transaction_partitions,
+    retention_cutoff
+)
+
+DB_POOL_MIN_CONN = 1
+DB_POOL_MAX_CONN = 20
+
+db_pool = None
+# executor rieng cho db, so thread = so ket noi toi da nen khong bao gio phai cho pool
+db_executor = None
+# cache row users theo (guild_id, user_id), moi ham ghi vao users phai cap nhat/xoa cache
+user_cache = LRUCache()
+# hang doi ghi log gd theo lo, khoi tao trong event loop bang start_ledger_writer
+ledger_writer = None
+# LISTEN thay doi config tren ket noi rieng, khoi tao bang start_config_listener
+database_dsn = None
+config_listener = None
+
+def run_in_db_thread(func):
+    # bien ham sync thanh coroutine, chay tren db_executor de khong chan event loop
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if db_executor is None:
+            raise Exception("Database executor khong duoc khoi tao.")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(db_executor, functools.partial(func, *args, **kwargs))
+    return wrapper
+
+@contextmanager
+def get_db_connection():
+    # lay ket noi tu pool
+    if db_pool is None:
+        raise Exception("Database pool khong duoc khoi tao.")
+    conn = None
+    try:
+        conn = db_pool.getconn()
+        yield conn
+    finally:
+        if conn:
+            db_pool.putconn(conn) # tra ket noi ve pool
+
+def init_db(database_url: str, user_cache_size: int = 10000, user_cache_ttl: float = 30.0,
+            pool_acquire_timeout: float = 10.0, statement_timeout_ms: int = 30000):
+    global db_pool, db_executor, user_cache, database_dsn
+    user_cache = LRUCache(maxsize=user_cache_size, ttl=user_cache_ttl)
+    database_dsn = database_url
+    try:
+        # pool phai thread-safe vi duoc dung tu nhieu thread cua db_executor
+        db_pool = ConnectionPool(
+            database_url, DB_POOL_MIN_CONN, DB_POOL_MAX_CONN,
+            acquire_timeout=pool_acquire_timeout, statement_timeout_ms=statement_timeout_ms
+        )
+        db_executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX_CONN, thread_name_prefix="db")
+        with get_db_connection() as conn:
+            version = migrations.migrate(conn)
+            with conn.cursor() as cur:
+                # partition thang moi khong phai migration, tao truoc de gd khong roi vao default
+                ensure_transaction_partitions(cur)
+                conn.commit()
+        logging.info(f"Database PostgreSQL khoi tao thanh cong (schema version {version}).")
+    except Exception as e:
+        logging.error(f"Loi khoi tao database: {e}")
+
+# Partition Functions
+def _rollup_transactions(cur, month: date, guild_filter: str = "", params: tuple = ()):
+    # gop gd trong 1 thang thanh tong theo ngay/user/loai
+    end = add_months(month, 1)
+    cur.execute(f'''
+        INSERT INTO transaction_daily_summary AS s (guild_id, user_id, day, transaction_type, tx_count, amount_total)
+        SELECT guild_id, user_id, (timestamp AT TIME ZONE 'UTC')::date, transaction_type, COUNT(*), SUM(amount_changed)
+        FROM transactions
+        WHERE timestamp >= %s AND timestamp < %s {guild_filter}
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (guild_id, user_id, day, transaction_type) DO UPDATE SET
+            tx_count = s.tx_count + EXCLUDED.tx_count,
+            amount_total = s.amount_total + EXCLUDED.amount_total
+    ''', (f"{month} 00:00:00+00", f"{end} 00:00:00+00", *params))
+
+@run_in_db_thread
+def maintain_transaction_partitions(retention_months: dict, default_retention_months: int, months_ahead: int = TRANSACTION_PARTITIONS_AHEAD):
+    """
+    Tao truoc partition cho cac thang toi, gop gd het han vao transaction_daily_summary roi xoa.
+    retention_months: {guild_id: so thang giu gd chi tiet}, guild khong co trong dict dung default.
+    Gia tri None la giu mai (guild dat so thang sai). Partition chi bi drop khi da het han voi moi guild.
+    Row nam trong default partition duoc chuyen ve partition thang truoc, nen cung duoc gop/xoa.
+    Tra ve dict (dropped, pruned_rows) hoac None neu loi.
+    """
+    result = {'dropped': 0, 'pruned_rows': 0}
+    current = current_month()
+
+    default_cutoff = retention_cutoff(default_retention_months, current)
+    guild_cutoffs = {int(gid): retention_cutoff(months, current) for gid, months in retention_months.items()}
+    all_cutoffs = [default_cutoff, *guild_cutoffs.values()]
+    # partition het han voi moi guild -> drop nguyen partition
+    drop_before = None if any(c is None for c in all_cutoffs) else min(all_cutoffs)
+    configured_ids = list(guild_cutoffs.keys())
+
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                # chuyen row tu default partition co the lau hon statement_timeout mac dinh
+                cur.execute("SET LOCAL statement_timeout = 0")
+                ensure_transaction_partitions(cur, months_ahead)
+                conn.commit()
+
+                for month, name in list_transaction_partitions(cur):
+                    end = add_months(month, 1)
+                    if end > current:
+                        continue
+                    # gop/xoa ca thang co the lau hon statement_timeout mac dinh cua pool
+                    cur.execute("SET LOCAL statement_timeout = 0")
+
+                    if drop_before and end <= drop_before:
+                        _rollup_transactions(cur, month)
+                        # DROP khong chay trigger -> tu tru bo dem
+                        cur.execute(f'''
+                            UPDATE transaction_counts c SET total = GREATEST(0, c.total - d.removed)
+                            FROM (SELECT guild_id, COUNT(*) AS removed FROM {name} GROUP BY guild_id) d
+                            WHERE c.guild_id = d.guild_id
+                        ''')
+                        cur.execute(f"DROP TABLE {name}")
+                        conn.commit()
+                        result['dropped'] += 1
+                        continue
+
+                    # chi xoa gd cua cac guild da het han trong partition nay
+                    expired_ids = [gid for gid, c in guild_cutoffs.items() if c and end <= c]
+                    conditions, params = [], []
+                    if expired_ids:
+                        conditions.append("guild_id = ANY(%s::bigint[])")
+                        params.append(expired_ids)
+                    if default_cutoff and end <= default_cutoff:
+                        conditions.append("NOT (guild_id = ANY(%s::bigint[]))")
+                        params.append(configured_ids)
+                    if not conditions:
+                        continue
+
+                    guild_filter = "AND (" + " OR ".join(conditions) + ")"
+                    _rollup_transactions(cur, month, guild_filter, tuple(params))
+                    cur.execute(
+                        f"DELETE FROM transactions WHERE timestamp >= %s AND timestamp < %s {guild_filter}",
+                        (f"{month} 00:00:00+00", f"{end} 00:00:00+00", *params)
+                    )
+                    result['pruned_rows'] += cur.rowcount
+                    conn.commit()
+        return result
+    except Exception as e:
+        logging.error(f"Bao tri partition transactions that bai: {e}")
+        return None
+
+def close_db():
+    # goi khi tat bot, doi cac query dang chay xong roi dong pool
+    global db_pool, db_executor
+    if db_executor is not None:
+        db_executor.shutdown(wait=True)
+        db_executor = None
+    if db_pool is not None:
+        db_pool.closeall()
+        db_pool = None
+
+def get_pool_stats():
+    # so ket noi dang dung/dang cho, thoi gian cho de chinh DB_POOL_MAX_CONN
+    return db_pool.stats() if db_pool is not None else None
+
+def _execute(query, params=(), fetch=None, commit=False, prepare=None, raise_errors=False):
+    # ban sync, chi goi tu trong db thread
+    # commit=True de vua ghi vua lay ket qua (vd: UPDATE ... RETURNING)
+    # raise_errors=True: loi db raise DatabaseError thay vi tra None (khi None co nghia rieng)
+    try:
+        with get_db_connection() as conn:
+            # dung RealDictCursor de tu dong tra ve dict
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                if prepare:
+                    _prepare(conn, cur, prepare)
+                cur.execute(query, params)
+                
+                result = None
+                if fetch == 'one':
+                    result = cur.fetchone()
+                elif fetch == 'all':
+                    result = cur.fetchall()
+                if fetch is None or commit:
+                    conn.commit()
+                return result
+    except Exception as e:
+        logging.error(f"Query that bai: {e}")
+        if raise_errors:
+            raise DatabaseError(str(e)) from e
+        return None
+
+@run_in_db_thread
+def execute_query(query, params=(), fetch=None, commit=False):
+    return _execute(query, params, fetch, commit)
+
+# Prepared Statements
+# cau lenh nong: PREPARE 1 lan tren moi ket noi cua pool, sau do chi EXECUTE theo ten
+# nen postgres khong phai parse/plan lai moi lan goi. ten -> (kieu tham so, sql voi $1, $2...)
+PREPARED_STATEMENTS = {}
+
+def register_statement(name: str, param_types: tuple, sql: str):
+    PREPARED_STATEMENTS[name] = (param_types, sql)
+
+def _prepare(conn, cur, name):
+    if name in conn.prepared:
+        return
+    param_types, sql = PREPARED_STATEMENTS[name]
+    cur.execute(f"PREPARE {name} ({', '.join(param_types)}) AS {sql}")
+    conn.prepared.add(name)
+
+def _execute_prepared(name, params=(), fetch=None, commit=False, raise_errors=False):
+    # nhu _execute nhung chay cau lenh da dang ky trong PREPARED_STATEMENTS
+    placeholders = ', '.join(['%s'] * len(params))
+    return _execute(f"EXECUTE {name} ({placeholders})", params, fetch, commit, prepare=name, raise_errors=raise_errors)
+
+@run_in_db_thread
+def wipe_guild_data(guild_id):
+    # ham xoa toan bo du lieu cua 1 guild
+    role_ids_to_delete = set()
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                # lay va xoa custom roles
+                cur.execute("DELETE FROM custom_roles WHERE guild_id = %s RETURNING role_id", (guild_id,))
+                deleted_custom_roles = cur.fetchall()
+                for role in deleted_custom_roles:
+                    role_ids_to_delete.add(role[0])
+                
+                # lay va xoa shop roles
+                cur.execute("DELETE FROM shop_roles WHERE guild_id = %s RETURNING role_id", (guild_id,))
+                deleted_shop_roles = cur.fetchall()
+                for role in deleted_shop_roles:
+                    role_ids_to_delete.add(role[0])
+
+                # xoa users, transactions va ban tong hop
+                cur.execute("DELETE FROM users WHERE guild_id = %s", (guild_id,))
+                cur.execute("DELETE FROM transactions WHERE guild_id = %s", (guild_id,))
+                cur.execute("DELETE FROM transaction_daily_summary WHERE guild_id = %s", (guild_id,))
+                
+                conn.commit()
+        user_cache.invalidate_where(lambda key: key[0] == guild_id)
+        leaderboards.clear_guild(guild_id)
+        
+        logging.info(f"Da xoa toan bo du lieu database cho guild {guild_id}.")
+        return list(role_ids_to_delete)
+    except Exception as e:
+        logging.error(f"Loi khi xoa du lieu guild {guild_id}: {e}")
+        return []
+
+
+# User Functions
+def get_user_cache_stats():
+    # so lieu hit/miss/eviction de chinh kich thuoc cache
+    return user_cache.stats()
+
+async def get_or_create_user(user_id, guild_id):
+    # doc qua cache, chi xuong db khi miss
+    key = (guild_id, user_id)
+    cached = user_cache.get(key)
+    if cached is not None:
+        return cached
+    token = user_cache.write_token()
+    user = await _load_or_create_user(user_id, guild_id)
+    if user:
+        user_cache.set_if_unchanged(key, user, token)
+    return user
+
+register_statement('get_user', ('bigint', 'bigint'), "SELECT * FROM users WHERE user_id = $1 AND guild_id = $2")
+register_statement(
+    'create_user', ('bigint', 'bigint'),
+    "INSERT INTO users (user_id, guild_id) VALUES ($1, $2) ON CONFLICT(user_id, guild_id) DO NOTHING"
+)
+
+@run_in_db_thread
+def _load_or_create_user(user_id, guild_id):
+    user = _execute_prepared('get_user', (user_id, guild_id), fetch='one')
+    if not user:
+        _execute_prepared('create_user', (user_id, guild_id))
+        user = _execute_prepared('get_user', (user_id, guild_id), fetch='one')
+        if user:
+            leaderboards.add_if_missing(guild_id, user_id, user['balance'], user['balance_version'])
+    return user
+
+@run_in_db_thread
+def update_user_data(user_id, guild_id, **kwargs):
+    fields = ', '.join([f'{key} = %s' for key in kwargs])
+    values = list(kwargs.values())
+    values.extend([user_id, guild_id])
+    query = f"UPDATE users SET {fields} WHERE user_id = %s AND guild_id = %s RETURNING balance, balance_version"
+    row = _execute(query, tuple(values), fetch='one', commit=True)
+    user_cache.invalidate((guild_id, user_id))
+    if row and 'balance' in kwargs:
+        leaderboards.update(guild_id, user_id, row['balance'], row['balance_version'])
+
+# tang counter + check nguong + cong coin + ghi log gd earn_* trong 1 statement.
+# user duoc tao truoc (ACTIVITY_USERS_QUERY) nen row luon ton tai: khoa (FOR UPDATE) roi tinh counter moi
+# tu row hien tai. upsert tinh counter nhu user bat dau tu 0 -> 2 lo dong thoi cho user moi se mat 1 lo.
+# log gd nam chung statement voi so du: khong bao gio co coin duoc cong ma mat log.
+# lo truyen vao theo tung cot (mang) de 1 prepared statement dung cho moi kich thuoc lo.
+ACTIVITY_BATCH_QUERY = """
+WITH batch AS (
+    SELECT * FROM unnest($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
+        AS b(user_id, guild_id, msg_hits, msg_rate, msg_item, react_hits, react_rate, react_item,
+             boost_enabled, base_multiplier, per_boost_addition)
+),
+locked AS (
+    SELECT u.user_id, u.guild_id, u.message_count, u.reaction_count,
+        COALESCE(NULLIF(u.fake_boosts, 0), u.real_boosts, 0) AS boost_count
+    FROM users u
+    JOIN batch b ON u.user_id = b.user_id AND u.guild_id = b.guild_id
+    ORDER BY u.guild_id, u.user_id
+    FOR UPDATE OF u
+),
+totals AS (
+    SELECT b.*,
+        l.message_count + b.msg_hits AS msg_total,
+        l.reaction_count + b.react_hits AS react_total,
+        l.boost_count
+    FROM batch b
+    JOIN locked l ON l.user_id = b.user_id AND l.guild_id = b.guild_id
+),
+awards AS (
+    SELECT *,
+        CASE WHEN msg_hits > 0 THEN msg_total / msg_rate ELSE 0 END AS msg_awards,
+        CASE WHEN react_hits > 0 THEN react_total / react_rate ELSE 0 END AS react_awards,
+        CASE WHEN boost_enabled AND boost_count > 0
+            THEN GREATEST(1, FLOOR(base_multiplier + (boost_count - 1) * per_boost_addition))::bigint
+            ELSE 1 END AS coins_per_award
+    FROM totals
+),
+calc AS (
+    SELECT user_id, guild_id, msg_item, react_item,
+        msg_awards * coins_per_award AS msg_coins,
+        react_awards * coins_per_award AS react_coins,
+        CASE WHEN msg_awards > 0 THEN MOD(msg_total, msg_rate) ELSE msg_total END AS new_message_count,
+        CASE WHEN react_awards > 0 THEN MOD(react_total, react_rate) ELSE react_total END AS new_reaction_count
+    FROM awards
+),
+updated AS (
+    UPDATE users u SET
+        balance = u.balance + c.msg_coins + c.react_coins,
+        message_count = c.new_message_count,
+        reaction_count = c.new_reaction_count
+    FROM calc c
+    WHERE u.user_id = c.user_id AND u.guild_id = c.guild_id
+    RETURNING u.user_id, u.guild_id, u.balance, u.balance_version, u.message_count, u.reaction_count
+),
+ledger AS (
+    INSERT INTO transactions (guild_id, user_id, transaction_type, item_name, amount_changed, new_balance)
+    SELECT up.guild_id, up.user_id, e.transaction_type, e.item_name, e.amount, up.balance
+    FROM updated up
+    JOIN calc c ON c.user_id = up.user_id AND c.guild_id = up.guild_id
+    CROSS JOIN LATERAL (VALUES ('earn_message', c.msg_item, c.msg_coins), ('earn_reaction', c.react_item, c.react_coins))
+        AS e(transaction_type, item_name, amount)
+    WHERE e.amount > 0
+)
+SELECT up.user_id, up.guild_id, up.balance, up.balance_version, up.message_count, up.reaction_count,
+    c.msg_coins + c.react_coins AS coins_earned, c.msg_coins, c.msg_item, c.react_coins, c.react_item
+FROM updated up
+JOIN calc c ON c.user_id = up.user_id AND c.guild_id = up.guild_id
+"""
+register_statement(
+    'apply_activity',
+    ('bigint[]', 'bigint[]', 'int[]', 'int[]', 'text[]', 'int[]', 'int[]', 'text[]', 'boolean[]', 'numeric[]', 'numeric[]'),
+    ACTIVITY_BATCH_QUERY
+)
+
+# tao user chua co cua lo (theo thu tu khoa de 2 lo dong thoi khong deadlock)
+ACTIVITY_USERS_QUERY = """
+INSERT INTO users (user_id, guild_id)
+SELECT user_id, guild_id FROM unnest($1, $2) AS b(user_id, guild_id)
+ORDER BY guild_id, user_id
+ON CONFLICT (user_id, guild_id) DO NOTHING
+"""
+register_statement('ensure_activity_users', ('bigint[]', 'bigint[]'), ACTIVITY_USERS_QUERY)
+
+async def earn_activity(user_id, guild_id, activity_type, rate, item_name, booster_config: dict):
+    """
+    Ghi 1 luot message/reaction trong 1 round trip. Tra ve dict
+    (balance, message_count, reaction_count, coins_earned) hoac None neu loi.
+    """
+    return await _earn_activity(user_id, guild_id, activity_type, rate, item_name, booster_config)
+
+@run_in_db_thread
+def _earn_activity(user_id, guild_id, activity_type, rate, item_name, booster_config: dict):
+    result = _run_activity_batch([activity_row(user_id, guild_id, activity_type, rate, item_name, booster_config)])
+    if not result:
+        logging.error(f"Ghi hoat dong cho user {user_id} that bai.")
+        return None
+    return result[0]
+
+def _run_activity_batch(rows):
+    # chuyen list row thanh 11 mang theo cot cho unnest
+    columns = tuple(list(column) for column in zip(*rows))
+    try:
+        _execute_prepared('ensure_activity_users', columns[:2], raise_errors=True)
+    except DatabaseError:
+        return None
+    result = _execute_prepared('apply_activity', columns, fetch='all', commit=True)
+    if result:
+        _refresh_activity_cache(result)
+    return result
+
+def _refresh_activity_cache(result_rows):
+    # chay sau commit, 2 db thread co the den nguoc thu tu: cache thi bo (lan doc sau nap lai tu db),
+    # BXH thi so balance_version de khong ghi de so du moi hon
+    for row in result_rows:
+        user_cache.invalidate((row['guild_id'], row['user_id']))
+        leaderboards.update(row['guild_id'], row['user_id'], row['balance'], row['balance_version'])
+
+async def apply_activity_batch(rows):
+    """
+    Ghi 1 lo hoat dong (message/reaction) da gom trong bo nho xuong bang users.
+    Moi row: (user_id, guild_id, msg_hits, msg_rate, msg_item, react_hits, react_rate, react_item,
+    boost_enabled, base_multiplier, per_boost_addition). Ca lo la 1 statement.
+    Tra ve True neu ghi thanh cong.
+    """
+    if not rows:
+        return True
+    return await _apply_activity_batch(rows) is not None
+
+@run_in_db_thread
+def _apply_activity_batch(rows):
+    result = _run_activity_batch(rows)
+    if result is None:
+        logging.error(f"Ghi lo hoat dong that bai ({len(rows)} user).")
+    return result
+
+@run_in_db_thread
+def get_boosted_users(guild_id):
+    # user dang co real_boosts > 0, de doi chieu voi danh sach booster tu discord
+    return _execute("SELECT user_id, real_boosts FROM users WHERE guild_id = %s AND real_boosts > 0", (guild_id,), fetch='all')
+
+# doi chieu boost ca guild bang 2 statement: upsert theo mang (user_id, so boost) tu discord,
+# roi reset nguoi khong con trong mang. chi row thuc su doi moi duoc ghi va tra ve.
+SYNC_BOOSTS_UPSERT = """
+INSERT INTO users (user_id, guild_id, real_boosts)
+SELECT b.user_id, %s, b.real_boosts FROM unnest(%s::bigint[], %s::int[]) AS b(user_id, real_boosts)
+ON CONFLICT (user_id, guild_id) DO UPDATE SET real_boosts = EXCLUDED.real_boosts
+    WHERE users.real_boosts IS DISTINCT FROM EXCLUDED.real_boosts
+RETURNING user_id, balance, balance_version
+"""
+SYNC_BOOSTS_RESET = """
+UPDATE users SET real_boosts = 0
+WHERE guild_id = %s AND real_boosts > 0 AND NOT (user_id = ANY(%s::bigint[]))
+RETURNING user_id
+"""
+
+@run_in_db_thread
+def sync_real_boosts(guild_id, boosts: dict):
+    """
+    Ghi so boost thuc te {user_id: so boost} cua ca guild, user chua co thi tao.
+    Tra ve list user_id da thay doi, None neu loi.
+    """
+    user_ids = list(boosts.keys())
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(SYNC_BOOSTS_UPSERT, (guild_id, user_ids, list(boosts.values())))
+                upserted = cur.fetchall()
+                cur.execute(SYNC_BOOSTS_RESET, (guild_id, user_ids))
+                reset = cur.fetchall()
+                conn.commit()
+    except Exception as e:
+        logging.error(f"Dong bo boost guild {guild_id} that bai: {e}")
+        return None
+
+    changed = [row['user_id'] for row in upserted] + [row['user_id'] for row in reset]
+    for user_id in changed:
+        user_cache.invalidate((guild_id, user_id))
+    for row in upserted:
+        leaderboards.add_if_missing(guild_id, row['user_id'], row['balance'], row['balance_version'])
+    return changed
+
+@run_in_db_thread
+def get_top_users(guild_id, limit=20):
+    query = "SELECT user_id, balance FROM users WHERE guild_id = %s ORDER BY balance DESC, user_id ASC LIMIT %s"
+    return _execute(query, (guild_id, limit), fetch='all')
+
+# thu tu BXH: balance DESC, user_id ASC (khop index idx_users_guild_balance)
+# chi la duong du phong khi BXH trong bo nho chua nap: position dem moi user dung truoc (O(hang))
+# va total dem ca guild (O(so user)), guild lon + user hang thap se cham
+USER_RANK_QUERY = """
+WITH me AS (
+    SELECT user_id, balance FROM users WHERE guild_id = %(guild_id)s AND user_id = %(user_id)s
+), above AS (
+    SELECT u.user_id, u.balance FROM users u, me
+    WHERE u.guild_id = %(guild_id)s AND (u.balance > me.balance OR (u.balance = me.balance AND u.user_id < me.user_id))
+    ORDER BY u.balance ASC, u.user_id DESC LIMIT %(radius)s
+), below AS (
+    SELECT u.user_id, u.balance FROM users u, me
+    WHERE u.guild_id = %(guild_id)s AND (u.balance < me.balance OR (u.balance = me.balance AND u.user_id > me.user_id))
+    ORDER BY u.balance DESC, u.user_id ASC LIMIT %(radius)s
+)
+SELECT w.user_id, w.balance,
+    (SELECT COUNT(*) FROM users u, me
+     WHERE u.guild_id = %(guild_id)s AND (u.balance > me.balance OR (u.balance = me.balance AND u.user_id < me.user_id))) AS position,
+    (SELECT COUNT(*) FROM users WHERE guild_id = %(guild_id)s) AS total
+FROM (SELECT * FROM above UNION ALL SELECT * FROM me UNION ALL SELECT * FROM below) w
+ORDER BY w.balance DESC, w.user_id ASC
+"""
+
+@run_in_db_thread
+def get_user_rank(user_id, guild_id, radius=2):
+    # hang + radius nguoi tren/duoi, None neu user chua co
+    rows = _execute(USER_RANK_QUERY, {'guild_id': guild_id, 'user_id': user_id, 'radius': radius}, fetch='all')
+    return rank_window(rows, user_id) if rows else None
+
+@run_in_db_thread
+def get_guild_users(guild_id):
+    # lay all user trong guild tu db
+    query = "SELECT user_id, balance, balance_version FROM users WHERE guild_id = %s ORDER BY user_id"
+    return _execute(query, (guild_id,), fetch='all')
+
+@run_in_db_thread
+def get_user_profile(user_id, guild_id):
+    # lay profile chi tiet
+    query = """
+    SELECT u.*, cr.role_id, cr.role_name, cr.role_color, cr.role_style, cr.gradient_color_1, cr.gradient_color_2
+    FROM users u
+    LEFT JOIN custom_roles cr ON u.user_id = cr.user_id AND u.guild_id = cr.guild_id
+    WHERE u.user_id = %s AND u.guild_id = %s;
+    """
+    return _execute(query, (user_id, guild_id), fetch='one')
+
+
+# Shop Role Functions
+@run_in_db_thread
+def add_role_to_shop(role_id, guild_id, price, creator_id=None, creation_price=None):
+    query = """
+    INSERT INTO shop_roles (role_id, guild_id, price, creator_id, creation_price) VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (role_id) DO UPDATE SET
+        guild_id = EXCLUDED.guild_id,
+        price = EXCLUDED.price,
+        creator_id = EXCLUDED.creator_id,
+        creation_price = EXCLUDED.creation_price;
+    """
+    _execute(query, (role_id, guild_id, price, creator_id, creation_price))
+
+@run_in_db_thread
+def remove_role_from_shop(role_id, guild_id):
+    _execute("DELETE FROM shop_roles WHERE role_id = %s AND guild_id = %s", (role_id, guild_id))
+
+register_statement('get_shop_roles', ('bigint',), "SELECT * FROM shop_roles WHERE guild_id = $1 ORDER BY price ASC")
+
+@run_in_db_thread
+def get_shop_roles(guild_id):
+    return _execute_prepared('get_shop_roles', (guild_id,), fetch='all')
+
+# Custom Role Functions
+@run_in_db_thread
+def get_custom_role(user_id, guild_id):
+    return _execute("SELECT * FROM custom_roles WHERE user_id = %s AND guild_id = %s", (user_id, guild_id), fetch='one')
+
+@run_in_db_thread
+def get_all_custom_roles_for_guild(guild_id):
+    return _execute("SELECT user_id, role_id FROM custom_roles WHERE guild_id = %s", (guild_id,), fetch='all')
+
+# member_ids join bang hash thay vi = ANY(...) de khong quet mang cho moi row
+INELIGIBLE_CUSTOM_ROLES_QUERY = """
+SELECT c.user_id, c.role_id, m.user_id IS NULL AS left_guild
+FROM custom_roles c
+LEFT JOIN users u ON u.user_id = c.user_id AND u.guild_id = c.guild_id
+LEFT JOIN unnest(%(member_ids)s::bigint[]) AS m(user_id) ON m.user_id = c.user_id
+WHERE c.guild_id = %(guild_id)s
+  AND (m.user_id IS NULL OR COALESCE(NULLIF(u.fake_boosts, 0), u.real_boosts, 0) < %(min_boosts)s)
+"""
+
+@run_in_db_thread
+def get_ineligible_custom_roles(guild_id, min_boosts, member_ids):
+    """
+    Role tuy chinh can thu hoi: chu so huu khong con trong member_ids (roi server)
+    hoac so boost hieu luc (fake uu tien hon real) < min_boosts. None neu loi.
+    """
+    params = {'guild_id': guild_id, 'min_boosts': min_boosts, 'member_ids': list(member_ids)}
+    return _execute(INELIGIBLE_CUSTOM_ROLES_QUERY, params, fetch='all')
+
+@run_in_db_thread
+def add_or_update_custom_role(user_id, guild_id, role_id, role_name, role_color, role_style=None, color1=None, color2=None):
+    query = """
+    INSERT INTO custom_roles (user_id, guild_id, role_id, role_name, role_color, role_style, gradient_color_1, gradient_color_2) 
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (user_id, guild_id) DO UPDATE SET
+        role_id = EXCLUDED.role_id,
+        role_name = EXCLUDED.role_name,
+        role_color = EXCLUDED.role_color,
+        role_style = EXCLUDED.role_style,
+        gradient_color_1 = EXCLUDED.gradient_color_1,
+        gradient_color_2 = EXCLUDED.gradient_color_2;
+    """
+    _execute(query, (user_id, guild_id, role_id, role_name, role_color, role_style, color1, color2))
+
+@run_in_db_thread
+def delete_custom_role_data(user_id, guild_id):
+    _execute("DELETE FROM custom_roles WHERE user_id = %s AND guild_id = %s", (user_id, guild_id))
+
+# Guild Config Functions
+@run_in_db_thread
+def get_all_guild_configs():
+    configs_list = _execute("SELECT guild_id, config_data FROM guild_configs", fetch='all')
+    config_map = {}
+    if configs_list:
+        for config_row in configs_list:
+            guild_id_str = str(config_row['guild_id'])
+            config_map[guild_id_str] = config_row.get('config_data', {})
+    return config_map
+
+@run_in_db_thread
+def get_guild_config(guild_id: int):
+    # Lay config cho 1 guild
+    row = _execute("SELECT config_data FROM guild_configs WHERE guild_id = %s", (guild_id,), fetch='one')
+    return row.get('config_data', {}) if row else None
+
+@run_in_db_thread
+def get_versioned_guild_config(guild_id: int):
+    # (config, version) de bot bo qua ban reload cu hon ban dang giu
+    row = _execute("SELECT config_data, version FROM guild_configs WHERE guild_id = %s", (guild_id,), fetch='one')
+    return (row.get('config_data') or {}, row['version']) if row else None
+
+@run_in_db_thread
+def get_guild_config_versions():
+    rows = _execute("SELECT guild_id, version FROM guild_configs", fetch='all')
+    return {row['guild_id']: row['version'] for row in rows} if rows is not None else None
+
+def start_config_listener(on_change, on_reconnect=None):
+    # on_change(guild_id, version) moi khi trigger tren guild_configs gui NOTIFY (ke ca tu dashboard)
+    global config_listener
+    config_listener = PgConfigListener(database_dsn)
+    config_listener.start(on_change, on_reconnect)
+
+async def stop_config_listener():
+    global config_listener
+    if config_listener is not None:
+        await config_listener.stop()
+        config_listener = None
+
+# merge tren server: `||` chi thay cac key cap 1 co trong updates, khong doc ra roi ghi lai ca config
+# nen 2 ben (bot, dashboard) sua key khac nhau cung luc khong de mat cua nhau.
+# trigger guild_configs_bump_version tu tang version, expected_version NULL thi bo qua kiem tra.
+UPDATE_GUILD_CONFIG_QUERY = """
+INSERT INTO guild_configs (guild_id, config_data) VALUES (%(guild_id)s, %(updates)s)
+ON CONFLICT (guild_id) DO UPDATE SET config_data = COALESCE(guild_configs.config_data, '{}'::jsonb) || EXCLUDED.config_data
+    WHERE %(expected_version)s::bigint IS NULL OR guild_configs.version = %(expected_version)s::bigint
+RETURNING version
+"""
+UPDATE_GUILD_CONFIGS_QUERY = """
+INSERT INTO guild_configs (guild_id, config_data)
+SELECT u.guild_id, u.updates::jsonb FROM unnest(%s::bigint[], %s::text[]) AS u(guild_id, updates)
+ON CONFLICT (guild_id) DO UPDATE SET config_data = COALESCE(guild_configs.config_data, '{}'::jsonb) || EXCLUDED.config_data
+RETURNING guild_id, version
+"""
+
+@run_in_db_thread
+def update_guild_config(guild_id: int, updates: dict, expected_version: int = None):
+    """
+    Ghi de cac key cap 1 trong updates, key khac giu nguyen. expected_version: chi ghi neu config
+    dang o dung version do (guild chua co config thi luon tao). Tra ve version moi, None neu lech version / loi.
+    """
+    if not updates:
+        return None
+    params = {'guild_id': guild_id, 'updates': Json(updates), 'expected_version': expected_version}
+    row = _execute(UPDATE_GUILD_CONFIG_QUERY, params, fetch='one', commit=True)
+    return row['version'] if row else None
+
+@run_in_db_thread
+def set_guild_config_path(guild_id: int, path, value, expected_version: int = None):
+    """
+    Ghi 1 gia tri long nhau bang jsonb_set, vd path=('CURRENCY_RATES', 'channels', '123').
+    Object trung gian chua co duoc tao. Tra ve version moi, None neu lech version / loi.
+    """
+    path = [str(key) for key in path]
+    if not path:
+        return None
+    # jsonb_set chi tao duoc key cuoi -> tao san {} cho tung muc trung gian con thieu
+    expression = "COALESCE(guild_configs.config_data, '{}'::jsonb)"
+    params = []
+    for depth in range(1, len(path)):
+        expression = f"jsonb_set({expression}, %s::text[], COALESCE(guild_configs.config_data #> %s::text[], '{{}}'::jsonb))"
+        params += [path[:depth], path[:depth]]
+    expression = f"jsonb_set({expression}, %s::text[], %s::jsonb)"
+    params += [path, Json(value)]
+
+    # guild chua co config -> insert thang object long nhau
+    nested = value
+    for key in reversed(path):
+        nested = {key: nested}
+    query = f"""
+        INSERT INTO guild_configs (guild_id, config_data) VALUES (%s, %s)
+        ON CONFLICT (guild_id) DO UPDATE SET config_data = {expression}
+            WHERE %s::bigint IS NULL OR guild_configs.version = %s::bigint
+        RETURNING version
+    """
+    row = _execute(query, (guild_id, Json(nested), *params, expected_version, expected_version), fetch='one', commit=True)
+    return row['version'] if row else None
+
+@run_in_db_thread
+def update_guild_configs(updates_by_guild: dict):
+    """
+    Nhu update_guild_config cho nhieu guild trong 1 statement: {guild_id: updates}.
+    Tra ve {guild_id: version moi}, None neu loi.
+    """
+    updates_by_guild = {guild_id: updates for guild_id, updates in updates_by_guild.items() if updates}
+    if not updates_by_guild:
+        return {}
+    params = (list(updates_by_guild.keys()), [json.dumps(updates) for updates in updates_by_guild.values()])
+    rows = _execute(UPDATE_GUILD_CONFIGS_QUERY, params, fetch='all', commit=True)
+    return {row['guild_id']: row['version'] for row in rows} if rows is not None else None
+
+
+# DM Outbox Functions
+@run_in_db_thread
+def enqueue_dm(user_id, guild_id, payload: dict):
+    # tra ve id cua DM trong hang doi, None neu loi
+    row = _execute(
+        "INSERT INTO dm_outbox (user_id, guild_id, payload) VALUES (%s, %s, %s) RETURNING id",
+        (user_id, guild_id, Json(payload)), fetch='one', commit=True
+    )
+    return row['id'] if row else None
+
+# lay DM den han va "thue" trong lease_seconds: worker chet giua chung thi het han thue se duoc lay lai.
+# SKIP LOCKED de nhieu instance bot khong lay trung.
+CLAIM_DUE_DMS_QUERY = """
+UPDATE dm_outbox SET attempts = attempts + 1, next_attempt_at = now() + make_interval(secs => %s)
+WHERE id IN (
+    SELECT id FROM dm_outbox WHERE next_attempt_at <= now()
+    ORDER BY next_attempt_at, id LIMIT %s FOR UPDATE SKIP LOCKED
+)
+RETURNING id, user_id, guild_id, payload, attempts
+"""
+
+@run_in_db_thread
+def claim_due_dms(limit=50, lease_seconds=300):
+    return _execute(CLAIM_DUE_DMS_QUERY, (lease_seconds, limit), fetch='all', commit=True)
+
+@run_in_db_thread
+def delete_dm(dm_id):
+    _execute("DELETE FROM dm_outbox WHERE id = %s", (dm_id,))
+
+@run_in_db_thread
+def reschedule_dm(dm_id, delay_seconds, error=None):
+    _execute(
+        "UPDATE dm_outbox SET next_attempt_at = now() + make_interval(secs => %s), last_error = %s WHERE id = %s",
+        (delay_seconds, error, dm_id)
+    )
+
+@run_in_db_thread
+def get_dm_closed_users(max_age_days=7):
+    # user chan DM trong max_age_days ngay gan day, qua han thi thu gui lai
+    rows = _execute(
+        "SELECT user_id FROM dm_closed_users WHERE closed_at > now() - make_interval(days => %s)",
+        (max_age_days,), fetch='all'
+    )
+    return [row['user_id'] for row in rows] if rows is not None else None
+
+@run_in_db_thread
+def set_dm_closed(user_id, closed=True):
+    if closed:
+        query = "INSERT INTO dm_closed_users (user_id) VALUES (%s) ON CONFLICT (user_id) DO UPDATE SET closed_at = now()"
+    else:
+        query = "DELETE FROM dm_closed_users WHERE user_id = %s"
+    _execute(query, (user_id,))
+
+# Balance Functions
+# moi ham doi so du + ghi log gd trong 1 statement, tra ve so du moi (None neu that bai)
+# tham so chung: $1 user_id, $2 guild_id, $3 amount, $4 transaction_type, $5 item_name
+BALANCE_PARAM_TYPES = ('bigint', 'bigint', 'bigint', 'text', 'text')
+
+# chi tru khi du tien
+register_statement('try_debit', BALANCE_PARAM_TYPES, """
+    WITH debited AS (
+        UPDATE users SET balance = balance - $3
+        WHERE user_id = $1 AND guild_id = $2 AND balance >= $3
+        RETURNING user_id, guild_id, balance, balance_version
+    ), ledger AS (
+        INSERT INTO transactions (guild_id, user_id, transaction_type, item_name, amount_changed, new_balance)
+        SELECT guild_id, user_id, $4, $5, -$3, balance FROM debited
+    )
+    SELECT balance, balance_version FROM debited
+""")
+
+# cong coin, tu tao user neu chua co
+register_statement('credit', BALANCE_PARAM_TYPES, """
+    WITH credited AS (
+        INSERT INTO users AS u (user_id, guild_id, balance) VALUES ($1, $2, $3)
+        ON CONFLICT (user_id, guild_id) DO UPDATE SET balance = u.balance + EXCLUDED.balance
+        RETURNING u.user_id, u.guild_id, u.balance, u.balance_version
+    ), ledger AS (
+        INSERT INTO transactions (guild_id, user_id, transaction_type, item_name, amount_changed, new_balance)
+        SELECT guild_id, user_id, $4, $5, $3, balance FROM credited
+    )
+    SELECT balance, balance_version FROM credited
+""")
+
+# dat so du chinh xac, log phan chenh lech so voi so du cu
+register_statement('set_balance', BALANCE_PARAM_TYPES, """
+    WITH old AS (
+        SELECT balance FROM users WHERE user_id = $1 AND guild_id = $2 FOR UPDATE
+    ), updated AS (
+        INSERT INTO users AS u (user_id, guild_id, balance) VALUES ($1, $2, $3)
+        ON CONFLICT (user_id, guild_id) DO UPDATE SET balance = EXCLUDED.balance
+        RETURNING u.user_id, u.guild_id, u.balance, u.balance_version
+    ), ledger AS (
+        INSERT INTO transactions (guild_id, user_id, transaction_type, item_name, amount_changed, new_balance)
+        SELECT guild_id, user_id, $4, $5, balance - COALESCE((SELECT balance FROM old), 0), balance
+        FROM updated
+    )
+    SELECT balance, balance_version FROM updated
+""")
+
+def _change_balance(statement, user_id, guild_id, amount, transaction_type, item_name, raise_errors=False):
+    row = _execute_prepared(
+        statement, (user_id, guild_id, amount, transaction_type, item_name), fetch='one', commit=True, raise_errors=raise_errors
+    )
+    if row:
+        # xem _refresh_activity_cache: bo cache, BXH so version
+        user_cache.invalidate((guild_id, user_id))
+        leaderboards.update(guild_id, user_id, row['balance'], row['balance_version'])
+        return row['balance']
+    return None
+
+@run_in_db_thread
+def try_debit(user_id, guild_id, amount, transaction_type, item_name):
+    # None = khong du coin, loi db raise DatabaseError
+    return _change_balance('try_debit', user_id, guild_id, amount, transaction_type, item_name, raise_errors=True)
+
+@run_in_db_thread
+def credit(user_id, guild_id, amount, transaction_type, item_name):
+    return _change_balance('credit', user_id, guild_id, amount, transaction_type, item_name)
+
+@run_in_db_thread
+def set_balance(user_id, guild_id, amount, transaction_type, item_name):
+    return _change_balance('set_balance', user_id, guild_id, amount, transaction_type, item_name)
+
+
+# Transaction Log Functions
+LEDGER_COLUMNS = ('guild_id', 'user_id', 'transaction_type', 'item_name', 'amount_changed', 'new_balance', 'timestamp')
+# lo log gd ghi that bai het so lan thu -> ghi ra file (csv, cung thu tu LEDGER_COLUMNS) de nap lai bang COPY
+LEDGER_DEAD_LETTER_PATH = 'ledger_dead_letter.csv'
+
+def start_ledger_writer(max_batch: int = 1000, flush_interval: float = 5.0, max_queue: int = 50000):
+    # phai goi trong event loop (setup_hook)
+    global ledger_writer
+    ledger_writer = LedgerWriter(
+        copy_transactions, max_batch=max_batch, flush_interval=flush_interval, max_queue=max_queue,
+        dead_letter_path=LEDGER_DEAD_LETTER_PATH
+    )
+    ledger_writer.start()
+
+async def close_ledger_writer():
+    # ghi het log gd con trong hang doi, goi sau khi cogs da flush xong
+    if ledger_writer is not None:
+        await ledger_writer.close()
+        logging.info(
+            f"Ledger writer da dung. Da ghi {ledger_writer.rows_written} log gd, "
+            f"{ledger_writer.rows_dead_lettered} log gd nam trong {LEDGER_DEAD_LETTER_PATH}, bo {ledger_writer.rows_dropped}."
+        )
+
+async def log_transaction(guild_id, user_id, transaction_type, item_name, amount_changed, new_balance):
+    # thoi diem gd lay luc goi, khong phai luc ghi xuong db
+    row = (guild_id, user_id, transaction_type, item_name, amount_changed, new_balance, datetime.now(timezone.utc))
+    if ledger_writer is None or ledger_writer.closed:
+        await copy_transactions([row])
+    else:
+        await ledger_writer.put(row)
+
+@run_in_db_thread
+def copy_transactions(rows):
+    # ghi nhieu log gd bang 1 lenh COPY, tra ve True neu thanh cong
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([value.isoformat() if isinstance(value, datetime) else value for value in row])
+    buffer.seek(0)
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.copy_expert(f"COPY transactions ({', '.join(LEDGER_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+            conn.commit()
+        return True
+    except Exception as e:
+        logging.error(f"COPY {len(rows)} log gd that bai: {e}")
+        return False
+
+@run_in_db_thread
+def get_guild_transactions(guild_id, limit=50, offset=0):
+    # giu lai cho tuong thich, trang sau cham dan theo offset -> dung ban keyset
+    query = "SELECT * FROM transactions WHERE guild_id = %s ORDER BY timestamp DESC, transaction_id DESC LIMIT %s OFFSET %s"
+    return _execute(query, (guild_id, limit, offset), fetch='all')
+
+@run_in_db_thread
+def get_user_transactions(guild_id, user_id, limit=50, offset=0):
+    query = "SELECT * FROM transactions WHERE guild_id = %s AND user_id = %s ORDER BY timestamp DESC, transaction_id DESC LIMIT %s OFFSET %s"
+    return _execute(query, (guild_id, user_id, limit, offset), fetch='all')
+
+def _next_cursor(rows, limit):
+    # cursor = (timestamp, transaction_id) cua row cuoi, None neu het du lieu
+    if not rows or len(rows) < limit:
+        return None
+    return (rows[-1]['timestamp'], rows[-1]['transaction_id'])
+
+@run_in_db_thread
+def get_guild_transactions_page(guild_id, limit=50, cursor=None):
+    """
+    Lich su gd theo keyset, moi trang chi quet `limit` row tren index.
+    Tra ve (rows, next_cursor); truyen next_cursor vao lan goi sau de lay trang tiep.
+    """
+    if cursor is None:
+        query = "SELECT * FROM transactions WHERE guild_id = %s ORDER BY timestamp DESC, transaction_id DESC LIMIT %s"
+        params = (guild_id, limit)
+    else:
+        query = """
+        SELECT * FROM transactions WHERE guild_id = %s AND (timestamp, transaction_id) < (%s, %s)
+        ORDER BY timestamp DESC, transaction_id DESC LIMIT %s
+        """
+        params = (guild_id, cursor[0], cursor[1], limit)
+    rows = _execute(query, params, fetch='all') or []
+    return rows, _next_cursor(rows, limit)
+
+@run_in_db_thread
+def get_user_transactions_page(guild_id, user_id, limit=50, cursor=None):
+    # giong get_guild_transactions_page nhung loc theo user
+    if cursor is None:
+        query = "SELECT * FROM transactions WHERE guild_id = %s AND user_id = %s ORDER BY timestamp DESC, transaction_id DESC LIMIT %s"
+        params = (guild_id, user_id, limit)
+    else:
+        query = """
+        SELECT * FROM transactions WHERE guild_id = %s AND user_id = %s AND (timestamp, transaction_id) < (%s, %s)
+        ORDER BY timestamp DESC, transaction_id DESC LIMIT %s
+        """
+        params = (guild_id, user_id, cursor[0], cursor[1], limit)
+    rows = _execute(query, params, fetch='all') or []
+    return rows, _next_cursor(rows, limit)
+
+@run_in_db_thread
+def count_guild_transactions(guild_id, exact=False):
+    # mac dinh doc bo dem duy tri boi trigger, exact=True de COUNT(*) that
+    if exact:
+        result = _execute("SELECT COUNT(*) as total FROM transactions WHERE guild_id = %s", (guild_id,), fetch='one')
+    else:
+        result = _execute("SELECT total FROM transaction_counts WHERE guild_id = %s", (guild_id,), fetch='one')
+    return result['total'] if result else 0
\ No newline at end of file
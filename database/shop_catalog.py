@@ -0,0 +1,86 @@
+"""
+Catalog shop trong bo nho theo guild: nap lan dau khi can, giu toi khi co thao tac ghi vao shop_roles
+(addrole/removerole, tao/xoa role tuy chinh) hoac role tren discord bi xoa/sua thi bo di de nap lai.
+"""
+import itertools
+
+class ShopCatalog:
+    """
+    Danh sach role dang ban cua 1 guild, sap theo gia (roi role_id de thu tu on dinh).
+    Vi tri hien thi (1, 2, ...) chinh la so thu tu trong danh sach role va o SellModal.
+    Khong sua tai cho: thay doi shop_roles thi tao catalog moi.
+    """
+    __slots__ = ('guild_id', 'version', 'roles', 'by_id', 'positions', 'creator_ids')
+
+    def __init__(self, guild_id: int, rows, version: int = 0):
+        self.guild_id = guild_id
+        # moi ban catalog da luu 1 version rieng, dung lam khoa cho phan hien thi dung san; 0 = ban khong luu
+        self.version = version
+        self.roles = tuple(sorted(rows or (), key=lambda row: (row['price'], row['role_id'])))
+        self.by_id = {row['role_id']: row for row in self.roles}
+        self.positions = {row['role_id']: position for position, row in enumerate(self.roles, start=1)}
+        self.creator_ids = frozenset(row['creator_id'] for row in self.roles if row.get('creator_id'))
+
+    def __len__(self):
+        return len(self.roles)
+
+    def __iter__(self):
+        return iter(self.roles)
+
+    def __contains__(self, role_id):
+        return role_id in self.by_id
+
+    def get(self, role_id: int):
+        return self.by_id.get(role_id)
+
+    def at(self, position: int):
+        # position tinh tu 1, ngoai khoang -> None
+        if 1 <= position <= len(self.roles):
+            return self.roles[position - 1]
+        return None
+
+    def position_of(self, role_id: int):
+        return self.positions.get(role_id)
+
+    def missing_roles(self, existing_role_ids) -> list:
+        # role trong shop nhung khong con tren discord
+        existing_role_ids = set(existing_role_ids)
+        return [role_id for role_id in self.by_id if role_id not in existing_role_ids]
+
+class ShopCatalogs:
+    """
+    guild_id -> ShopCatalog. Chi dung tren event loop cua bot (facade database.py).
+    Moi lan invalidate tang generation cua guild: ban nap dang do truoc do se khong duoc luu,
+    tranh ghi de catalog cu len sau khi shop vua doi.
+    """
+    def __init__(self):
+        self._catalogs = {}
+        self._generations = {}
+        self._versions = itertools.count(1)
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, guild_id: int):
+        catalog = self._catalogs.get(guild_id)
+        self.stats['hits' if catalog is not None else 'misses'] += 1
+        return catalog
+
+    def peek(self, guild_id: int):
+        # khong tinh vao stats, dung cho event discord (chi quan tam guild da nap)
+        return self._catalogs.get(guild_id)
+
+    def begin_load(self, guild_id: int) -> int:
+        return self._generations.get(guild_id, 0)
+
+    def store(self, guild_id: int, rows, generation: int) -> ShopCatalog:
+        # shop doi trong luc nap -> khong luu, tra ve ban version 0 (phan hien thi khong cache ban nay)
+        if self._generations.get(guild_id, 0) != generation:
+            return ShopCatalog(guild_id, rows)
+        catalog = self._catalogs[guild_id] = ShopCatalog(guild_id, rows, next(self._versions))
+        return catalog
+
+    def invalidate(self, guild_id: int):
+        self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+        self.stats['invalidations'] += 1
+        self._catalogs.pop(guild_id, None)
+
+shop_catalogs = ShopCatalogs()
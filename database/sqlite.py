@@ -0,0 +1,625 @@
+"""
+Backend SQLite (file hoac ':memory:'), chi can thu vien chuan. Dung cho test, CI va
+load test offline; 1 ket noi chay tren 1 thread rieng nen moi ham la 1 transaction tuan tu.
+"""
+import sqlite3
+import json
+import asyncio
+import functools
+import logging
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from database.activity import activity_row, compute_activity, earn_ledger_entries
+from database.partitions import current_month, retention_cutoff
+from database.leaderboard import leaderboards, rank_window
+from database.config_notify import LocalConfigNotifier
+from database.errors import DatabaseError
+
+conn = None
+db_executor = None
+config_notifier = LocalConfigNotifier()
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER NOT NULL,
+    guild_id INTEGER NOT NULL,
+    balance INTEGER DEFAULT 0,
+    message_count INTEGER DEFAULT 0,
+    reaction_count INTEGER DEFAULT 0,
+    fake_boosts INTEGER DEFAULT 0,
+    real_boosts INTEGER DEFAULT 0,
+    PRIMARY KEY (user_id, guild_id)
+);
+CREATE INDEX IF NOT EXISTS idx_users_guild_balance ON users (guild_id, balance DESC, user_id);
+CREATE TABLE IF NOT EXISTS shop_roles (
+    role_id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    creator_id INTEGER,
+    creation_price INTEGER
+);
+CREATE TABLE IF NOT EXISTS custom_roles (
+    user_id INTEGER NOT NULL,
+    guild_id INTEGER NOT NULL,
+    role_id INTEGER NOT NULL,
+    role_name TEXT,
+    role_color TEXT,
+    role_style TEXT,
+    gradient_color_1 TEXT,
+    gradient_color_2 TEXT,
+    PRIMARY KEY (user_id, guild_id)
+);
+CREATE TABLE IF NOT EXISTS guild_configs (
+    guild_id INTEGER PRIMARY KEY,
+    config_data TEXT,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    transaction_type TEXT NOT NULL,
+    item_name TEXT,
+    amount_changed INTEGER NOT NULL,
+    new_balance INTEGER NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_guild_time ON transactions (guild_id, timestamp DESC, transaction_id DESC);
+CREATE INDEX IF NOT EXISTS idx_transactions_guild_user_time ON transactions (guild_id, user_id, timestamp DESC, transaction_id DESC);
+CREATE TABLE IF NOT EXISTS transaction_daily_summary (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    transaction_type TEXT NOT NULL,
+    tx_count INTEGER NOT NULL,
+    amount_total INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, user_id, day, transaction_type)
+);
+CREATE TABLE IF NOT EXISTS dm_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    guild_id INTEGER,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT NOT NULL,
+    last_error TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_dm_outbox_due ON dm_outbox (next_attempt_at, id);
+CREATE TABLE IF NOT EXISTS dm_closed_users (
+    user_id INTEGER PRIMARY KEY,
+    closed_at TEXT NOT NULL
+);
+'''
+
+def run_in_db_thread(func=None, *, on_error=None):
+    """
+    sqlite3 khong dung chung ket noi giua cac thread -> moi thu chay tren 1 thread cua db_executor.
+    Loi sqlite (vd: database is locked) duoc log va tra ve on_error giong ban postgres (mac dinh None);
+    on_error la ham (vd: list) thi goi de moi lan tra ve 1 gia tri moi.
+    """
+    if func is None:
+        return functools.partial(run_in_db_thread, on_error=on_error)
+
+    def call(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except sqlite3.Error as e:
+            logging.error(f"Query sqlite that bai ({func.__name__}): {e}")
+            return on_error() if callable(on_error) else on_error
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if db_executor is None:
+            raise Exception("Database executor khong duoc khoi tao.")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(db_executor, functools.partial(call, *args, **kwargs))
+    return wrapper
+
+def _dict_factory(cursor, row):
+    return {column[0]: row[i] for i, column in enumerate(cursor.description)}
+
+def init_db(database_url: str = None, **options):
+    # database_url la duong dan file sqlite, mac dinh ':memory:'; tham so cache/pool cua postgres bi bo qua
+    global conn, db_executor
+    db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+    conn = db_executor.submit(_connect, database_url or ':memory:').result()
+    logging.info(f"Database SQLite khoi tao thanh cong ({database_url or ':memory:'}).")
+
+def _connect(path):
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.row_factory = _dict_factory
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    # file tao truoc khi co cot version
+    columns = {row['name'] for row in connection.execute("PRAGMA table_info(guild_configs)")}
+    if 'version' not in columns:
+        connection.execute("ALTER TABLE guild_configs ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    connection.commit()
+    return connection
+
+def close_db():
+    global conn, db_executor
+    if db_executor is not None:
+        db_executor.shutdown(wait=True)
+        db_executor = None
+    if conn is not None:
+        conn.close()
+        conn = None
+
+def start_ledger_writer(**options):
+    # ghi log gd thang trong cung transaction, khong can hang doi
+    pass
+
+async def close_ledger_writer():
+    pass
+
+def get_user_cache_stats():
+    return None
+
+def get_pool_stats():
+    return None
+
+def _now(offset_seconds: float = 0):
+    return (datetime.now(timezone.utc) + timedelta(seconds=offset_seconds)).isoformat(timespec='microseconds')
+
+def _ensure_user(user_id, guild_id):
+    conn.execute("INSERT INTO users (user_id, guild_id) VALUES (?, ?) ON CONFLICT (user_id, guild_id) DO NOTHING", (user_id, guild_id))
+
+def _get_user(user_id, guild_id):
+    return conn.execute("SELECT * FROM users WHERE user_id = ? AND guild_id = ?", (user_id, guild_id)).fetchone()
+
+def _insert_transaction(guild_id, user_id, transaction_type, item_name, amount_changed, new_balance):
+    conn.execute(
+        "INSERT INTO transactions (guild_id, user_id, transaction_type, item_name, amount_changed, new_balance, timestamp) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (guild_id, user_id, transaction_type, item_name, amount_changed, new_balance, _now())
+    )
+
+def _transaction_row(row):
+    row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+    return row
+
+# User Functions
+@run_in_db_thread
+def get_or_create_user(user_id, guild_id):
+    with conn:
+        _ensure_user(user_id, guild_id)
+        user = _get_user(user_id, guild_id)
+    leaderboards.add_if_missing(guild_id, user_id, user['balance'])
+    return user
+
+@run_in_db_thread
+def update_user_data(user_id, guild_id, **kwargs):
+    fields = ', '.join([f'{key} = ?' for key in kwargs])
+    with conn:
+        conn.execute(f"UPDATE users SET {fields} WHERE user_id = ? AND guild_id = ?", (*kwargs.values(), user_id, guild_id))
+    if 'balance' in kwargs:
+        leaderboards.update(guild_id, user_id, kwargs['balance'])
+
+def _apply_activity(rows):
+    results = []
+    with conn:
+        for row in rows:
+            user_id, guild_id = row[0], row[1]
+            _ensure_user(user_id, guild_id)
+            earned = compute_activity(_get_user(user_id, guild_id), row)
+            conn.execute(
+                "UPDATE users SET balance = balance + ?, message_count = ?, reaction_count = ? WHERE user_id = ? AND guild_id = ?",
+                (earned['coins_earned'], earned['message_count'], earned['reaction_count'], user_id, guild_id)
+            )
+            balance = _get_user(user_id, guild_id)['balance']
+            leaderboards.update(guild_id, user_id, balance)
+            result = {'user_id': user_id, 'guild_id': guild_id, 'balance': balance, **earned}
+            for transaction_type, item_name, amount in earn_ledger_entries(result):
+                _insert_transaction(guild_id, user_id, transaction_type, item_name, amount, balance)
+            results.append(result)
+    return results
+
+@run_in_db_thread
+def earn_activity(user_id, guild_id, activity_type, rate, item_name, booster_config: dict):
+    try:
+        return _apply_activity([activity_row(user_id, guild_id, activity_type, rate, item_name, booster_config)])[0]
+    except sqlite3.Error as e:
+        logging.error(f"Ghi hoat dong cho user {user_id} that bai: {e}")
+        return None
+
+@run_in_db_thread
+def apply_activity_batch(rows):
+    try:
+        _apply_activity(rows)
+        return True
+    except sqlite3.Error as e:
+        logging.error(f"Ghi lo hoat dong that bai ({len(rows)} user): {e}")
+        return False
+
+@run_in_db_thread
+def get_boosted_users(guild_id):
+    return conn.execute("SELECT user_id, real_boosts FROM users WHERE guild_id = ? AND real_boosts > 0", (guild_id,)).fetchall()
+
+@run_in_db_thread
+def sync_real_boosts(guild_id, boosts: dict):
+    with conn:
+        current = {
+            row['user_id']: row['real_boosts']
+            for row in conn.execute("SELECT user_id, real_boosts FROM users WHERE guild_id = ? AND real_boosts > 0", (guild_id,))
+        }
+        changed = [(user_id, count) for user_id, count in boosts.items() if current.get(user_id) != count]
+        stopped = [user_id for user_id in current if user_id not in boosts]
+        conn.executemany(
+            """
+            INSERT INTO users (user_id, guild_id, real_boosts) VALUES (?, ?, ?)
+            ON CONFLICT (user_id, guild_id) DO UPDATE SET real_boosts = excluded.real_boosts
+            """,
+            [(user_id, guild_id, count) for user_id, count in changed]
+        )
+        conn.executemany("UPDATE users SET real_boosts = 0 WHERE guild_id = ? AND user_id = ?", [(guild_id, user_id) for user_id in stopped])
+    for user_id, _ in changed:
+        leaderboards.add_if_missing(guild_id, user_id, 0)
+    return [user_id for user_id, _ in changed] + stopped
+
+@run_in_db_thread
+def get_top_users(guild_id, limit=20):
+    return conn.execute(
+        "SELECT user_id, balance FROM users WHERE guild_id = ? ORDER BY balance DESC, user_id ASC LIMIT ?", (guild_id, limit)
+    ).fetchall()
+
+@run_in_db_thread
+def get_user_rank(user_id, guild_id, radius=2):
+    params = {'guild_id': guild_id, 'user_id': user_id, 'radius': radius}
+    me = conn.execute("SELECT user_id, balance FROM users WHERE guild_id = :guild_id AND user_id = :user_id", params).fetchone()
+    if me is None:
+        return None
+    params['balance'] = me['balance']
+    higher = "guild_id = :guild_id AND (balance > :balance OR (balance = :balance AND user_id < :user_id))"
+    lower = "guild_id = :guild_id AND (balance < :balance OR (balance = :balance AND user_id > :user_id))"
+    above = conn.execute(f"SELECT user_id, balance FROM users WHERE {higher} ORDER BY balance ASC, user_id DESC LIMIT :radius", params).fetchall()
+    below = conn.execute(f"SELECT user_id, balance FROM users WHERE {lower} ORDER BY balance DESC, user_id ASC LIMIT :radius", params).fetchall()
+    position = conn.execute(f"SELECT COUNT(*) AS n FROM users WHERE {higher}", params).fetchone()['n']
+    total = conn.execute("SELECT COUNT(*) AS n FROM users WHERE guild_id = :guild_id", params).fetchone()['n']
+    rows = [{**row, 'position': position, 'total': total} for row in [*reversed(above), me, *below]]
+    return rank_window(rows, user_id)
+
+@run_in_db_thread
+def get_guild_users(guild_id):
+    return conn.execute("SELECT user_id, balance FROM users WHERE guild_id = ? ORDER BY user_id", (guild_id,)).fetchall()
+
+@run_in_db_thread
+def get_user_profile(user_id, guild_id):
+    return conn.execute('''
+        SELECT u.*, cr.role_id, cr.role_name, cr.role_color, cr.role_style, cr.gradient_color_1, cr.gradient_color_2
+        FROM users u
+        LEFT JOIN custom_roles cr ON u.user_id = cr.user_id AND u.guild_id = cr.guild_id
+        WHERE u.user_id = ? AND u.guild_id = ?
+    ''', (user_id, guild_id)).fetchone()
+
+@run_in_db_thread
+def try_debit(user_id, guild_id, amount, transaction_type, item_name):
+    # None = khong du coin, loi db raise DatabaseError (giong postgres)
+    try:
+        with conn:
+            cur = conn.execute(
+                "UPDATE users SET balance = balance - ? WHERE user_id = ? AND guild_id = ? AND balance >= ?",
+                (amount, user_id, guild_id, amount)
+            )
+            if cur.rowcount == 0:
+                return None
+            balance = _get_user(user_id, guild_id)['balance']
+            _insert_transaction(guild_id, user_id, transaction_type, item_name, -amount, balance)
+    except sqlite3.Error as e:
+        logging.error(f"Tru {amount} coin cua user {user_id} that bai: {e}")
+        raise DatabaseError(str(e)) from e
+    leaderboards.update(guild_id, user_id, balance)
+    return balance
+
+@run_in_db_thread
+def credit(user_id, guild_id, amount, transaction_type, item_name):
+    with conn:
+        _ensure_user(user_id, guild_id)
+        conn.execute("UPDATE users SET balance = balance + ? WHERE user_id = ? AND guild_id = ?", (amount, user_id, guild_id))
+        balance = _get_user(user_id, guild_id)['balance']
+        _insert_transaction(guild_id, user_id, transaction_type, item_name, amount, balance)
+        leaderboards.update(guild_id, user_id, balance)
+        return balance
+
+@run_in_db_thread
+def set_balance(user_id, guild_id, amount, transaction_type, item_name):
+    with conn:
+        _ensure_user(user_id, guild_id)
+        old_balance = _get_user(user_id, guild_id)['balance']
+        conn.execute("UPDATE users SET balance = ? WHERE user_id = ? AND guild_id = ?", (amount, user_id, guild_id))
+        _insert_transaction(guild_id, user_id, transaction_type, item_name, amount - old_balance, amount)
+        leaderboards.update(guild_id, user_id, amount)
+        return amount
+
+# Shop Role Functions
+@run_in_db_thread
+def add_role_to_shop(role_id, guild_id, price, creator_id=None, creation_price=None):
+    with conn:
+        conn.execute('''
+            INSERT INTO shop_roles (role_id, guild_id, price, creator_id, creation_price) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (role_id) DO UPDATE SET
+                guild_id = excluded.guild_id, price = excluded.price,
+                creator_id = excluded.creator_id, creation_price = excluded.creation_price
+        ''', (role_id, guild_id, price, creator_id, creation_price))
+
+@run_in_db_thread
+def remove_role_from_shop(role_id, guild_id):
+    with conn:
+        conn.execute("DELETE FROM shop_roles WHERE role_id = ? AND guild_id = ?", (role_id, guild_id))
+
+@run_in_db_thread
+def get_shop_roles(guild_id):
+    return conn.execute("SELECT * FROM shop_roles WHERE guild_id = ? ORDER BY price ASC", (guild_id,)).fetchall()
+
+# Custom Role Functions
+@run_in_db_thread
+def get_custom_role(user_id, guild_id):
+    return conn.execute("SELECT * FROM custom_roles WHERE user_id = ? AND guild_id = ?", (user_id, guild_id)).fetchone()
+
+@run_in_db_thread
+def get_all_custom_roles_for_guild(guild_id):
+    return conn.execute("SELECT user_id, role_id FROM custom_roles WHERE guild_id = ?", (guild_id,)).fetchall()
+
+@run_in_db_thread
+def get_ineligible_custom_roles(guild_id, min_boosts, member_ids):
+    # member_ids truyen dang mang json, join qua json_each
+    return conn.execute(
+        """
+        SELECT c.user_id, c.role_id, m.value IS NULL AS left_guild
+        FROM custom_roles c
+        LEFT JOIN users u ON u.user_id = c.user_id AND u.guild_id = c.guild_id
+        LEFT JOIN json_each(:member_ids) m ON m.value = c.user_id
+        WHERE c.guild_id = :guild_id
+          AND (m.value IS NULL OR COALESCE(NULLIF(u.fake_boosts, 0), u.real_boosts, 0) < :min_boosts)
+        """,
+        {'guild_id': guild_id, 'min_boosts': min_boosts, 'member_ids': json.dumps(list(member_ids))}
+    ).fetchall()
+
+@run_in_db_thread
+def add_or_update_custom_role(user_id, guild_id, role_id, role_name, role_color, role_style=None, color1=None, color2=None):
+    with conn:
+        conn.execute('''
+            INSERT INTO custom_roles (user_id, guild_id, role_id, role_name, role_color, role_style, gradient_color_1, gradient_color_2)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, guild_id) DO UPDATE SET
+                role_id = excluded.role_id, role_name = excluded.role_name, role_color = excluded.role_color,
+                role_style = excluded.role_style, gradient_color_1 = excluded.gradient_color_1,
+                gradient_color_2 = excluded.gradient_color_2
+        ''', (user_id, guild_id, role_id, role_name, role_color, role_style, color1, color2))
+
+@run_in_db_thread
+def delete_custom_role_data(user_id, guild_id):
+    with conn:
+        conn.execute("DELETE FROM custom_roles WHERE user_id = ? AND guild_id = ?", (user_id, guild_id))
+
+# Guild Config Functions
+@run_in_db_thread
+def get_all_guild_configs():
+    rows = conn.execute("SELECT guild_id, config_data FROM guild_configs").fetchall()
+    return {str(row['guild_id']): json.loads(row['config_data'] or '{}') for row in rows}
+
+@run_in_db_thread
+def get_guild_config(guild_id: int):
+    row = conn.execute("SELECT config_data FROM guild_configs WHERE guild_id = ?", (guild_id,)).fetchone()
+    return json.loads(row['config_data'] or '{}') if row else None
+
+def _write_guild_config(guild_id, merge, expected_version=None):
+    # merge(config) sua config tai cho; doc + ghi trong cung 1 transaction, phai o trong `with conn`
+    row = conn.execute("SELECT config_data, version FROM guild_configs WHERE guild_id = ?", (guild_id,)).fetchone()
+    if row and expected_version is not None and row['version'] != expected_version:
+        return None
+    config = json.loads(row['config_data'] or '{}') if row else {}
+    merge(config)
+    return conn.execute('''
+        INSERT INTO guild_configs (guild_id, config_data, version) VALUES (?, ?, 1)
+        ON CONFLICT (guild_id) DO UPDATE SET config_data = excluded.config_data, version = guild_configs.version + 1
+        RETURNING version
+    ''', (guild_id, json.dumps(config))).fetchone()['version']
+
+@run_in_db_thread
+def update_guild_config(guild_id: int, updates: dict, expected_version: int = None):
+    if not updates:
+        return None
+    with conn:
+        version = _write_guild_config(guild_id, lambda config: config.update(updates), expected_version)
+    if version is not None:
+        config_notifier.notify(guild_id, version)
+    return version
+
+def _set_path(config: dict, path: list, value):
+    for key in path[:-1]:
+        child = config.get(key)
+        if not isinstance(child, dict):
+            child = config[key] = {}
+        config = child
+    config[path[-1]] = value
+
+@run_in_db_thread
+def set_guild_config_path(guild_id: int, path, value, expected_version: int = None):
+    path = [str(key) for key in path]
+    if not path:
+        return None
+    with conn:
+        version = _write_guild_config(guild_id, lambda config: _set_path(config, path, value), expected_version)
+    if version is not None:
+        config_notifier.notify(guild_id, version)
+    return version
+
+@run_in_db_thread
+def update_guild_configs(updates_by_guild: dict):
+    versions = {}
+    with conn:
+        for guild_id, updates in updates_by_guild.items():
+            if updates:
+                versions[guild_id] = _write_guild_config(guild_id, lambda config: config.update(updates))
+    for guild_id, version in versions.items():
+        config_notifier.notify(guild_id, version)
+    return versions
+
+@run_in_db_thread
+def get_versioned_guild_config(guild_id: int):
+    row = conn.execute("SELECT config_data, version FROM guild_configs WHERE guild_id = ?", (guild_id,)).fetchone()
+    return (json.loads(row['config_data'] or '{}'), row['version']) if row else None
+
+@run_in_db_thread
+def get_guild_config_versions():
+    return {row['guild_id']: row['version'] for row in conn.execute("SELECT guild_id, version FROM guild_configs")}
+
+def start_config_listener(on_change, on_reconnect=None):
+    # chi bot nay ghi vao file sqlite -> bao thang tu update_guild_config
+    config_notifier.start(on_change, on_reconnect)
+
+async def stop_config_listener():
+    await config_notifier.stop()
+
+# DM Outbox Functions
+@run_in_db_thread
+def enqueue_dm(user_id, guild_id, payload: dict):
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO dm_outbox (user_id, guild_id, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, guild_id, json.dumps(payload), _now(), _now())
+        )
+    return cur.lastrowid
+
+@run_in_db_thread
+def claim_due_dms(limit=50, lease_seconds=300):
+    # chi co 1 ket noi tren 1 thread nen khong can khoa row nhu ban postgres
+    with conn:
+        rows = conn.execute(
+            "SELECT id, user_id, guild_id, payload, attempts FROM dm_outbox WHERE next_attempt_at <= ? ORDER BY next_attempt_at, id LIMIT ?",
+            (_now(), limit)
+        ).fetchall()
+        conn.executemany(
+            "UPDATE dm_outbox SET attempts = attempts + 1, next_attempt_at = ? WHERE id = ?",
+            [(_now(lease_seconds), row['id']) for row in rows]
+        )
+    for row in rows:
+        row['payload'] = json.loads(row['payload'])
+        row['attempts'] += 1
+    return rows
+
+@run_in_db_thread
+def delete_dm(dm_id):
+    with conn:
+        conn.execute("DELETE FROM dm_outbox WHERE id = ?", (dm_id,))
+
+@run_in_db_thread
+def reschedule_dm(dm_id, delay_seconds, error=None):
+    with conn:
+        conn.execute("UPDATE dm_outbox SET next_attempt_at = ?, last_error = ? WHERE id = ?", (_now(delay_seconds), error, dm_id))
+
+@run_in_db_thread
+def get_dm_closed_users(max_age_days=7):
+    rows = conn.execute("SELECT user_id FROM dm_closed_users WHERE closed_at > ?", (_now(-max_age_days * 86400),)).fetchall()
+    return [row['user_id'] for row in rows]
+
+@run_in_db_thread
+def set_dm_closed(user_id, closed=True):
+    with conn:
+        if closed:
+            conn.execute(
+                "INSERT INTO dm_closed_users (user_id, closed_at) VALUES (?, ?) ON CONFLICT (user_id) DO UPDATE SET closed_at = excluded.closed_at",
+                (user_id, _now())
+            )
+        else:
+            conn.execute("DELETE FROM dm_closed_users WHERE user_id = ?", (user_id,))
+
+# Transaction Log Functions
+@run_in_db_thread
+def log_transaction(guild_id, user_id, transaction_type, item_name, amount_changed, new_balance):
+    with conn:
+        _insert_transaction(guild_id, user_id, transaction_type, item_name, amount_changed, new_balance)
+
+@run_in_db_thread
+def get_guild_transactions(guild_id, limit=50, offset=0):
+    rows = conn.execute(
+        "SELECT * FROM transactions WHERE guild_id = ? ORDER BY timestamp DESC, transaction_id DESC LIMIT ? OFFSET ?",
+        (guild_id, limit, offset)
+    ).fetchall()
+    return [_transaction_row(row) for row in rows]
+
+@run_in_db_thread
+def get_user_transactions(guild_id, user_id, limit=50, offset=0):
+    rows = conn.execute(
+        "SELECT * FROM transactions WHERE guild_id = ? AND user_id = ? ORDER BY timestamp DESC, transaction_id DESC LIMIT ? OFFSET ?",
+        (guild_id, user_id, limit, offset)
+    ).fetchall()
+    return [_transaction_row(row) for row in rows]
+
+def _empty_page():
+    return [], None
+
+def _transactions_page(where, params, limit, cursor):
+    # timestamp luu dang ISO UTC nen so sanh chuoi dung thu tu thoi gian
+    if cursor is not None:
+        where += " AND (timestamp, transaction_id) < (?, ?)"
+        params = (*params, cursor[0].astimezone(timezone.utc).isoformat(timespec='microseconds'), cursor[1])
+    rows = conn.execute(
+        f"SELECT * FROM transactions WHERE {where} ORDER BY timestamp DESC, transaction_id DESC LIMIT ?", (*params, limit)
+    ).fetchall()
+    rows = [_transaction_row(row) for row in rows]
+    next_cursor = (rows[-1]['timestamp'], rows[-1]['transaction_id']) if rows and len(rows) == limit else None
+    return rows, next_cursor
+
+@run_in_db_thread(on_error=_empty_page)
+def get_guild_transactions_page(guild_id, limit=50, cursor=None):
+    return _transactions_page("guild_id = ?", (guild_id,), limit, cursor)
+
+@run_in_db_thread(on_error=_empty_page)
+def get_user_transactions_page(guild_id, user_id, limit=50, cursor=None):
+    return _transactions_page("guild_id = ? AND user_id = ?", (guild_id, user_id), limit, cursor)
+
+@run_in_db_thread(on_error=0)
+def count_guild_transactions(guild_id, exact=False):
+    return conn.execute("SELECT COUNT(*) AS total FROM transactions WHERE guild_id = ?", (guild_id,)).fetchone()['total']
+
+@run_in_db_thread
+def maintain_transaction_partitions(retention_months: dict, default_retention_months: int, months_ahead: int = 2):
+    # khong co partition: gop gd het han theo retention cua tung guild vao ban tong hop roi xoa
+    current = current_month()
+    default_cutoff = retention_cutoff(default_retention_months, current)
+    guild_cutoffs = {int(gid): retention_cutoff(months, current) for gid, months in retention_months.items()}
+
+    groups = [(cutoff, "guild_id = ?", (gid,)) for gid, cutoff in guild_cutoffs.items()]
+    if guild_cutoffs:
+        placeholders = ', '.join(['?'] * len(guild_cutoffs))
+        groups.append((default_cutoff, f"guild_id NOT IN ({placeholders})", tuple(guild_cutoffs)))
+    else:
+        groups.append((default_cutoff, "1 = 1", ()))
+
+    pruned = 0
+    try:
+        with conn:
+            for cutoff, where, params in groups:
+                if cutoff is None:
+                    continue
+                condition = f"{where} AND timestamp < ?"
+                params = (*params, f"{cutoff}T00:00:00+00:00")
+                conn.execute(f'''
+                    INSERT INTO transaction_daily_summary (guild_id, user_id, day, transaction_type, tx_count, amount_total)
+                    SELECT guild_id, user_id, substr(timestamp, 1, 10), transaction_type, COUNT(*), SUM(amount_changed)
+                    FROM transactions WHERE {condition}
+                    GROUP BY 1, 2, 3, 4
+                    ON CONFLICT (guild_id, user_id, day, transaction_type) DO UPDATE SET
+                        tx_count = tx_count + excluded.tx_count,
+                        amount_total = amount_total + excluded.amount_total
+                ''', params)
+                pruned += conn.execute(f"DELETE FROM transactions WHERE {condition}", params).rowcount
+        return {'dropped': 0, 'pruned_rows': pruned}
+    except sqlite3.Error as e:
+        logging.error(f"Bao tri transactions (sqlite) that bai: {e}")
+        return None
+
+@run_in_db_thread(on_error=list)
+def wipe_guild_data(guild_id):
+    with conn:
+        role_ids = {row['role_id'] for row in conn.execute("SELECT role_id FROM custom_roles WHERE guild_id = ?", (guild_id,))}
+        role_ids |= {row['role_id'] for row in conn.execute("SELECT role_id FROM shop_roles WHERE guild_id = ?", (guild_id,))}
+        for table in ('custom_roles', 'shop_roles', 'users', 'transactions', 'transaction_daily_summary'):
+            conn.execute(f"DELETE FROM {table} WHERE guild_id = ?", (guild_id,))
+    leaderboards.clear_guild(guild_id)
+    logging.info(f"Da xoa toan bo du lieu database cho guild {guild_id}.")
+    return list(role_ids)
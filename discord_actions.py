@@ -0,0 +1,154 @@
+import asyncio
+import logging
+from collections import deque
+import aiohttp
+import discord
+
+class _Action:
+    __slots__ = ('guild_id', 'bucket', 'run', 'description', 'coalesce_key', 'state', 'future')
+
+    def __init__(self, guild_id, bucket, run, description, coalesce_key, state):
+        self.guild_id = guild_id
+        self.bucket = bucket
+        self.run = run
+        self.description = description
+        self.coalesce_key = coalesce_key
+        self.state = state
+        self.future = asyncio.get_running_loop().create_future()
+
+class ActionScheduler:
+    """
+    Hang doi cho cac thao tac ghi len discord (xoa/sap xep role, gan/go role, DM).
+    - Moi bucket (nhom route cua discord, vd: role cua 1 guild, role cua 1 member, DM 1 user)
+      chay tuan tu, so bucket chay song song trong 1 guild bi gioi han boi per_guild_concurrency.
+    - Thao tac trung nhau dang cho duoc gop (vd: nhieu lan sap xep role -> 1 edit_role_positions).
+    - Loi tam thoi (5xx, mat ket noi) duoc thu lai voi backoff; 429 do discord.py tu cho.
+    Moi ham tra ve future: await neu can ket qua / bat loi, bo qua neu chi can "ban va quen".
+    """
+    def __init__(self, per_guild_concurrency: int = 2, max_retries: int = 3, retry_base_delay: float = 1.0):
+        self.per_guild_concurrency = per_guild_concurrency
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self._queues = {} # bucket -> deque[_Action]
+        self._pending = {} # coalesce_key -> _Action chua chay
+        self._guild_slots = {} # guild_id -> Semaphore
+        self._workers = set()
+        self.stats = {'submitted': 0, 'coalesced': 0, 'retried': 0, 'failed': 0}
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def submit(self, guild_id, bucket, run, description: str, coalesce_key=None, state=None, merge=None):
+        """
+        run(state) -> coroutine thuc hien thao tac. Neu coalesce_key trung voi 1 thao tac dang cho,
+        merge(state_cu, state_moi) gop vao thao tac do va tra ve future cua no.
+        """
+        self.stats['submitted'] += 1
+        if coalesce_key is not None:
+            waiting = self._pending.get(coalesce_key)
+            if waiting is not None:
+                if merge is not None:
+                    waiting.state = merge(waiting.state, state)
+                self.stats['coalesced'] += 1
+                return waiting.future
+        action = _Action(guild_id, bucket, run, description, coalesce_key, state)
+        if coalesce_key is not None:
+            self._pending[coalesce_key] = action
+
+        queue = self._queues.get(bucket)
+        if queue is None:
+            # bucket chua co worker -> tao 1 worker rieng, het viec thi tu dung
+            queue = self._queues[bucket] = deque()
+            worker = asyncio.create_task(self._run_bucket(bucket))
+            self._workers.add(worker)
+            worker.add_done_callback(self._workers.discard)
+        queue.append(action)
+        return action.future
+
+    async def _run_bucket(self, bucket):
+        queue = self._queues[bucket]
+        while queue:
+            action = queue[0]
+            slots = self._guild_slots.setdefault(action.guild_id, asyncio.Semaphore(self.per_guild_concurrency))
+            async with slots:
+                queue.popleft()
+                # tu luc nay thao tac moi cung key se thanh 1 thao tac rieng
+                if action.coalesce_key is not None and self._pending.get(action.coalesce_key) is action:
+                    del self._pending[action.coalesce_key]
+                await self._execute(action)
+        del self._queues[bucket]
+
+    @staticmethod
+    def _is_transient(error: Exception) -> bool:
+        if isinstance(error, discord.HTTPException):
+            return error.status >= 500
+        return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError, OSError))
+
+    async def _execute(self, action: _Action):
+        attempt = 0
+        while True:
+            try:
+                result = await action.run(action.state)
+            except Exception as e:
+                if self._is_transient(e) and attempt < self.max_retries:
+                    attempt += 1
+                    self.stats['retried'] += 1
+                    delay = self.retry_base_delay * 2 ** (attempt - 1)
+                    logging.warning(f"{action.description} loi tam thoi ({e}), thu lai lan {attempt} sau {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                self.stats['failed'] += 1
+                logging.error(f"{action.description} that bai: {e}")
+                if not action.future.done():
+                    action.future.set_exception(e)
+                    # khong ai await -> tranh log "exception was never retrieved"
+                    action.future.exception()
+                return
+            if not action.future.done():
+                action.future.set_result(result)
+            return
+
+    async def close(self, timeout: float = 30.0):
+        # cho cac thao tac dang cho chay xong truoc khi dong ket noi discord
+        if not self._workers:
+            return
+        done, pending = await asyncio.wait(set(self._workers), timeout=timeout)
+        if pending:
+            logging.warning(f"Con {len(self)} thao tac discord chua chay khi tat bot, bo qua.")
+            for worker in pending:
+                worker.cancel()
+
+    # Thao tac thuong dung
+    def delete_role(self, role: discord.Role, reason: str = None):
+        # xoa cung 1 role nhieu lan -> 1 request
+        return self.submit(
+            role.guild.id, ('roles', role.guild.id), lambda _: role.delete(reason=reason),
+            f"Xoa role {role.id} tai guild {role.guild.id}", coalesce_key=('delete_role', role.id)
+        )
+
+    def edit_role_positions(self, guild: discord.Guild, positions: dict, reason: str = None):
+        # nhieu lan sap xep dang cho -> gop thanh 1 edit_role_positions, vi tri moi hon de len
+        return self.submit(
+            guild.id, ('roles', guild.id), lambda state: guild.edit_role_positions(positions=state, reason=reason),
+            f"Sap xep {len(positions)} role tai guild {guild.id}", coalesce_key=('role_positions', guild.id),
+            state=dict(positions), merge=lambda old, new: {**old, **new}
+        )
+
+    def add_roles(self, member: discord.Member, *roles: discord.Role, reason: str = None):
+        return self.submit(
+            member.guild.id, ('member_roles', member.guild.id, member.id), lambda _: member.add_roles(*roles, reason=reason),
+            f"Gan {len(roles)} role cho {member.id} tai guild {member.guild.id}"
+        )
+
+    def remove_roles(self, member: discord.Member, *roles: discord.Role, reason: str = None):
+        return self.submit(
+            member.guild.id, ('member_roles', member.guild.id, member.id), lambda _: member.remove_roles(*roles, reason=reason),
+            f"Go {len(roles)} role cua {member.id} tai guild {member.guild.id}"
+        )
+
+    def send_dm(self, user: discord.abc.User, guild_id: int = None, **kwargs):
+        # kwargs giong user.send (content, embed, view...); guild_id de tinh vao gioi han cua guild do
+        return self.submit(
+            guild_id, ('dm', user.id), lambda _: user.send(**kwargs),
+            f"DM cho {user.id}"
+        )
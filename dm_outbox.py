@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+import discord
+from database import database as db
+
+class DMOutbox:
+    """
+    Hang doi DM luu trong db (bien lai, thong bao): send() chi ghi vao dm_outbox roi tra ve ngay,
+    worker gui dan qua bot.actions, loi thi thu lai voi backoff.
+    User chan DM duoc ghi nho closed_ttl_days ngay de khong gui vo ich, caller hien thi thay (vd: ephemeral).
+    DM bi bo (chan DM lan dau, het so lan thu) thi goi fallback cua caller neu co. fallback chi nam trong
+    bo nho: DM con trong hang doi khi bot khoi dong lai se mat fallback.
+    """
+    def __init__(self, bot, batch_size: int = 50, poll_interval: float = 30.0, max_attempts: int = 5,
+                 retry_base_delay: float = 30.0, lease_seconds: int = 300, closed_ttl_days: int = 7):
+        self.bot = bot
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.lease_seconds = lease_seconds
+        self.closed_ttl_days = closed_ttl_days
+        self._closed = {} # user_id -> time.monotonic() luc phat hien chan DM
+        self._fallbacks = {} # dm_id -> coroutine function, goi khi DM khong gui duoc
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def start(self):
+        # DM con trong hang doi tu lan chay truoc cung duoc gui tiep
+        closed = await db.get_dm_closed_users(self.closed_ttl_days)
+        now = time.monotonic()
+        self._closed = {user_id: now for user_id in closed or []}
+        self._wakeup.set()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        # DM chua gui van nam trong db, lan chay sau gui tiep
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def is_closed(self, user_id: int) -> bool:
+        closed_at = self._closed.get(user_id)
+        if closed_at is None:
+            return False
+        if time.monotonic() - closed_at > self.closed_ttl_days * 86400:
+            del self._closed[user_id]
+            return False
+        return True
+
+    async def send(self, user: discord.abc.User, guild_id: int = None, content: str = None, embed: discord.Embed = None,
+                   fallback=None) -> bool:
+        # True: da vao hang doi. False: user chan DM / ghi db loi -> caller tu hien thi noi dung
+        # fallback: coroutine function khong tham so, goi khi DM da vao hang doi nhung bi bo (vd: gui ephemeral)
+        if self.is_closed(user.id):
+            return False
+        payload = {'content': content, 'embed': embed.to_dict() if embed else None}
+        dm_id = await db.enqueue_dm(user.id, guild_id, payload)
+        if dm_id is None:
+            return False
+        if fallback is not None:
+            self._fallbacks[dm_id] = fallback
+        self._wakeup.set()
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.deliver_due()
+            except Exception as e:
+                logging.error(f"Loi khi gui DM trong hang doi: {e}")
+
+    async def deliver_due(self):
+        while True:
+            rows = await db.claim_due_dms(self.batch_size, self.lease_seconds)
+            if not rows:
+                return
+            await asyncio.gather(*(self._deliver(row) for row in rows))
+            if len(rows) < self.batch_size:
+                return
+
+    async def _deliver(self, row):
+        user_id = row['user_id']
+        if self.is_closed(user_id):
+            await self._finish(row, delivered=False)
+            return
+        payload = row['payload']
+        try:
+            user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+            embed = discord.Embed.from_dict(payload['embed']) if payload.get('embed') else None
+            await self.bot.actions.send_dm(user, row['guild_id'], content=payload.get('content'), embed=embed)
+        except discord.Forbidden:
+            logging.warning(f"User {user_id} chan DM, bo DM {row['id']} va tam dung gui cho user nay.")
+            self._closed[user_id] = time.monotonic()
+            await db.set_dm_closed(user_id)
+            await self._finish(row, delivered=False)
+            return
+        except discord.NotFound:
+            await self._finish(row, delivered=False)
+            return
+        except Exception as e:
+            if row['attempts'] >= self.max_attempts:
+                logging.error(f"Bo DM {row['id']} cho user {user_id} sau {row['attempts']} lan that bai: {e}")
+                await self._finish(row, delivered=False)
+            else:
+                await db.reschedule_dm(row['id'], self.retry_base_delay * 2 ** (row['attempts'] - 1), str(e))
+            return
+        await self._finish(row, delivered=True)
+
+    async def _finish(self, row, delivered: bool):
+        await db.delete_dm(row['id'])
+        fallback = self._fallbacks.pop(row['id'], None)
+        if delivered or fallback is None:
+            return
+        try:
+            await fallback()
+        except Exception as e:
+            logging.error(f"Gui thay DM {row['id']} cho user {row['user_id']} that bai: {e}")
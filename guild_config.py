@@ -0,0 +1,146 @@
+import logging
+from collections.abc import Mapping
+import discord
+
+DEFAULT_EMBED_COLOR = '#ff00af'
+# so boost duoc tinh san he so nhan, lon hon thi tinh truc tiep
+BOOST_TABLE_SIZE = 32
+
+def _parse_color(value, guild_id) -> discord.Color:
+    try:
+        return discord.Color(int(str(value).lstrip('#'), 16))
+    except (TypeError, ValueError):
+        logging.warning(f"EMBED_COLOR khong hop le cho guild {guild_id}: {value!r}, dung mau mac dinh.")
+        return discord.Color(int(DEFAULT_EMBED_COLOR.lstrip('#'), 16))
+
+def _parse_float(value, default: float, name: str, guild_id) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        logging.warning(f"{name} khong hop le cho guild {guild_id}: {value!r}, dung {default}.")
+        return default
+
+def _positive_int(value):
+    # so nguyen > 0 (rate, so thang giu gd), con lai -> None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number > 0 else None
+
+def _rate_table(rates: dict, rate_key: str) -> dict:
+    # {"<id>": {rate_key: n}} -> {id: n}, bo rate <= 0 / khong phai so
+    table = {}
+    for key, value in (rates or {}).items():
+        rate = _positive_int((value or {}).get(rate_key))
+        try:
+            if rate is not None:
+                table[int(key)] = rate
+        except (TypeError, ValueError):
+            continue
+    return table
+
+class GuildConfig(Mapping):
+    """
+    Config 1 guild da duoc dich san khi load/reload: mau, bang ty le kiem coin theo id kenh (int),
+    bang he so booster... Van doc duoc nhu dict (get, [], in) cho cac key chua dich.
+    Khong sua tai cho: dung updated() de tao ban moi.
+    """
+    __slots__ = (
+        'guild_id', '_raw', 'embed_color', 'messages', 'footer_messages',
+        'booster_config', 'booster_enabled', 'boost_multipliers', 'base_multiplier', 'per_boost_addition',
+        'min_custom_role_boosts', 'retention_months', '_channel_rates', '_category_rates', '_default_rates', '_rate_cache'
+    )
+
+    def __init__(self, guild_id: int, raw: dict):
+        set_ = object.__setattr__
+        raw = dict(raw or {})
+        set_(self, 'guild_id', int(guild_id))
+        set_(self, '_raw', raw)
+        set_(self, 'embed_color', _parse_color(raw.get('EMBED_COLOR', DEFAULT_EMBED_COLOR), guild_id))
+        set_(self, 'messages', raw.get('MESSAGES') or {})
+        set_(self, 'footer_messages', raw.get('FOOTER_MESSAGES') or {})
+
+        booster_config = raw.get('BOOSTER_MULTIPLIER_CONFIG') or {}
+        base = _parse_float(booster_config.get('BASE_MULTIPLIER', 1.0), 1.0, 'BASE_MULTIPLIER', guild_id)
+        per_boost = _parse_float(booster_config.get('PER_BOOST_ADDITION', 0.0), 0.0, 'PER_BOOST_ADDITION', guild_id)
+        # ban da kiem tra, dua vao tinh coin (booster_params) thay cho gia tri tho tu dashboard
+        set_(self, 'booster_config', {**booster_config, 'BASE_MULTIPLIER': base, 'PER_BOOST_ADDITION': per_boost})
+        set_(self, 'booster_enabled', bool(booster_config.get('ENABLED', False)))
+        set_(self, 'base_multiplier', base)
+        set_(self, 'per_boost_addition', per_boost)
+        # boost_multipliers[n] = he so cho n boost (n >= 1), toi thieu 1.0
+        set_(self, 'boost_multipliers', tuple(
+            1.0 if n == 0 else max(1.0, base + (n - 1) * per_boost) for n in range(BOOST_TABLE_SIZE)
+        ))
+        set_(self, 'min_custom_role_boosts', (raw.get('CUSTOM_ROLE_CONFIG') or {}).get('MIN_BOOST_COUNT'))
+        # None = khong dat (dung mac dinh) hoac khong hop le, xem retention_invalid
+        retention = raw.get('TRANSACTION_RETENTION_MONTHS')
+        set_(self, 'retention_months', _positive_int(retention))
+        if retention is not None and self.retention_months is None:
+            logging.warning(f"TRANSACTION_RETENTION_MONTHS khong hop le cho guild {guild_id}: {retention!r}, can so nguyen >= 1.")
+
+        rates = raw.get('CURRENCY_RATES') or {}
+        channel_rates, category_rates, default_rates = {}, {}, {}
+        for activity_type, rate_key in (('message', 'MESSAGES_PER_COIN'), ('reaction', 'REACTIONS_PER_COIN')):
+            channel_rates[activity_type] = _rate_table(rates.get('channels'), rate_key)
+            category_rates[activity_type] = _rate_table(rates.get('categories'), rate_key)
+            default_rates[activity_type] = _positive_int((rates.get('default') or {}).get(rate_key))
+        set_(self, '_channel_rates', channel_rates)
+        set_(self, '_category_rates', category_rates)
+        set_(self, '_default_rates', default_rates)
+        set_(self, '_rate_cache', {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("GuildConfig khong sua duoc, dung updated()")
+
+    def __getitem__(self, key):
+        return self._raw[key]
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __repr__(self):
+        return f"GuildConfig(guild_id={self.guild_id}, keys={list(self._raw)})"
+
+    def to_dict(self) -> dict:
+        return dict(self._raw)
+
+    def updated(self, updates: dict) -> 'GuildConfig':
+        return GuildConfig(self.guild_id, {**self._raw, **updates})
+
+    @property
+    def retention_invalid(self) -> bool:
+        # co dat TRANSACTION_RETENTION_MONTHS nhung khong phai so nguyen >= 1
+        return self._raw.get('TRANSACTION_RETENTION_MONTHS') is not None and self.retention_months is None
+
+    def activity_rate(self, channel_id: int, category_id, activity_type: str):
+        """
+        Ty le kiem coin: channel > category > default. Ket qua theo (channel, category)
+        duoc nho lai, kenh doi category thi ra key moi.
+        """
+        key = (channel_id, category_id, activity_type)
+        cache = self._rate_cache
+        if key in cache:
+            return cache[key]
+        rate = self._channel_rates[activity_type].get(channel_id)
+        if rate is None and category_id:
+            rate = self._category_rates[activity_type].get(category_id)
+        if rate is None:
+            rate = self._default_rates[activity_type]
+        cache[key] = rate
+        return rate
+
+    def boost_multiplier(self, boost_count: int) -> float:
+        if not self.booster_enabled or boost_count <= 0:
+            return 1.0
+        if boost_count < BOOST_TABLE_SIZE:
+            return self.boost_multipliers[boost_count]
+        return max(1.0, self.base_multiplier + (boost_count - 1) * self.per_boost_addition)
+
+def compile_guild_configs(raw_configs: dict) -> dict:
+    # {"<guild_id>": dict} tu db -> {"<guild_id>": GuildConfig}
+    return {guild_id: GuildConfig(int(guild_id), config) for guild_id, config in (raw_configs or {}).items()}
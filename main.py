@@ -3,11 +3,13 @@ from discord.ext import commands
 import json
 import os
 import logging
-import threading
 import asyncio
-import socketio
 from database import database as db
 from cogs.shop_views import ShopView
+from discord_actions import ActionScheduler
+from dm_outbox import DMOutbox
+from shop_list_cache import ShopListCache
+from guild_config import GuildConfig, compile_guild_configs
 
 # logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(levelname)s:%(name)s: %(message)s')
@@ -32,18 +34,40 @@ class ShopBot(commands.Bot):
     def __init__(self):
         super().__init__(command_prefix="!@#$", intents=intents) 
         self.global_config = global_config
-        self.guild_configs = {} # cache config
+        self.guild_configs = {} # "<guild_id>" -> GuildConfig da dich san
+        self.guild_config_versions = {} # guild_id -> version cua config dang giu
+        self._config_reload_tasks = {} # guild_id -> task reload dang doi (debounce)
         self.persistent_views_added = False
+        # xoa/gan role, DM... di qua hang doi chung thay vi goi thang tung request
+        self.actions = ActionScheduler(
+            per_guild_concurrency=global_config.get('DISCORD_ACTIONS_PER_GUILD', 2),
+            max_retries=global_config.get('DISCORD_ACTION_RETRIES', 3)
+        )
+        # bien lai / thong bao DM gui nen qua bang dm_outbox
+        self.dm_outbox = DMOutbox(
+            self,
+            batch_size=global_config.get('DM_OUTBOX_BATCH_SIZE', 50),
+            poll_interval=global_config.get('DM_OUTBOX_POLL_SECONDS', 30),
+            max_attempts=global_config.get('DM_OUTBOX_MAX_ATTEMPTS', 5),
+            closed_ttl_days=global_config.get('DM_CLOSED_TTL_DAYS', 7)
+        )
+        # danh sach role shop dung san theo guild, dung chung cho moi user
+        self.shop_list_cache = ShopListCache()
         
     async def reload_guild_config(self, guild_id: int):
-        # ham nay an toan de goi tu thread khac
         logging.info(f"Reloading config cho guild {guild_id}...")
         try:
             guild_id_int = int(guild_id)
-            config = db.get_guild_config(guild_id_int)
-            if config:
-                self.guild_configs[str(guild_id_int)] = config
-                logging.info(f"Config cho guild {guild_id_int} da duoc reload.")
+            result = await db.get_versioned_guild_config(guild_id_int)
+            if result:
+                config, version = result
+                # reload cham hon 1 lan reload khac -> khong de ban cu len
+                if version < self.guild_config_versions.get(guild_id_int, 0):
+                    logging.info(f"Bo qua config cu (version {version}) cho guild {guild_id_int}.")
+                    return True
+                self.guild_configs[str(guild_id_int)] = GuildConfig(guild_id_int, config)
+                self.guild_config_versions[guild_id_int] = version
+                logging.info(f"Config cho guild {guild_id_int} da duoc reload (version {version}).")
                 return True
             logging.warning(f"Khong tim thay config cho guild {guild_id_int} de reload.")
             return False
@@ -51,36 +75,45 @@ class ShopBot(commands.Bot):
             logging.error(f"Loi khi reload config cho guild {guild_id}: {e}")
             return False
 
-    def setup_socketio_listener(self):
-        sio = socketio.Client()
+    def _on_config_changed(self, guild_id: int, version: int):
+        # goi tu listener cua db tren event loop, moi lan ghi config (bot / dashboard) 1 lan
+        if version <= self.guild_config_versions.get(guild_id, 0):
+            return
+        # dang cho reload guild nay -> lan reload do se doc ban moi nhat, gop ca loat thay doi
+        if guild_id in self._config_reload_tasks:
+            return
+        self._config_reload_tasks[guild_id] = asyncio.create_task(self._debounced_reload(guild_id))
 
-        @sio.event
-        def connect():
-            logging.info("Da ket noi toi server dashboard qua SocketIO!")
+    async def _debounced_reload(self, guild_id: int):
+        try:
+            await asyncio.sleep(self.global_config.get('CONFIG_RELOAD_DEBOUNCE_SECONDS', 1.0))
+        finally:
+            self._config_reload_tasks.pop(guild_id, None)
+        await self.reload_guild_config(guild_id)
 
-        @sio.event
-        def disconnect():
-            logging.info("Da ngat ket noi voi server dashboard!")
+    def _on_config_listener_reconnect(self):
+        # thay doi trong luc mat ket noi khong co notify -> doi chieu version voi db
+        asyncio.create_task(self._resync_guild_configs())
 
-        @sio.on('config_updated')
-        def on_config_updated(data):
-            guild_id = data.get('guild_id')
-            if guild_id:
-                logging.info(f"Nhan duoc tin hieu reload config cho guild: {guild_id}")
-                asyncio.run_coroutine_threadsafe(self.reload_guild_config(guild_id), self.loop)
-        
-        try:
-            sio.connect('http://127.0.0.1:5001')
-            sio.wait()
-        except socketio.exceptions.ConnectionError as e:
-            logging.error(f"Khong the ket noi den dashboard SocketIO: {e}. Bot van hoat dong nhung se khong tu dong reload config.")
-        except Exception as e:
-            logging.error(f"Loi SocketIO client: {e}")
+    async def _resync_guild_configs(self):
+        versions = await db.get_guild_config_versions()
+        for guild_id, version in (versions or {}).items():
+            self._on_config_changed(guild_id, version)
 
     async def setup_hook(self):
-        # tai config tu db
-        self.guild_configs = db.get_all_guild_configs()
+        # nghe thay doi config truoc, roi moi tai: khong lo thay doi nao trong luc tai
+        db.start_config_listener(self._on_config_changed, self._on_config_listener_reconnect)
+        self.guild_config_versions = await db.get_guild_config_versions() or {}
+        self.guild_configs = compile_guild_configs(await db.get_all_guild_configs())
         logging.info(f"Loaded {len(self.guild_configs)} guild configurations from database.")
+
+        # ghi log gd theo lo
+        db.start_ledger_writer(
+            max_batch=self.global_config.get('LEDGER_BATCH_SIZE', 1000),
+            flush_interval=self.global_config.get('LEDGER_FLUSH_SECONDS', 5),
+            max_queue=self.global_config.get('LEDGER_QUEUE_SIZE', 50000)
+        )
+        await self.dm_outbox.start()
         
         # tai cogs
         cogs_folder = './cogs'
@@ -104,11 +137,16 @@ class ShopBot(commands.Bot):
             self.add_view(ShopView(bot=self))
             self.persistent_views_added = True
             logging.info("Persistent ShopView da them.")
-
-        # khoi chay socketio listener
-        socket_thread = threading.Thread(target=self.setup_socketio_listener, daemon=True)
-        socket_thread.start()
     
+    async def close(self):
+        # chay not thao tac discord dang cho khi con ket noi, DM chua gui de lai trong db
+        await db.stop_config_listener()
+        await self.dm_outbox.close()
+        await self.actions.close()
+        # cogs flush buffer khi unload trong super().close(), sau do moi drain ledger
+        await super().close()
+        await db.close_ledger_writer()
+
     async def on_ready(self):
         logging.info(f'Logged in as {self.user} (ID: {self.user.id})')
         logging.info('------')
@@ -146,12 +184,23 @@ class ShopBot(commands.Bot):
 # chay bot
 if __name__ == "__main__":
     db_url = global_config.get('DATABASE_URL')
-    if not db_url:
+    # postgres (mac dinh) | sqlite (DATABASE_URL la duong dan file) | memory (khong luu lai)
+    db_backend = global_config.get('DATABASE_BACKEND', 'postgres')
+    if db_backend == 'postgres' and not db_url:
         logging.error("DATABASE_URL khong co trong config.json.")
     else:
-        db.init_db(db_url)
+        db.init_db(
+            db_url,
+            backend_name=db_backend,
+            user_cache_size=global_config.get('USER_CACHE_SIZE', 10000),
+            user_cache_ttl=global_config.get('USER_CACHE_TTL_SECONDS', 30),
+            pool_acquire_timeout=global_config.get('DB_POOL_ACQUIRE_TIMEOUT_SECONDS', 10),
+            statement_timeout_ms=global_config.get('DB_STATEMENT_TIMEOUT_MS', 30000)
+        )
         bot = ShopBot()
         try:
             bot.run(global_config.get('BOT_TOKEN'))
         except discord.LoginFailure:
-            logging.error("Token bot khong hop le. Kiem tra config.json.")
\ No newline at end of file
+            logging.error("Token bot khong hop le. Kiem tra config.json.")
+        finally:
+            db.close_db()
\ No newline at end of file
@@ -0,0 +1,31 @@
+class ShopListCache:
+    """
+    Phan hien thi danh sach shop da dung san theo guild (option cua select, embed tung trang),
+    dung chung cho moi user mo danh sach. Khoa: version catalog + GuildConfig dang dung,
+    1 trong 2 doi thi guild do dung lai tu dau; creator vao/roi server thi goi invalidate(guild_id).
+    Chi thay ban da cache bang catalog co version >= version dang cache.
+    Embed / SelectOption tra ve la ban dung chung, caller khong duoc sua.
+    """
+    def __init__(self):
+        self._entries = {} # guild_id -> (version catalog, GuildConfig, {khoa: gia tri})
+        self.stats = {'hits': 0, 'builds': 0}
+
+    def get_or_build(self, catalog, guild_config, key, build):
+        cached = self._entries.get(catalog.guild_id)
+        # so config bang `is`: moi lan reload la 1 GuildConfig moi
+        if cached is None or cached[0] != catalog.version or cached[1] is not guild_config:
+            # view giu catalog cu hon (hoac ban khong luu, version 0) chi dung rieng, khong de len ban moi
+            if not catalog.version or (cached is not None and catalog.version < cached[0]):
+                self.stats['builds'] += 1
+                return build()
+            cached = self._entries[catalog.guild_id] = (catalog.version, guild_config, {})
+        entries = cached[2]
+        if key in entries:
+            self.stats['hits'] += 1
+            return entries[key]
+        self.stats['builds'] += 1
+        value = entries[key] = build()
+        return value
+
+    def invalidate(self, guild_id: int):
+        self._entries.pop(guild_id, None)
@@ -0,0 +1,9 @@
+import pytest
+from database import database as db
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request):
+    # backend khong can postgres, moi test 1 database moi
+    db.init_db(None, backend_name=request.param)
+    yield request.param
+    db.close_db()
@@ -0,0 +1,44 @@
+import asyncio
+from database import database as db
+from database.activity import activity_row, compute_activity, earn_ledger_entries
+
+NO_BOOST = {'ENABLED': False}
+BOOST = {'ENABLED': True, 'BASE_MULTIPLIER': 2.0, 'PER_BOOST_ADDITION': 0.5}
+
+def test_compute_activity_awards_per_threshold_and_keeps_remainder():
+    user = {'message_count': 2, 'reaction_count': 4}
+    row = (10, 1, 5, 3, 'general', 0, 5, None, False, 1.0, 0.0)
+    result = compute_activity(user, row)
+    assert (result['coins_earned'], result['message_count'], result['reaction_count']) == (2, 1, 4)
+    assert list(earn_ledger_entries(result)) == [('earn_message', 'general', 2)]
+
+def test_compute_activity_applies_booster_multiplier():
+    # fake_boosts uu tien hon real_boosts; 3 boost -> floor(2 + 2 * 0.5) = 3 coin moi lan
+    user = {'message_count': 0, 'reaction_count': 1, 'fake_boosts': 3, 'real_boosts': 1}
+    row = activity_row(10, 1, 'reaction', 2, 'memes', BOOST)
+    result = compute_activity(user, row)
+    assert (result['react_coins'], result['reaction_count']) == (3, 0)
+
+def test_below_threshold_earns_nothing():
+    result = compute_activity({}, activity_row(10, 1, 'message', 3, 'general', NO_BOOST))
+    assert result['coins_earned'] == 0 and result['message_count'] == 1
+    assert list(earn_ledger_entries(result)) == []
+
+def test_earn_activity_writes_balance_and_ledger(backend):
+    async def main():
+        results = [await db.earn_activity(10, 1, 'message', 2, 'general', NO_BOOST) for _ in range(5)]
+        rows, _ = await db.get_user_transactions_page(1, 10)
+        return results, rows
+
+    results, rows = asyncio.run(main())
+    assert [result['coins_earned'] for result in results] == [0, 1, 0, 1, 0]
+    assert (results[-1]['balance'], results[-1]['message_count']) == (2, 1)
+    assert [(row['transaction_type'], row['amount_changed']) for row in rows] == [('earn_message', 1), ('earn_message', 1)]
+
+def test_concurrent_first_events_for_new_user_keep_every_hit(backend):
+    async def main():
+        await asyncio.gather(*(db.earn_activity(10, 1, 'message', 3, 'general', NO_BOOST) for _ in range(10)))
+        return await db.get_or_create_user(10, 1)
+
+    user = asyncio.run(main())
+    assert (user['balance'], user['message_count']) == (3, 1)
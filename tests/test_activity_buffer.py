@@ -0,0 +1,72 @@
+import asyncio
+from database import database as db
+from database.activity_buffer import ActivityBuffer
+
+BOOSTER = {'ENABLED': False}
+
+class _FlakyBackend:
+    # lan ghi dau that bai, cac lan sau ghi lai cac row nhan duoc
+    def __init__(self, failures=1, during_failure=None):
+        self.failures = failures
+        self.during_failure = during_failure
+        self.batches = []
+
+    async def apply_activity_batch(self, rows):
+        if self.failures:
+            self.failures -= 1
+            if self.during_failure:
+                self.during_failure()
+            return False
+        self.batches.append(rows)
+        return True
+
+def test_flush_groups_hits_per_user(monkeypatch):
+    backend = _FlakyBackend(failures=0)
+    monkeypatch.setattr(db, 'backend', backend)
+    buffer = ActivityBuffer()
+    for _ in range(3):
+        buffer.add(1, 10, 'message', 5, 'general', BOOSTER)
+    buffer.add(1, 10, 'reaction', 7, 'memes', BOOSTER)
+    buffer.add(1, 11, 'message', 5, 'general', BOOSTER)
+    asyncio.run(buffer.flush())
+
+    rows = sorted(backend.batches[0])
+    assert rows == [
+        (10, 1, 3, 5, 'general', 1, 7, 'memes', False, 1.0, 0.0),
+        (11, 1, 1, 5, 'general', 0, 1, None, False, 1.0, 0.0),
+    ]
+    assert len(buffer) == 0
+
+def test_failed_flush_merges_back_with_newer_hits(monkeypatch):
+    buffer = ActivityBuffer()
+    # hoat dong moi den trong luc lo dang ghi (va that bai)
+    backend = _FlakyBackend(failures=1, during_failure=lambda: buffer.add(1, 10, 'message', 4, 'new-channel', BOOSTER))
+    monkeypatch.setattr(db, 'backend', backend)
+    buffer.add(1, 10, 'message', 5, 'old-channel', BOOSTER)
+    buffer.add(1, 10, 'message', 5, 'old-channel', BOOSTER)
+    buffer.add(1, 11, 'reaction', 6, 'memes', BOOSTER)
+
+    async def main():
+        await buffer.flush()
+        assert len(buffer) == 2
+        await buffer.flush()
+
+    asyncio.run(main())
+    # cong don so luot, giu nguong/ten kenh moi hon
+    assert sorted(backend.batches[0]) == [
+        (10, 1, 3, 4, 'new-channel', 0, 1, None, False, 1.0, 0.0),
+        (11, 1, 0, 1, None, 1, 6, 'memes', False, 1.0, 0.0),
+    ]
+    assert len(buffer) == 0
+
+def test_flush_writes_coins_through_backend(backend):
+    buffer = ActivityBuffer()
+    for _ in range(7):
+        buffer.add(1, 10, 'message', 3, 'general', BOOSTER)
+
+    async def main():
+        await buffer.flush()
+        return await db.get_or_create_user(10, 1)
+
+    user = asyncio.run(main())
+    assert (user['balance'], user['message_count']) == (2, 1)
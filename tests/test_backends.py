@@ -0,0 +1,53 @@
+"""
+Hop dong chung cua cac backend khong can postgres (memory, sqlite): cung ket qua, cung cach bao loi.
+"""
+import asyncio
+import sqlite3
+import pytest
+from database import database as db
+from database import sqlite as sqlite_backend
+
+GUILD = 1
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_top_users_tiebreak_on_user_id(backend):
+    for user_id, amount in ((3, 10), (1, 10), (2, 20)):
+        run(db.credit(user_id, GUILD, amount, 'admin_give', None))
+    assert [row['user_id'] for row in run(db.backend.get_top_users(GUILD, 10))] == [2, 1, 3]
+    assert run(db.backend.get_user_rank(3, GUILD, 1))['rank'] == 3
+
+class _LockedConnection:
+    # moi query deu loi nhu file sqlite dang bi khoa
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, *args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    executemany = execute
+
+def test_sqlite_errors_follow_postgres_contract(monkeypatch):
+    db.init_db(None, backend_name='sqlite')
+    try:
+        monkeypatch.setattr(sqlite_backend, 'conn', _LockedConnection())
+        assert run(db.credit(10, GUILD, 5, 'refund_buy_role', None)) is None
+        assert run(db.set_balance(10, GUILD, 5, 'admin_set', None)) is None
+        assert run(db.get_or_create_user(10, GUILD)) is None
+        assert run(db.backend.get_top_users(GUILD)) is None
+        assert run(db.backend.get_shop_roles(GUILD)) is None
+        assert run(db.update_guild_config(GUILD, {'A': 1})) is None
+        assert run(db.get_guild_transactions_page(GUILD)) == ([], None)
+        assert run(db.count_guild_transactions(GUILD)) == 0
+        assert run(db.backend.wipe_guild_data(GUILD)) == []
+        assert run(db.apply_activity_batch([(10, GUILD, 1, 5, 'msg', 0, 5, 'react', False, 1.0, 0.0)])) is False
+        # None cua try_debit nghia la khong du coin -> loi db phai raise
+        with pytest.raises(db.DatabaseError):
+            run(db.try_debit(10, GUILD, 5, 'buy_role', 'Role'))
+    finally:
+        monkeypatch.undo()
+        db.close_db()
@@ -0,0 +1,64 @@
+import asyncio
+from database import database as db
+from database.leaderboard import leaderboards
+
+GUILD = 1
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_try_debit_refuses_overdraft(backend):
+    assert run(db.credit(10, GUILD, 50, 'admin_give', None)) == 50
+    assert run(db.try_debit(10, GUILD, 80, 'buy_role', 'Role')) is None
+    assert run(db.get_or_create_user(10, GUILD))['balance'] == 50
+    assert run(db.try_debit(10, GUILD, 50, 'buy_role', 'Role')) == 0
+    # user chua co thi khong tru duoc
+    assert run(db.try_debit(11, GUILD, 1, 'buy_role', 'Role')) is None
+
+    rows, _ = run(db.get_user_transactions_page(GUILD, 10))
+    assert [(row['transaction_type'], row['amount_changed'], row['new_balance']) for row in rows] == [
+        ('buy_role', -50, 0), ('admin_give', 50, 50)
+    ]
+
+def test_concurrent_debits_never_overdraw(backend):
+    async def main():
+        await db.credit(10, GUILD, 100, 'admin_give', None)
+        results = await asyncio.gather(*(db.try_debit(10, GUILD, 30, 'buy_role', 'Role') for _ in range(5)))
+        return results, await db.get_or_create_user(10, GUILD)
+
+    results, user = run(main())
+    assert sorted(r for r in results if r is not None) == [10, 40, 70]
+    assert results.count(None) == 2
+    assert user['balance'] == 10
+
+def test_refund_after_failed_grant_restores_balance(backend):
+    # luong mua role: tru truoc, gan role loi thi hoan bang credit
+    run(db.credit(10, GUILD, 60, 'admin_give', None))
+    assert run(db.try_debit(10, GUILD, 60, 'buy_role', 'Role')) == 0
+    assert run(db.credit(10, GUILD, 60, 'refund_buy_role', 'Role')) == 60
+    rows, _ = run(db.get_user_transactions_page(GUILD, 10))
+    assert [row['transaction_type'] for row in rows] == ['refund_buy_role', 'buy_role', 'admin_give']
+    assert sum(row['amount_changed'] for row in rows) == 60
+
+def test_credit_and_set_balance_log_the_difference(backend):
+    assert run(db.credit(10, GUILD, 40, 'refund_buy_role', None)) == 40
+    assert run(db.set_balance(10, GUILD, 15, 'admin_set', None)) == 15
+    # set_balance tao user moi neu chua co
+    assert run(db.set_balance(12, GUILD, 7, 'admin_set', None)) == 7
+    rows, next_cursor = run(db.get_user_transactions_page(GUILD, 10))
+    assert [row['amount_changed'] for row in rows] == [-25, 40]
+    assert next_cursor is None
+    assert run(db.count_guild_transactions(GUILD)) == 3
+
+def test_balance_writes_update_loaded_leaderboard(backend):
+    async def main():
+        await db.credit(10, GUILD, 5, 'admin_give', None)
+        await db.load_leaderboard(GUILD)
+        await db.credit(11, GUILD, 20, 'admin_give', None)
+        await db.try_debit(11, GUILD, 18, 'buy_role', 'Role')
+        try:
+            return await db.get_top_users(GUILD)
+        finally:
+            leaderboards.discard(GUILD)
+
+    assert run(main()) == [{'user_id': 10, 'balance': 5}, {'user_id': 11, 'balance': 2}]
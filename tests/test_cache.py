@@ -0,0 +1,45 @@
+import time
+from database.cache import LRUCache
+
+def test_write_to_other_key_does_not_block_fill():
+    cache = LRUCache()
+    token = cache.write_token()
+    cache.update(('g', 'a'), balance=5)
+    cache.invalidate(('g', 'c'))
+    assert cache.set_if_unchanged(('g', 'b'), {'balance': 1}, token)
+    assert cache.get(('g', 'b')) == {'balance': 1}
+
+def test_write_to_same_key_rejects_fill():
+    cache = LRUCache()
+    token = cache.write_token()
+    cache.update(('g', 'a'), balance=5)
+    assert not cache.set_if_unchanged(('g', 'a'), {'balance': 1}, token)
+    assert cache.get(('g', 'a')) is None
+    # lan doc bat dau sau lan ghi thi duoc luu
+    assert cache.set_if_unchanged(('g', 'a'), {'balance': 5}, cache.write_token())
+
+def test_bulk_invalidate_rejects_fills_in_progress():
+    cache = LRUCache()
+    token = cache.write_token()
+    cache.invalidate_where(lambda key: key[0] == 'other')
+    assert not cache.set_if_unchanged(('g', 'b'), {'balance': 1}, token)
+
+def test_expired_write_record_rejects_older_fill_only():
+    cache = LRUCache(write_window=0.01)
+    old_token = cache.write_token()
+    cache.update(('g', 'a'), balance=5)
+    time.sleep(0.02)
+    new_token = cache.write_token()
+    # lan ghi da het han khoi bang theo doi -> lan nap cu hon khong kiem tra duoc, bi bo
+    assert not cache.set_if_unchanged(('g', 'b'), {'balance': 1}, old_token)
+    assert cache.set_if_unchanged(('g', 'a'), {'balance': 5}, new_token)
+
+def test_get_returns_copy_and_expires():
+    cache = LRUCache(ttl=0.01)
+    cache.set('k', {'balance': 1})
+    value = cache.get('k')
+    value['balance'] = 99
+    assert cache.get('k') == {'balance': 1}
+    time.sleep(0.02)
+    assert cache.get('k') is None
+    assert cache.stats()['expirations'] == 1
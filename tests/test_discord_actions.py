@@ -0,0 +1,102 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+
+discord = pytest.importorskip('discord')
+from discord_actions import ActionScheduler
+
+def http_error(cls, status):
+    return cls(SimpleNamespace(status=status, reason='test'), 'test')
+
+class _Guild:
+    def __init__(self, guild_id=1):
+        self.id = guild_id
+        self.calls = []
+
+    async def edit_role_positions(self, positions, reason=None):
+        self.calls.append(dict(positions))
+        return len(self.calls)
+
+def test_pending_role_position_edits_are_coalesced():
+    async def main():
+        scheduler = ActionScheduler()
+        guild = _Guild()
+        futures = [
+            scheduler.edit_role_positions(guild, {'a': 1, 'b': 2}),
+            scheduler.edit_role_positions(guild, {'b': 3}),
+            scheduler.edit_role_positions(guild, {'c': 4}),
+        ]
+        results = await asyncio.gather(*futures)
+        # lan sap xep sau khi thao tac da chay -> 1 request moi
+        await scheduler.edit_role_positions(guild, {'d': 5})
+        return scheduler, guild, results
+
+    scheduler, guild, results = asyncio.run(main())
+    assert guild.calls == [{'a': 1, 'b': 3, 'c': 4}, {'d': 5}]
+    assert results == [1, 1, 1]
+    assert scheduler.stats['coalesced'] == 2
+
+def test_transient_errors_are_retried():
+    attempts = []
+
+    async def run(_):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise http_error(discord.HTTPException, 503)
+        return 'ok'
+
+    async def main():
+        scheduler = ActionScheduler(retry_base_delay=0)
+        result = await scheduler.submit(1, ('roles', 1), run, "test")
+        return scheduler, result
+
+    scheduler, result = asyncio.run(main())
+    assert result == 'ok' and len(attempts) == 3
+    assert scheduler.stats['retried'] == 2 and scheduler.stats['failed'] == 0
+
+def test_permanent_errors_fail_without_retry():
+    attempts = []
+
+    async def run(_):
+        attempts.append(1)
+        raise http_error(discord.Forbidden, 403)
+
+    async def main():
+        scheduler = ActionScheduler(retry_base_delay=0)
+        with pytest.raises(discord.Forbidden):
+            await scheduler.submit(1, ('roles', 1), run, "test")
+        # het so lan thu cua loi tam thoi cung bao loi cho caller
+        scheduler.max_retries = 1
+        with pytest.raises(discord.HTTPException):
+            await scheduler.submit(1, ('roles', 1), lambda _: _raise(http_error(discord.HTTPException, 502)), "test")
+        return scheduler
+
+    async def _raise(error):
+        raise error
+
+    scheduler = asyncio.run(main())
+    assert len(attempts) == 1
+    assert scheduler.stats['failed'] == 2
+
+def test_buckets_of_one_guild_share_concurrency_limit():
+    running, peak = 0, 0
+
+    async def run(_):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    async def main():
+        scheduler = ActionScheduler(per_guild_concurrency=2)
+        futures = [scheduler.submit(1, ('member_roles', 1, user_id), run, "test") for user_id in range(5)]
+        # guild khac khong bi tinh vao gioi han cua guild 1
+        futures.append(scheduler.submit(2, ('member_roles', 2, 0), run, "test"))
+        await asyncio.gather(*futures)
+        await scheduler.close()
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert peak == 3
+    assert len(scheduler) == 0
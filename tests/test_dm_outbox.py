@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+
+discord = pytest.importorskip('discord')
+from database import database as db
+from dm_outbox import DMOutbox
+
+USER = 42
+GUILD = 1
+
+class _Actions:
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.sent = []
+
+    async def send_dm(self, user, guild_id, content=None, embed=None):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((user.id, guild_id, content))
+
+class _Bot:
+    def __init__(self, actions):
+        self.actions = actions
+
+    def get_user(self, user_id):
+        return SimpleNamespace(id=user_id)
+
+    async def fetch_user(self, user_id):
+        return SimpleNamespace(id=user_id)
+
+def _fallback(calls):
+    async def fallback():
+        calls.append(1)
+    return fallback
+
+def test_delivered_dm_is_deleted_without_fallback(backend):
+    calls = []
+
+    async def main():
+        bot = _Bot(_Actions())
+        outbox = DMOutbox(bot)
+        assert await outbox.send(SimpleNamespace(id=USER), GUILD, content="hi", fallback=_fallback(calls))
+        await outbox.deliver_due()
+        return bot, await db.claim_due_dms()
+
+    bot, remaining = asyncio.run(main())
+    assert bot.actions.sent == [(USER, GUILD, "hi")]
+    assert remaining == [] and calls == []
+
+def test_transient_failures_back_off_then_fall_back(backend, monkeypatch):
+    calls, delays = [], []
+    reschedule = db.backend.reschedule_dm
+
+    async def recording_reschedule(dm_id, delay_seconds, error=None):
+        delays.append(delay_seconds)
+        # hen lai ve qua khu de lan deliver_due sau nhan lai ngay
+        await reschedule(dm_id, -1, error)
+    monkeypatch.setattr(db.backend, 'reschedule_dm', recording_reschedule)
+
+    async def main():
+        bot = _Bot(_Actions([OSError("down")] * 3))
+        outbox = DMOutbox(bot, max_attempts=3, retry_base_delay=10)
+        await outbox.send(SimpleNamespace(id=USER), GUILD, content="hi", fallback=_fallback(calls))
+        for _ in range(3):
+            await outbox.deliver_due()
+        return bot, await db.claim_due_dms()
+
+    bot, remaining = asyncio.run(main())
+    assert delays == [10, 20]
+    assert bot.actions.sent == [] and remaining == []
+    assert calls == [1]
+
+def test_forbidden_marks_user_closed_and_falls_back(backend):
+    calls = []
+    forbidden = discord.Forbidden(SimpleNamespace(status=403, reason='Forbidden'), 'Cannot send messages to this user')
+
+    async def main():
+        bot = _Bot(_Actions([forbidden]))
+        outbox = DMOutbox(bot)
+        await outbox.send(SimpleNamespace(id=USER), GUILD, content="hi", fallback=_fallback(calls))
+        await outbox.deliver_due()
+        # user da chan DM: khong vao hang doi nua, caller tu hien thi
+        queued = await outbox.send(SimpleNamespace(id=USER), GUILD, content="again")
+        return outbox, queued, await db.get_dm_closed_users()
+
+    outbox, queued, closed = asyncio.run(main())
+    assert calls == [1]
+    assert outbox.is_closed(USER) and not queued
+    assert closed == [USER]
@@ -0,0 +1,79 @@
+import pytest
+
+pytest.importorskip('discord')
+from guild_config import BOOST_TABLE_SIZE, GuildConfig
+
+RATES = {
+    'CURRENCY_RATES': {
+        'default': {'MESSAGES_PER_COIN': 10, 'REACTIONS_PER_COIN': 20},
+        'categories': {'100': {'MESSAGES_PER_COIN': 5}},
+        'channels': {'200': {'MESSAGES_PER_COIN': 2, 'REACTIONS_PER_COIN': 0}, '300': {'MESSAGES_PER_COIN': 'abc'}},
+    }
+}
+
+def test_activity_rate_prefers_channel_then_category_then_default():
+    config = GuildConfig(1, RATES)
+    assert config.activity_rate(200, 100, 'message') == 2
+    assert config.activity_rate(999, 100, 'message') == 5
+    assert config.activity_rate(999, None, 'message') == 10
+    assert config.activity_rate(999, 100, 'reaction') == 20
+
+def test_activity_rate_skips_invalid_channel_rates():
+    config = GuildConfig(1, RATES)
+    # rate 0 / khong phai so bi bo -> roi xuong category / default
+    assert config.activity_rate(200, 100, 'reaction') == 20
+    assert config.activity_rate(300, 100, 'message') == 5
+
+def test_activity_rate_cache_keys_on_category():
+    config = GuildConfig(1, RATES)
+    assert config.activity_rate(999, 100, 'message') == 5
+    # kenh chuyen sang category khac -> khong dung lai ket qua cu
+    assert config.activity_rate(999, 101, 'message') == 10
+
+def test_activity_rate_without_rates():
+    assert GuildConfig(1, {}).activity_rate(1, 2, 'message') is None
+
+def _booster(enabled=True, base=1.5, per_boost=0.25):
+    return GuildConfig(1, {'BOOSTER_MULTIPLIER_CONFIG': {
+        'ENABLED': enabled, 'BASE_MULTIPLIER': base, 'PER_BOOST_ADDITION': per_boost
+    }})
+
+def test_boost_multiplier():
+    config = _booster()
+    assert config.boost_multiplier(0) == 1.0
+    assert config.boost_multiplier(1) == 1.5
+    assert config.boost_multiplier(3) == 2.0
+    # ngoai bang tinh san van cung cong thuc
+    assert config.boost_multiplier(BOOST_TABLE_SIZE + 1) == 1.5 + BOOST_TABLE_SIZE * 0.25
+
+def test_boost_multiplier_disabled_or_below_one():
+    assert _booster(enabled=False).boost_multiplier(5) == 1.0
+    assert _booster(base=0.5, per_boost=0.0).boost_multiplier(2) == 1.0
+
+def test_config_is_immutable_and_updated_returns_copy():
+    config = GuildConfig(1, {'EMBED_COLOR': 'zzz', 'A': 1})
+    with pytest.raises(AttributeError):
+        config.guild_id = 2
+    newer = config.updated({'A': 2})
+    assert config['A'] == 1 and newer['A'] == 2
+    assert newer.guild_id == 1
+    assert config.embed_color.value == 0xff00af
+
+def test_malformed_multipliers_fall_back_to_defaults():
+    config = _booster(base='abc', per_boost=None)
+    assert (config.base_multiplier, config.per_boost_addition) == (1.0, 0.0)
+    assert config.booster_config['BASE_MULTIPLIER'] == 1.0
+    assert config.boost_multiplier(3) == 1.0
+
+def test_default_rate_is_validated_like_channel_rates():
+    config = GuildConfig(1, {'CURRENCY_RATES': {'default': {'MESSAGES_PER_COIN': '10', 'REACTIONS_PER_COIN': -1}}})
+    assert config.activity_rate(1, None, 'message') == 10
+    assert config.activity_rate(1, None, 'reaction') is None
+
+def test_retention_months_must_be_positive_int():
+    assert GuildConfig(1, {}).retention_months is None
+    assert not GuildConfig(1, {}).retention_invalid
+    assert GuildConfig(1, {'TRANSACTION_RETENTION_MONTHS': '6'}).retention_months == 6
+    for bad in (0, -3, 'abc', [6]):
+        config = GuildConfig(1, {'TRANSACTION_RETENTION_MONTHS': bad})
+        assert config.retention_months is None and config.retention_invalid
@@ -0,0 +1,37 @@
+"""
+Ghi config guild co version (expected_version) tren cac backend khong can postgres.
+"""
+import asyncio
+from database import database as db
+
+GUILD = 1
+OTHER_GUILD = 2
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_update_guild_config_expected_version(backend):
+    first = run(db.update_guild_config(GUILD, {'A': 1}))
+    second = run(db.update_guild_config(GUILD, {'A': 2}, expected_version=first))
+    assert second == first + 1
+    # version cu -> tu choi, khong ghi
+    assert run(db.update_guild_config(GUILD, {'A': 3}, expected_version=first)) is None
+    assert run(db.get_versioned_guild_config(GUILD)) == ({'A': 2}, second)
+
+def test_set_guild_config_path_expected_version(backend):
+    version = run(db.set_guild_config_path(GUILD, ['CURRENCY_RATES', 'default', 'MESSAGES_PER_COIN'], 10))
+    assert run(db.set_guild_config_path(GUILD, ['EMBED_COLOR'], '#000000', expected_version=version + 1)) is None
+    newer = run(db.set_guild_config_path(GUILD, ['EMBED_COLOR'], '#000000', expected_version=version))
+    config, current = run(db.get_versioned_guild_config(GUILD))
+    assert current == newer
+    assert config == {'CURRENCY_RATES': {'default': {'MESSAGES_PER_COIN': 10}}, 'EMBED_COLOR': '#000000'}
+
+def test_update_guild_configs_bumps_each_guild_once(backend):
+    base = run(db.update_guild_config(GUILD, {'A': 1, 'B': 1}))
+    versions = run(db.update_guild_configs({GUILD: {'B': 2}, OTHER_GUILD: {'A': 5}, 3: {}}))
+    # guild khong co thay doi thi khong ghi, khong tang version
+    assert versions == {GUILD: base + 1, OTHER_GUILD: 1}
+    assert run(db.get_versioned_guild_config(GUILD)) == ({'A': 1, 'B': 2}, base + 1)
+    assert run(db.get_versioned_guild_config(OTHER_GUILD)) == ({'A': 5}, 1)
+    assert run(db.get_versioned_guild_config(3)) is None
+    assert run(db.get_guild_config_versions()) == {GUILD: base + 1, OTHER_GUILD: 1}
@@ -0,0 +1,96 @@
+import random
+import pytest
+from database.leaderboard import Leaderboards, RankedSkipList, rank_window
+
+def test_skip_list_keeps_sorted_order_and_ranks():
+    rng = random.Random(1)
+    skip_list = RankedSkipList()
+    keys = rng.sample(range(10000), 500)
+    for key in keys:
+        skip_list.insert(key)
+    expected = sorted(keys)
+    assert len(skip_list) == 500
+    assert skip_list.slice(0, 500) == expected
+    for position in (0, 1, 250, 499):
+        assert skip_list.rank(expected[position]) == position
+        assert skip_list.slice(position, 3) == expected[position:position + 3]
+
+def test_skip_list_remove_updates_ranks():
+    skip_list = RankedSkipList()
+    for key in range(100):
+        skip_list.insert(key)
+    for key in range(0, 100, 2):
+        skip_list.remove(key)
+    assert len(skip_list) == 50
+    assert skip_list.slice(0, 100) == list(range(1, 100, 2))
+    assert skip_list.rank(51) == 25
+    with pytest.raises(KeyError):
+        skip_list.remove(50)
+
+def test_skip_list_slice_out_of_range():
+    skip_list = RankedSkipList()
+    skip_list.insert(1)
+    assert skip_list.slice(1, 5) == []
+    assert skip_list.slice(-1, 5) == []
+    assert skip_list.slice(0, 0) == []
+
+def _loaded(rows, guild_id=1):
+    boards = Leaderboards()
+    boards.begin_load(guild_id)
+    boards.load(guild_id, rows)
+    return boards
+
+def test_top_orders_by_balance_then_user_id():
+    boards = _loaded([
+        {'user_id': 3, 'balance': 10}, {'user_id': 1, 'balance': 10},
+        {'user_id': 2, 'balance': 50}, {'user_id': 4, 'balance': None},
+    ])
+    assert boards.top(1, 10) == [
+        {'user_id': 2, 'balance': 50}, {'user_id': 1, 'balance': 10},
+        {'user_id': 3, 'balance': 10}, {'user_id': 4, 'balance': 0},
+    ]
+    assert boards.top(1, 2) == [{'user_id': 2, 'balance': 50}, {'user_id': 1, 'balance': 10}]
+
+def test_update_moves_user():
+    boards = _loaded([{'user_id': uid, 'balance': uid * 10} for uid in range(1, 6)])
+    boards.update(1, 1, 100)
+    assert [row['user_id'] for row in boards.top(1, 5)] == [1, 5, 4, 3, 2]
+
+def test_update_skips_older_version():
+    boards = _loaded([{'user_id': 1, 'balance': 10, 'balance_version': 3}, {'user_id': 2, 'balance': 20, 'balance_version': 0}])
+    boards.update(1, 1, 50, version=5)
+    # cap nhat cua version 4 commit truoc nhung den sau -> bo qua
+    boards.update(1, 1, 30, version=4)
+    assert boards.top(1, 2) == [{'user_id': 1, 'balance': 50}, {'user_id': 2, 'balance': 20}]
+    boards.update(1, 2, 60, version=1)
+    assert boards.top(1, 1) == [{'user_id': 2, 'balance': 60}]
+
+def test_around_returns_rank_and_neighbours():
+    boards = _loaded([{'user_id': uid, 'balance': uid * 10} for uid in range(1, 11)])
+    result = boards.around(1, 5, radius=2)
+    assert result['rank'] == 6
+    assert result['total'] == 10
+    assert [(row['rank'], row['user_id']) for row in result['neighbours']] == [(4, 7), (5, 6), (6, 5), (7, 4), (8, 3)]
+
+    top = boards.around(1, 10, radius=2)
+    assert top['rank'] == 1
+    assert [row['user_id'] for row in top['neighbours']] == [10, 9, 8]
+
+def test_around_and_top_need_loaded_guild():
+    boards = Leaderboards()
+    assert boards.top(1) is None
+    boards.begin_load(1)
+    boards.update(1, 7, 70)
+    assert boards.around(1, 7) is None
+    # so du ghi trong luc nap khong bi ban doc db cu de len
+    boards.load(1, [{'user_id': 7, 'balance': 5}])
+    assert boards.top(1) == [{'user_id': 7, 'balance': 70}]
+    assert boards.around(1, 8) is None
+
+def test_rank_window_matches_around():
+    boards = _loaded([{'user_id': uid, 'balance': uid * 10} for uid in range(1, 11)])
+    rows = [
+        {'user_id': uid, 'balance': uid * 10, 'position': 5, 'total': 10} for uid in (7, 6, 5, 4, 3)
+    ]
+    assert rank_window(rows, 5) == boards.around(1, 5, radius=2)
+    assert rank_window(rows, 42) is None
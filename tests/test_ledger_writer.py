@@ -0,0 +1,77 @@
+import asyncio
+import csv
+from database.ledger_writer import LedgerWriter
+
+def rows(n, start=0):
+    return [(1, user_id, 'earn_message', None, 1, user_id) for user_id in range(start, start + n)]
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+def test_batches_rows_and_flushes_on_close():
+    batches = []
+
+    async def write_batch(batch):
+        batches.append(list(batch))
+        return True
+
+    async def main():
+        writer = LedgerWriter(write_batch, max_batch=3, flush_interval=60)
+        writer.start()
+        for row in rows(7):
+            await writer.put(row)
+        await writer.close()
+        return writer
+
+    writer = asyncio.run(main())
+    assert sum(len(batch) for batch in batches) == 7
+    assert all(len(batch) <= 3 for batch in batches)
+    assert writer.rows_written == 7 and writer.rows_dropped == 0
+
+def test_raising_write_counts_as_failed_attempt(tmp_path):
+    dead_letter = tmp_path / 'dead.csv'
+    calls = []
+
+    async def write_batch(batch):
+        calls.append(len(batch))
+        raise RuntimeError("cannot schedule new futures after shutdown")
+
+    async def main():
+        writer = LedgerWriter(write_batch, max_batch=10, flush_interval=60, max_attempts=1, dead_letter_path=str(dead_letter))
+        writer.start()
+        for row in rows(4):
+            await writer.put(row)
+        await writer.close()
+        return writer
+
+    writer = asyncio.run(main())
+    assert calls == [4]
+    assert writer.rows_dead_lettered == 4
+    assert len(read_csv(dead_letter)) == 4
+
+class _Crash(BaseException):
+    pass
+
+def test_rows_after_task_crash_go_to_dead_letter_without_blocking(tmp_path):
+    dead_letter = tmp_path / 'dead.csv'
+
+    async def write_batch(batch):
+        raise _Crash()
+
+    async def main():
+        writer = LedgerWriter(write_batch, max_batch=1, flush_interval=60, max_queue=1, dead_letter_path=str(dead_letter))
+        writer.start()
+        await writer.put(rows(1)[0])
+        await asyncio.sleep(0.01)
+        assert not writer.running
+        # hang doi chi chua 1 row: neu put con cho task da chet thi se treo
+        for row in rows(3, start=1):
+            await asyncio.wait_for(writer.put(row), timeout=1)
+        await asyncio.wait_for(writer.close(), timeout=1)
+        return writer
+
+    writer = asyncio.run(main())
+    # ca lo dang ghi luc task chet cung khong mat
+    assert writer.rows_dead_lettered == 4
+    assert [line[1] for line in read_csv(dead_letter)] == ['0', '1', '2', '3']
@@ -0,0 +1,110 @@
+import time
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+from psycopg2 import extensions
+from database.pool import ConnectionPool, PoolTimeoutError
+
+class _Info:
+    transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+class _Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.conn.pings += 1
+        if self.conn.dead:
+            self.conn.closed = 2
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+class _FakeConnection:
+    # ket noi gia: dead = server da cat nhung client chua biet (closed van la 0)
+    def __init__(self):
+        self.closed = 0
+        self.dead = False
+        self.pings = 0
+        self.info = _Info()
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    opened = []
+
+    def connect(self):
+        conn = _FakeConnection()
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(ConnectionPool, '_connect', connect)
+
+    def make(**options):
+        return ConnectionPool('postgresql://test', **options), opened
+    return make
+
+def test_getconn_times_out_when_pool_is_full(make_pool):
+    pool, _ = make_pool(minconn=0, maxconn=1, acquire_timeout=0.05)
+    pool.getconn()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn()
+    assert time.monotonic() - started >= 0.05
+    assert pool.stats()['timeouts'] == 1
+
+def test_broken_connection_is_discarded_on_return(make_pool):
+    pool, opened = make_pool(minconn=0, maxconn=2)
+    conn = pool.getconn()
+    conn.closed = 2
+    pool.putconn(conn)
+    stats = pool.stats()
+    assert (stats['discarded'], stats['idle'], stats['in_use']) == (1, 0, 0)
+    assert pool.getconn() is not conn
+    assert len(opened) == 2
+
+def test_recent_idle_connection_is_not_pinged(make_pool):
+    pool, _ = make_pool(minconn=1, maxconn=2)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert conn.pings == 0
+
+def test_idle_connections_are_checked_after_a_failure(make_pool):
+    pool, opened = make_pool(minconn=0, maxconn=3)
+    first, second = pool.getconn(), pool.getconn()
+    pool.putconn(first)
+    pool.putconn(second)
+    # server restart: ca 2 ket noi idle deu chet
+    first.dead = second.dead = True
+
+    conn = pool.getconn()
+    assert conn is second and conn.pings == 0
+    conn.closed = 2 # caller gap loi khi dung
+    pool.putconn(conn)
+
+    # first da idle tu truoc lan loi -> ping, hong -> bo va mo ket noi moi
+    replacement = pool.getconn()
+    assert first.pings == 1 and first.closed
+    assert replacement is opened[-1] and replacement not in (first, second)
+    assert pool.stats()['discarded'] == 2
+
+def test_idle_connection_is_pinged_after_health_check_window(make_pool):
+    pool, _ = make_pool(minconn=1, maxconn=1, health_check_after=0.01)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    time.sleep(0.02)
+    assert pool.getconn() is conn
+    assert conn.pings == 1
@@ -0,0 +1,85 @@
+import asyncio
+from database import database as db
+from database.shop_catalog import ShopCatalog, ShopCatalogs
+from shop_list_cache import ShopListCache
+
+ROWS = [
+    {'role_id': 30, 'price': 100, 'creator_id': None},
+    {'role_id': 10, 'price': 500, 'creator_id': 7},
+    {'role_id': 20, 'price': 100, 'creator_id': None},
+]
+
+def test_catalog_orders_by_price_then_role_id():
+    catalog = ShopCatalog(1, ROWS, version=1)
+    assert [row['role_id'] for row in catalog] == [20, 30, 10]
+    assert catalog.at(1)['role_id'] == 20
+    assert catalog.at(0) is None and catalog.at(4) is None
+    assert catalog.position_of(10) == 3
+    assert catalog.creator_ids == {7}
+    assert catalog.missing_roles([10, 30]) == [20]
+
+def test_store_keeps_catalog_for_current_generation():
+    catalogs = ShopCatalogs()
+    generation = catalogs.begin_load(1)
+    catalog = catalogs.store(1, ROWS, generation)
+    assert catalog.version > 0
+    assert catalogs.get(1) is catalog
+    assert catalogs.stats['hits'] == 1
+
+def test_store_after_invalidate_is_not_kept():
+    catalogs = ShopCatalogs()
+    generation = catalogs.begin_load(1)
+    catalogs.invalidate(1)
+    stale = catalogs.store(1, ROWS, generation)
+    assert stale.version == 0
+    assert catalogs.peek(1) is None
+    # cac lan nap stale khong tao version moi
+    assert catalogs.store(1, ROWS, generation).version == 0
+    fresh = catalogs.store(1, ROWS, catalogs.begin_load(1))
+    assert fresh.version > 0 and catalogs.peek(1) is fresh
+
+class _Backend:
+    # shop doi (invalidate) trong luc doc db o lan goi dau tien
+    def __init__(self, invalidate_times):
+        self.calls = 0
+        self.invalidate_times = invalidate_times
+
+    async def get_shop_roles(self, guild_id):
+        self.calls += 1
+        if self.calls <= self.invalidate_times:
+            db.shop_catalogs.invalidate(guild_id)
+        return ROWS
+
+def _load(backend, monkeypatch, guild_id):
+    monkeypatch.setattr(db, 'backend', backend)
+    return asyncio.run(db.get_shop_catalog(guild_id))
+
+def test_get_shop_catalog_retries_once_after_concurrent_change(monkeypatch):
+    backend = _Backend(invalidate_times=1)
+    catalog = _load(backend, monkeypatch, 901)
+    assert backend.calls == 2
+    assert catalog.version > 0 and db.peek_shop_catalog(901) is catalog
+
+def test_get_shop_catalog_returns_unstored_catalog_after_retry(monkeypatch):
+    backend = _Backend(invalidate_times=2)
+    catalog = _load(backend, monkeypatch, 902)
+    assert backend.calls == 2
+    assert catalog.version == 0 and len(catalog) == 3
+    assert db.peek_shop_catalog(902) is None
+
+def test_list_cache_hits_for_same_catalog_and_config():
+    cache, config = ShopListCache(), object()
+    catalog = ShopCatalog(1, ROWS, version=5)
+    assert cache.get_or_build(catalog, config, 'k', lambda: 'a') == 'a'
+    assert cache.get_or_build(catalog, config, 'k', lambda: 'b') == 'a'
+    assert cache.stats == {'hits': 1, 'builds': 1}
+    # config moi -> dung lai
+    assert cache.get_or_build(catalog, object(), 'k', lambda: 'c') == 'c'
+
+def test_list_cache_older_or_unstored_catalog_does_not_replace_entry():
+    cache, config = ShopListCache(), object()
+    newer = ShopCatalog(1, ROWS, version=5)
+    cache.get_or_build(newer, config, 'k', lambda: 'new')
+    assert cache.get_or_build(ShopCatalog(1, ROWS, version=3), config, 'k', lambda: 'old') == 'old'
+    assert cache.get_or_build(ShopCatalog(1, ROWS), config, 'k', lambda: 'unstored') == 'unstored'
+    assert cache.get_or_build(newer, config, 'k', lambda: 'rebuilt') == 'new'